@@ -0,0 +1,9 @@
+from pytiny.asgi import create_app
+
+app = create_app()
+
+if __name__ == "__main__":
+    import uvicorn
+    from pytiny.config import Config
+    config = Config.load()
+    uvicorn.run(app, host=config.HOST, port=config.PORT)
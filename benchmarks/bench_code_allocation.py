@@ -0,0 +1,70 @@
+"""
+Measure create throughput per code-allocation strategy as the table fills.
+
+    python benchmarks/bench_code_allocation.py --rows 1000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from pytiny import PyTiny
+
+
+def legacy_create(shortener, long_url):
+    """The original SELECT-then-INSERT create path, for comparison."""
+    conn = shortener.storage._pool.get()
+    while True:
+        code = ''.join(random.choices(shortener.chars, k=6))
+        if not conn.execute("SELECT 1 FROM urls WHERE short_code = ?",
+                            (code,)).fetchone():
+            break
+    with conn:
+        conn.execute("""
+            INSERT INTO urls (short_code, long_url, created_at, expires_at)
+            VALUES (?, ?, ?, NULL)
+        """, (code, long_url, int(time.time())))
+    return code
+
+
+def run(strategy, rows, window):
+    with tempfile.TemporaryDirectory() as workdir:
+        shortener = PyTiny(
+            os.path.join(workdir, "bench.db"),
+            code_strategy="random" if strategy == "legacy" else strategy,
+            code_secret="bench" if strategy == "counter" else None,
+        )
+        lengths = {}
+        start = window_start = time.perf_counter()
+        for i in range(1, rows + 1):
+            url = f"https://example.com/{i}"
+            if strategy == "legacy":
+                code = legacy_create(shortener, url)
+            else:
+                code = shortener.create_short_url(url)
+            lengths[len(code)] = lengths.get(len(code), 0) + 1
+            if i % window == 0:
+                now = time.perf_counter()
+                print(f"  {strategy:8} rows={i:>9} "
+                      f"creates/s={window / (now - window_start):>8.0f}")
+                window_start = now
+        elapsed = time.perf_counter() - start
+        shortener.close()
+    print(f"{strategy}: {rows / elapsed:.0f} creates/s overall, "
+          f"code lengths {dict(sorted(lengths.items()))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--window", type=int, default=100000)
+    parser.add_argument("--strategies", default="legacy,random,counter")
+    args = parser.parse_args()
+
+    for strategy in args.strategies.split(","):
+        run(strategy, args.rows, args.window)
+
+
+if __name__ == "__main__":
+    main()
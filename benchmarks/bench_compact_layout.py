@@ -0,0 +1,107 @@
+"""
+Compare database size and lookup latency of the default and compact layouts.
+
+Seeds a database with --links links over a mix of URL shapes, converts a
+copy with ``compact()`` and vacuums both, then times ``storage.get()`` on
+uniformly random codes (the lookup behind every cache miss)::
+
+    python benchmarks/bench_compact_layout.py --links 200000
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from pytiny import PyTiny
+from pytiny.compact_storage import compact
+from pytiny.storage import open_storage
+
+WORDS = ("spring sale guide review launch update how to best new release "
+         "pricing team blog story open source python tips").split()
+
+
+def random_url(rng):
+    """Return a URL shaped like the ones people shorten."""
+    kind = rng.random()
+    host = rng.choice(["www.example.com", "news.example.org", "shop.example.net",
+                       "docs.example.io", f"site{rng.randrange(2000)}.example.com"])
+    slug = "-".join(rng.sample(WORDS, 4))
+    if kind < 0.35:
+        return (f"https://{host}/blog/20{rng.randint(15, 24)}/{rng.randint(1, 12):02d}/{slug}"
+                f"?utm_source={rng.choice(['twitter', 'newsletter'])}"
+                f"&utm_medium={rng.choice(['social', 'email'])}&utm_campaign={rng.choice(WORDS)}")
+    if kind < 0.55:
+        return "https://www.youtube.com/watch?v=" + "".join(
+            rng.choices("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_-", k=11))
+    if kind < 0.75:
+        return f"https://{host}/products/{rng.randrange(10 ** 6)}/{slug}"
+    return f"https://{host}/{slug}"
+
+
+def seed(db_path, count, seed_value=1):
+    rng = random.Random(seed_value)
+    shortener = PyTiny(db_path)
+    codes = [code for _, code in shortener.create_short_urls_bulk(
+        random_url(rng) for _ in range(count))]
+    shortener.close()
+    return codes
+
+
+def bytes_in_use(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    (pages,) = conn.execute("PRAGMA page_count").fetchone()
+    (page_size,) = conn.execute("PRAGMA page_size").fetchone()
+    conn.close()
+    return pages * page_size
+
+
+def lookup_latency(db_path, codes, lookups, runs):
+    """Return the median per-lookup time in µs over runs passes."""
+    storage = open_storage(db_path)
+    sample = random.Random(2).choices(codes, k=lookups)
+    for code in sample:
+        storage.get(code)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for code in sample:
+            storage.get(code)
+        timings.append((time.perf_counter() - start) / lookups * 1e6)
+    storage.close()
+    return statistics.median(timings), type(storage).__name__
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--links", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=50000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        default_path = os.path.join(workdir, "default.db")
+        compact_path = os.path.join(workdir, "compact.db")
+        codes = seed(default_path, args.links)
+        shutil.copy(default_path, compact_path)
+        started = time.perf_counter()
+        compact(compact_path, PyTiny(":memory:").chars)
+        print(f"converted {args.links} links in {time.perf_counter() - started:.1f}s")
+
+        sizes = {}
+        for name, path in (("default", default_path), ("compact", compact_path)):
+            sizes[name] = bytes_in_use(path)
+            latency, storage = lookup_latency(path, codes, args.lookups, args.runs)
+            print(f"{name:8} {sizes[name] / 2 ** 20:7.1f} MiB "
+                  f"({sizes[name] / args.links:5.1f} B/link)  "
+                  f"get() {latency:5.2f} µs  [{storage}]")
+        print(f"compact is {sizes['compact'] / sizes['default']:.0%} of the default size")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Measure redirects per second served by ``gunicorn -w 4`` against a seeded DB.
+
+Run it once on a checkout without connection pooling and once with it to
+compare::
+
+    python benchmarks/bench_gunicorn_redirects.py --links 1000 --duration 10
+"""
+import argparse
+import http.client
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from pytiny import PyTiny
+
+
+def seed(db_path, links):
+    shortener = PyTiny(db_path)
+    codes = [shortener.create_short_url(f"https://example.com/{i}")
+             for i in range(links)]
+    if hasattr(shortener, "close"):
+        shortener.close()
+    return codes
+
+
+def wait_for_port(port, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/")
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("gunicorn did not start")
+
+
+def hammer(port, codes, duration, concurrency):
+    counts = [0] * concurrency
+    errors = [0] * concurrency
+    deadline = time.time() + duration
+
+    def worker(slot):
+        rng = random.Random(slot)
+        while time.time() < deadline:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            try:
+                conn.request("GET", "/" + rng.choice(codes))
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status == 302:
+                    counts[slot] += 1
+                else:
+                    errors[slot] += 1
+            except OSError:
+                errors[slot] += 1
+            finally:
+                conn.close()
+
+    threads = [threading.Thread(target=worker, args=(i,))
+               for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(counts), sum(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--links", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        codes = seed(os.path.join(workdir, "pytiny.db"), args.links)
+        server = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-w", str(args.workers),
+             "-b", f"127.0.0.1:{args.port}", "pytiny.web:create_app()"],
+            cwd=workdir,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_for_port(args.port)
+            ok, failed = hammer(args.port, codes, args.duration,
+                                args.concurrency)
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"workers={args.workers} concurrency={args.concurrency} "
+          f"duration={args.duration}s")
+    print(f"redirects: {ok} ({ok / args.duration:.0f}/s), errors: {failed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Measure cold-start time of the CLI and of web worker boot.
+
+Each scenario runs in a fresh interpreter, the median of --runs is
+reported, and with --importtime the slowest imports of each scenario are
+listed from ``python -X importtime``::
+
+    python benchmarks/bench_startup.py --runs 20 --importtime
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from pytiny import PyTiny
+
+SCENARIOS = {
+    "import": "import pytiny",
+    "cli_stats": "import sys; from pytiny.cli import main; "
+                 "sys.argv = ['pytiny', 'stats', sys.argv[1]]; main()",
+    "flask_worker": "from pytiny.web import create_app; create_app()",
+    "asgi_worker": "from pytiny.asgi import create_app; create_app()",
+}
+
+
+def run_once(code, env, args=()):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code, *args], env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def slowest_imports(code, env, args=(), top=10):
+    """Return (cumulative µs, module) for the slowest imports, nested ones indented."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code, *args],
+                            env=env, check=True, capture_output=True, text=True)
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        timings.append((int(cumulative), module.rstrip()))
+    return sorted(timings, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--importtime", action="store_true",
+                        help="Also list the slowest imports of each scenario")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "pytiny.db")
+        shortener = PyTiny(db_path)
+        code = shortener.create_short_url("https://example.com")
+        shortener.close()
+
+        env = dict(os.environ, PYTINY_DB_PATH=db_path, PYTINY_REAPER_INTERVAL="0")
+        baseline = statistics.median(run_once("pass", env) for _ in range(args.runs))
+        print(f"{'interpreter':14} {baseline * 1000:7.1f} ms")
+
+        for name in args.scenarios.split(","):
+            timings = [run_once(SCENARIOS[name], env, (code,)) for _ in range(args.runs)]
+            median = statistics.median(timings)
+            print(f"{name:14} {median * 1000:7.1f} ms "
+                  f"(+{(median - baseline) * 1000:.1f} ms over a bare interpreter)")
+            if args.importtime:
+                for cumulative, module in slowest_imports(SCENARIOS[name], env, (code,)):
+                    print(f"    {cumulative / 1000:7.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
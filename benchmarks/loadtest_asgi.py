@@ -0,0 +1,122 @@
+"""
+Compare redirect latency of the ASGI app (uvicorn) and the Flask app
+(gunicorn) under many concurrent client connections.
+
+    python benchmarks/loadtest_asgi.py --connections 500 --requests 20000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from pytiny import PyTiny
+
+SERVERS = {
+    "flask": ["-m", "gunicorn", "-w", "{workers}", "-b", "127.0.0.1:{port}",
+              "pytiny.web:app"],
+    "asgi": ["-m", "uvicorn", "--workers", "{workers}", "--port", "{port}",
+             "--log-level", "warning", "--factory", "pytiny.asgi:create_app"],
+}
+
+
+def seed(db_path, links):
+    shortener = PyTiny(db_path)
+    codes = [code for _, code in shortener.create_short_urls_bulk(
+        f"https://example.com/{i}" for i in range(links))]
+    shortener.close()
+    return codes
+
+
+async def fetch(port, path):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: bench\r\n"
+                 f"Connection: close\r\n\r\n".encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    await reader.read()
+    writer.close()
+    return int(status_line.split()[1])
+
+
+async def load(port, codes, connections, requests):
+    latencies = []
+    errors = 0
+    remaining = requests
+
+    async def client():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            try:
+                status = await fetch(port, "/" + random.choice(codes))
+                if status != 302:
+                    errors += 1
+            except OSError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(connections)))
+    return latencies, errors, time.perf_counter() - start
+
+
+async def wait_for_port(port, timeout=15.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            await fetch(port, "/")
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def run(name, args, workdir, codes):
+    command = [sys.executable] + [
+        part.format(workers=args.workers, port=args.port)
+        for part in SERVERS[name]
+    ]
+    env = dict(os.environ, PYTINY_DB_PATH=os.path.join(workdir, "pytiny.db"))
+    server = subprocess.Popen(command, cwd=workdir, env=env,
+                              stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    try:
+        asyncio.run(wait_for_port(args.port))
+        latencies, errors, elapsed = asyncio.run(
+            load(args.port, codes, args.connections, args.requests))
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies.sort()
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"{name:6} {len(latencies) / elapsed:8.0f} req/s  "
+          f"p50={quantiles[49] * 1000:7.1f}ms  p99={quantiles[98] * 1000:7.1f}ms  "
+          f"errors={errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--links", type=int, default=10000)
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--servers", default="flask,asgi")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        codes = seed(os.path.join(workdir, "pytiny.db"), args.links)
+        for name in args.servers.split(","):
+            run(name, args, workdir, codes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+PyTiny benchmark suite.
+
+Runs each workload against a freshly seeded database of every requested
+size, each in its own process so peak RSS is attributable, and writes the
+results as JSON for comparison across runs::
+
+    python benchmarks/run.py --sizes 10000,100000 --output results.json
+    python benchmarks/run.py --compare results.json
+
+Workloads:
+    redirect_zipf   get_long_url() on Zipf-distributed codes
+    redirect_flask  GET /<code> through the Flask test client, Zipf codes
+    create          create_short_url() one link at a time
+    create_bulk     create_short_urls_bulk() in batches of 1000
+    stats           get_stats() on uniformly random codes
+    expired_churn   creates of short-lived links mixed with redirects and
+                    batched reaping of expired rows
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue as queue_module
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import accumulate
+
+from pytiny import PyTiny
+
+ZIPF_EXPONENT = 1.1
+
+
+def seed(db_path, size):
+    """Fill a database with size links and return their codes."""
+    shortener = PyTiny(db_path, cache_size=0, click_flush_interval=None)
+    codes = [code for _, code in shortener.create_short_urls_bulk(
+        (f"https://example.com/{i}/some/longer/path?ref=bench" for i in range(size)),
+        batch_size=10000,
+    )]
+    shortener.close()
+    return codes
+
+
+def zipf_sampler(codes, rng):
+    """Return a function drawing codes with Zipf-distributed popularity."""
+    ranked = codes[:]
+    rng.shuffle(ranked)
+    cum_weights = list(accumulate(1.0 / (rank ** ZIPF_EXPONENT)
+                                  for rank in range(1, len(ranked) + 1)))
+    return lambda k: rng.choices(ranked, cum_weights=cum_weights, k=k)
+
+
+def timed(operations):
+    """Run zero-argument callables, returning per-call latencies in seconds."""
+    latencies = []
+    clock = time.perf_counter
+    for operation in operations:
+        start = clock()
+        operation()
+        latencies.append(clock() - start)
+    return latencies
+
+
+def workload_redirect_zipf(db_path, codes, ops, rng):
+    shortener = PyTiny(db_path)
+    sample = zipf_sampler(codes, rng)(ops)
+    latencies = timed(lambda code=code: shortener.get_long_url(code) for code in sample)
+    shortener.close()
+    return latencies
+
+
+def workload_redirect_flask(db_path, codes, ops, rng):
+    os.environ["PYTINY_DB_PATH"] = db_path
+    from pytiny.web import create_app
+    app = create_app()
+    client = app.test_client()
+    sample = zipf_sampler(codes, rng)(ops)
+    latencies = timed(lambda code=code: client.get("/" + code) for code in sample)
+    app.extensions["pytiny"].close()
+    return latencies
+
+
+def workload_create(db_path, codes, ops, rng):
+    shortener = PyTiny(db_path)
+    latencies = timed(
+        lambda i=i: shortener.create_short_url(f"https://example.com/new/{i}")
+        for i in range(ops)
+    )
+    shortener.close()
+    return latencies
+
+
+def workload_create_bulk(db_path, codes, ops, rng):
+    shortener = PyTiny(db_path)
+    batch = 1000
+
+    def create_batch(start):
+        for _ in shortener.create_short_urls_bulk(
+                f"https://example.com/bulk/{i}" for i in range(start, start + batch)):
+            pass
+
+    latencies = timed(lambda start=start: create_batch(start)
+                      for start in range(0, ops, batch))
+    shortener.close()
+    # Report per-row latency so ops/sec is comparable with "create"
+    return [latency / batch for latency in latencies for _ in range(batch)]
+
+
+def workload_stats(db_path, codes, ops, rng):
+    shortener = PyTiny(db_path)
+    sample = [rng.choice(codes) for _ in range(ops)]
+    latencies = timed(lambda code=code: shortener.get_stats(code) for code in sample)
+    shortener.close()
+    return latencies
+
+
+def workload_expired_churn(db_path, codes, ops, rng):
+    shortener = PyTiny(db_path)
+    sample = zipf_sampler(codes, rng)
+    operations = []
+    for i in range(ops):
+        kind = i % 10
+        if kind < 2:
+            # Links that are already expired by the time they are read
+            operations.append(lambda i=i: shortener.create_short_url(
+                f"https://example.com/churn/{i}", expire_hours=-1))
+        elif kind == 9:
+            operations.append(lambda: shortener.delete_expired_batch(100))
+        else:
+            code = sample(1)[0]
+            operations.append(lambda code=code: shortener.get_long_url(code))
+    latencies = timed(operations)
+    shortener.close()
+    return latencies
+
+
+WORKLOADS = {
+    "redirect_zipf": workload_redirect_zipf,
+    "redirect_flask": workload_redirect_flask,
+    "create": workload_create,
+    "create_bulk": workload_create_bulk,
+    "stats": workload_stats,
+    "expired_churn": workload_expired_churn,
+}
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def run_one(name, size, ops, seed_value, queue):
+    """Seed a database, run one workload and report through queue."""
+    rng = random.Random(seed_value)
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        db_path = os.path.join(workdir, "bench.db")
+        codes = seed(db_path, size)
+        rss_after_seed = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        start = time.perf_counter()
+        latencies = WORKLOADS[name](db_path, codes, ops, rng)
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    queue.put({
+        "workload": name,
+        "db_size": size,
+        "ops": len(latencies),
+        "ops_per_sec": len(latencies) / elapsed,
+        "p50_us": percentile(latencies, 0.50) * 1e6,
+        "p95_us": percentile(latencies, 0.95) * 1e6,
+        "p99_us": percentile(latencies, 0.99) * 1e6,
+        # ru_maxrss is reported in kilobytes on Linux
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "seed_rss_kb": rss_after_seed,
+    })
+
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                                capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))
+                                ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": int(time.time()),
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+    }
+
+
+def compare(baseline, results):
+    """Print ops/sec and p99 changes against a previous run."""
+    previous = {(r["workload"], r["db_size"]): r for r in baseline["results"]}
+    for result in results:
+        before = previous.get((result["workload"], result["db_size"]))
+        if not before:
+            continue
+        speedup = result["ops_per_sec"] / before["ops_per_sec"] - 1
+        p99 = result["p99_us"] / before["p99_us"] - 1
+        print(f"{result['workload']:15} {result['db_size']:>10}  "
+              f"ops/s {speedup:+7.1%}  p99 {p99:+7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="PyTiny benchmark suite",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--workloads", default=",".join(WORKLOADS))
+    parser.add_argument("--sizes", default="10000,100000",
+                        help="Comma-separated DB sizes, e.g. 10000,1000000,10000000")
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--compare", help="Previous JSON results to compare against")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for size in (int(value) for value in args.sizes.split(",")):
+        for name in args.workloads.split(","):
+            queue = context.Queue()
+            process = context.Process(target=run_one,
+                                      args=(name, size, args.ops, args.seed, queue))
+            process.start()
+            while True:
+                try:
+                    result = queue.get(timeout=1)
+                    break
+                except queue_module.Empty:
+                    if not process.is_alive():
+                        raise RuntimeError(f"Workload {name} failed at size {size}")
+            process.join()
+            results.append(result)
+            print(f"{name:15} {size:>10}  {result['ops_per_sec']:>10.0f} ops/s  "
+                  f"p50 {result['p50_us']:8.1f}us  p95 {result['p95_us']:8.1f}us  "
+                  f"p99 {result['p99_us']:8.1f}us  rss {result['peak_rss_kb'] / 1024:6.1f}MB",
+                  file=sys.stderr)
+
+    report = {"meta": metadata(), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            compare(json.load(fh), results)
+
+
+if __name__ == "__main__":
+    main()
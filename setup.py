@@ -27,10 +27,14 @@ setup(
         "gunicorn>=20.1.0",
         "python-dotenv>=0.19.0"
     ],
+    extras_require={
+        "asgi": ["uvicorn>=0.20.0"],
+        "parquet": ["pyarrow>=8.0.0"],
+    },
     entry_points={
         "console_scripts": [
             "pytiny=pytiny.cli:main",
-            "pytiny-web=pytiny.web:app.run"
+            "pytiny-web=pytiny.web:main"
         ],
     },
 )
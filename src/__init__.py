@@ -1,7 +1,19 @@
+from .compact_storage import CompactStorage
 from .core import PyTiny
+from .memory_storage import MemoryStorage
+from .storage import SQLiteStorage, ShardedStorage, Storage
 
 __version__ = "0.1.0"
 __author__ = "Akshay Anand"
 __email__ = "me.akanand@gmail.com"
 
-__all__ = ["PyTiny"]
+__all__ = ["PyTiny", "Storage", "SQLiteStorage", "CompactStorage", "ShardedStorage",
+           "MemoryStorage", "RedisStorage"]
+
+
+def __getattr__(name):
+    # The Redis client pulls in socket; only load it when asked for
+    if name == "RedisStorage":
+        from .redis_storage import RedisStorage
+        return RedisStorage
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,193 @@
+import hashlib
+import os
+import random
+import threading
+from typing import Callable, List, Optional
+
+
+class CodeAllocator:
+    """
+    Base class for short-code allocation strategies.
+
+    ``PyTiny`` asks the allocator for a candidate code, tries to insert it
+    and reports back through :meth:`collision` when the insert hit the
+    UNIQUE constraint, so every create is a single write.
+    """
+
+    def __init__(self, chars: str, min_length: int = 6):
+        self.chars = chars
+        self.min_length = min_length
+
+    def next_code(self) -> str:
+        """Return a candidate short code."""
+        raise NotImplementedError
+
+    def next_codes(self, count: int) -> List[str]:
+        """Return count candidate short codes."""
+        return [self.next_code() for _ in range(count)]
+
+    def collision(self, code: str) -> None:
+        """Called when code turned out to be taken already."""
+
+    def encode(self, value: int, length: int) -> str:
+        """Encode value as exactly length characters of the alphabet."""
+        base = len(self.chars)
+        digits = []
+        for _ in range(length):
+            value, digit = divmod(value, base)
+            digits.append(self.chars[digit])
+        return ''.join(reversed(digits))
+
+
+class RandomAllocator(CodeAllocator):
+    """
+    Random codes, inserted optimistically.
+
+    A running collision rate approximates how full the keyspace for the
+    current length is; once it crosses ``max_collision_rate`` the code
+    length grows by one character.
+    """
+
+    def __init__(self,
+                 chars: str,
+                 min_length: int = 6,
+                 max_length: int = 12,
+                 max_collision_rate: float = 0.05,
+                 smoothing: float = 0.01):
+        super().__init__(chars, min_length)
+        self.length = min_length
+        self.max_length = max_length
+        self.max_collision_rate = max_collision_rate
+        self.smoothing = smoothing
+        self.collision_rate = 0.0
+
+    def next_code(self) -> str:
+        # Every attempt decays the collision rate; collision() bumps it back.
+        self.collision_rate *= 1 - self.smoothing
+        return ''.join(random.choices(self.chars, k=self.length))
+
+    def collision(self, code: str) -> None:
+        self.collision_rate += self.smoothing
+        if (self.collision_rate > self.max_collision_rate
+                and self.length < self.max_length):
+            self.length += 1
+            self.collision_rate = 0.0
+
+
+class CounterAllocator(CodeAllocator):
+    """
+    Codes derived from a shared counter, reserved in blocks per worker.
+
+    Each process reserves ``block_size`` IDs at a time through
+    ``reserve_fn`` and hands them out locally. IDs map to codes of
+    ``min_length`` characters until that keyspace is used up, then to
+    ``min_length + 1`` characters and so on. With a ``secret`` the ID is
+    first run through a keyed permutation of the keyspace, so consecutive
+    codes are not guessable from one another.
+    """
+
+    def __init__(self,
+                 chars: str,
+                 reserve_fn: Callable[[int], int],
+                 min_length: int = 6,
+                 block_size: int = 1000,
+                 secret: Optional[str] = None):
+        super().__init__(chars, min_length)
+        self.reserve_fn = reserve_fn
+        self.block_size = block_size
+        self._permutation = (
+            FeistelPermutation(secret.encode()) if secret else None
+        )
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def next_code(self) -> str:
+        return self.next_codes(1)[0]
+
+    def next_codes(self, count: int) -> List[str]:
+        values: List[int] = []
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked worker must not hand out its parent's block.
+                self._pid = os.getpid()
+                self._next = self._end = 0
+            while len(values) < count:
+                if self._next >= self._end:
+                    size = max(self.block_size, count - len(values))
+                    self._next = self.reserve_fn(size)
+                    self._end = self._next + size
+                take = min(self._end - self._next, count - len(values))
+                values.extend(range(self._next, self._next + take))
+                self._next += take
+        return [self.code_for(value) for value in values]
+
+    def code_for(self, value: int) -> str:
+        """Map a counter value to its short code."""
+        base = len(self.chars)
+        length = self.min_length
+        while value >= base ** length:
+            value -= base ** length
+            length += 1
+        if self._permutation is not None:
+            value = self._permutation.permute(value, base ** length)
+        return self.encode(value, length)
+
+
+class FeistelPermutation:
+    """Keyed bijection on range(n) using a Feistel network with cycle walking."""
+
+    def __init__(self, key: bytes, rounds: int = 4):
+        digest = hashlib.blake2b(key, digest_size=8 * rounds).digest()
+        self.round_keys = [
+            int.from_bytes(digest[i * 8:(i + 1) * 8], 'big')
+            for i in range(rounds)
+        ]
+
+    def _round(self, index: int, value: int, bits: int) -> int:
+        # Keyed integer mixing; any function works as a Feistel round, it
+        # only has to be cheap and hard to predict without the key.
+        value = ((value ^ self.round_keys[index]) * 0x9E3779B97F4A7C15) & (2 ** 64 - 1)
+        value ^= value >> 29
+        return value & ((1 << bits) - 1)
+
+    def _encrypt(self, value: int, half: int) -> int:
+        mask = (1 << half) - 1
+        left, right = value >> half, value & mask
+        for i in range(len(self.round_keys)):
+            left, right = right, left ^ self._round(i, right, half)
+        return (left << half) | right
+
+    def permute(self, value: int, n: int) -> int:
+        """Return the image of value (0 <= value < n) under the permutation."""
+        half = max(1, ((n - 1).bit_length() + 1) // 2)
+        value = self._encrypt(value, half)
+        # The network permutes range(2 ** (2 * half)) >= n; walk the cycle
+        # until we land back inside range(n).
+        while value >= n:
+            value = self._encrypt(value, half)
+        return value
+
+
+def make_allocator(strategy: str,
+                   chars: str,
+                   reserve_fn: Callable[[int], int],
+                   **options) -> CodeAllocator:
+    """
+    Build an allocator by name.
+
+    Args:
+        strategy: "random" or "counter"
+        chars: Alphabet for short codes
+        reserve_fn: Reserves a block of counter IDs, returning its first ID
+        **options: Passed to the allocator's constructor
+
+    Returns:
+        CodeAllocator: The configured allocator
+    """
+    if strategy == "random":
+        return RandomAllocator(chars, **options)
+    if strategy == "counter":
+        return CounterAllocator(chars, reserve_fn, **options)
+    raise ValueError(f"Unknown code allocation strategy: {strategy}")
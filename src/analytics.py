@@ -0,0 +1,209 @@
+import atexit
+import os
+import re
+import threading
+import weakref
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+# (timestamp, short_code, referrer, user_agent) as seen by a redirect
+ClickEvent = Tuple[int, str, Optional[str], Optional[str]]
+# (short_code, resolution, bucket, referrer, agent, clicks)
+RollupRow = Tuple[str, int, int, str, str, int]
+
+# Rollup resolutions, in seconds per bucket
+RESOLUTIONS = {
+    "minute": 60,
+    "hour": 3600,
+    "day": 86400,
+}
+
+# Resolution name -> days of data kept, 0 keeps it forever
+DEFAULT_RETENTION = "minute=2,hour=90,day=0"
+
+# Most buckets a click series may have, e.g. about a week of minutes
+MAX_SERIES_BUCKETS = 10000
+
+_BOT_TOKENS = ("bot", "crawl", "spider", "slurp", "curl", "wget",
+               "python-requests", "httpclient", "headless")
+_MOBILE_TOKENS = ("mobile", "android", "iphone", "ipad")
+_RANGE_PATTERN = re.compile(r"^(\d+)([mhd])$")
+_RANGE_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+
+def agent_class(user_agent: Optional[str]) -> str:
+    """Reduce a User-Agent header to "bot", "mobile", "desktop" or "unknown"."""
+    if not user_agent:
+        return "unknown"
+    user_agent = user_agent.lower()
+    if any(token in user_agent for token in _BOT_TOKENS):
+        return "bot"
+    if any(token in user_agent for token in _MOBILE_TOKENS):
+        return "mobile"
+    return "desktop"
+
+
+def referrer_host(referrer: Optional[str]) -> str:
+    """Return the host of a Referer header, or "" for direct traffic."""
+    if not referrer:
+        return ""
+    try:
+        return (urlparse(referrer).hostname or "")[:255]
+    except ValueError:
+        return ""
+
+
+def parse_retention(spec: str) -> Dict[str, int]:
+    """
+    Parse a retention spec like "minute=2,hour=90,day=0".
+
+    Only the listed resolutions are written, so leaving one out downsamples
+    clicks straight to the coarser ones.
+
+    Returns:
+        Dict[str, int]: Resolution name -> days kept, 0 for forever
+    """
+    retention = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, days = part.partition("=")
+        name = name.strip()
+        if name not in RESOLUTIONS:
+            raise ValueError(f"Unknown analytics resolution: {name}")
+        retention[name] = int(days or 0)
+    return retention
+
+
+def parse_range(value: str) -> int:
+    """Parse a range like "90m", "24h" or "7d" into seconds."""
+    match = _RANGE_PATTERN.match(value.strip())
+    if not match:
+        raise ValueError(f"Invalid range: {value}")
+    return int(match.group(1)) * _RANGE_UNITS[match.group(2)]
+
+
+def resolution_for(seconds: int) -> str:
+    """Pick the finest resolution that keeps a range to a readable series."""
+    if seconds <= 2 * 3600:
+        return "minute"
+    if seconds <= 7 * 86400:
+        return "hour"
+    return "day"
+
+
+def rollup(events: List[ClickEvent], resolutions: List[str]) -> List[RollupRow]:
+    """Aggregate click events into per-bucket counts for each resolution."""
+    counts: Dict[tuple, int] = {}
+    for timestamp, code, referrer, user_agent in events:
+        dimensions = (referrer_host(referrer), agent_class(user_agent))
+        for name in resolutions:
+            size = RESOLUTIONS[name]
+            key = (code, size, timestamp - timestamp % size) + dimensions
+            counts[key] = counts.get(key, 0) + 1
+    return [key + (clicks,) for key, clicks in counts.items()]
+
+
+class EventBuffer:
+    """
+    Bounded in-memory ring buffer of redirect events.
+
+    Redirects only append to a ``deque``, which needs no lock. A background
+    thread drains it every ``flush_interval`` seconds, or as soon as it is
+    half full, and hands the events to ``flush_fn``. If flushing falls
+    behind, the oldest events are overwritten rather than slowing redirects
+    down; ``dropped`` counts them.
+    """
+
+    def __init__(self,
+                 flush_fn: Callable[[List[ClickEvent]], None],
+                 capacity: int = 65536,
+                 flush_interval: float = 5.0):
+        self.flush_fn = flush_fn
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._events: deque = deque(maxlen=capacity)
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+        self._pid = os.getpid()
+        atexit.register(_flush_at_exit, weakref.ref(self))
+
+    def record(self, event: ClickEvent) -> None:
+        """Append one redirect event."""
+        if self._pid != os.getpid():
+            self._after_fork()
+        if self._thread is None:
+            self._start()
+
+        events = self._events
+        size = len(events)
+        if size >= self.capacity:
+            self.dropped += 1
+        elif size >= self.capacity // 2:
+            self._wake.set()
+        events.append(event)
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def flush(self) -> int:
+        """Drain buffered events through flush_fn. Returns events flushed."""
+        with self._flush_lock:
+            events = self._events
+            # Only the events present now; later appends wait for next time
+            batch = [events.popleft() for _ in range(len(events))]
+            if not batch:
+                return 0
+            try:
+                self.flush_fn(batch)
+            except Exception:
+                # Put the events back so they are retried next time.
+                events.extendleft(reversed(batch))
+                raise
+            return len(batch)
+
+    def _start(self) -> None:
+        self._stop = False
+        self._thread = threading.Thread(
+            target=self._run, name="pytiny-analytics-flush", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Analytics flush error: {str(e)}")
+
+    def _after_fork(self) -> None:
+        # Events buffered by the parent are the parent's to flush.
+        self._pid = os.getpid()
+        self._events = deque(maxlen=self.capacity)
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = False
+        self._thread = None
+
+    def close(self) -> None:
+        """Stop the background thread and flush what is left."""
+        if self._pid != os.getpid():
+            return
+        self._stop = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+def _flush_at_exit(ref: "weakref.ref[EventBuffer]") -> None:
+    buffer = ref()
+    if buffer is not None:
+        buffer.close()
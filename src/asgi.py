@@ -0,0 +1,315 @@
+"""
+Asynchronous ASGI front end serving redirects and ``/shorten``.
+
+Requests are handled on the event loop and every blocking ``PyTiny`` call
+is pushed to a bounded thread pool, so a single process can hold thousands
+of open client connections while SQLite work stays capped at
+``max_workers`` threads. Run it with any ASGI server, e.g.::
+
+    uvicorn asgi:app --workers 4
+"""
+import asyncio
+import contextvars
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Optional
+from urllib.parse import parse_qs
+
+from . import metrics, tracing
+from .config import Config
+from .core import PyTiny
+from .ratelimit import RateLimiter, retry_after_header
+from .redirects import cache_headers, not_modified
+from .utils import is_valid_code, validate_url
+
+
+def _json_default(value):
+    # Match Flask's jsonify, which renders datetimes as HTTP dates.
+    if isinstance(value, datetime):
+        return format_datetime(value.replace(tzinfo=timezone.utc), usegmt=True)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class ASGIApp:
+    """
+    Minimal ASGI application exposing the redirect and shorten endpoints.
+
+    Args:
+        shortener: PyTiny instance used for lookups and creates
+        max_workers: Size of the thread pool running blocking DB calls
+        max_pending: Upper bound on DB calls queued or running at once;
+            further requests wait on the event loop without holding a thread
+        limiter: Optional RateLimiter for creates and redirects
+        slow_log: Optional SlowLog to trace requests into
+        max_body: Largest request body read, in bytes; larger ones get 413
+    """
+
+    def __init__(self,
+                 shortener: PyTiny,
+                 max_workers: int = 16,
+                 max_pending: int = 1024,
+                 limiter: Optional[RateLimiter] = None,
+                 slow_log: Optional[tracing.SlowLog] = None,
+                 max_body: int = 64 * 1024):
+        self.shortener = shortener
+        self.limiter = limiter
+        self.slow_log = slow_log
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_body = max_body
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def _run(self, func, *args):
+        """Run a blocking call on the DB thread pool."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.max_workers,
+                                                thread_name_prefix="pytiny-db")
+            self._slots = asyncio.Semaphore(self.max_pending)
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            # Carries the request's trace over to the pool thread
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(self._executor, context.run, func, *args)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            if self.slow_log is None:
+                await self._http(scope, receive, send)
+            else:
+                await self._traced(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def close(self) -> None:
+        """Stop the DB thread pool and close the shortener."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.shortener.close()
+
+    async def _traced(self, scope, receive, send):
+        status = [500]
+
+        async def send_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        trace = tracing.start()
+        try:
+            await self._http(scope, receive, send_status)
+        finally:
+            self.slow_log.record(tracing.finish(trace), scope["method"], scope["path"],
+                                 status[0])
+
+    async def _http(self, scope, receive, send):
+        method = scope["method"]
+        path = scope["path"]
+
+        try:
+            if path == "/shorten":
+                if method != "POST":
+                    await self._send(send, 405, b"Method Not Allowed")
+                    return
+                body = await self._read_body(scope, receive)
+                if body is None:
+                    await self._send(send, 413, b"Request body too large")
+                    return
+                await self._shorten(scope, body, send)
+                return
+
+            if path == "/metrics" and method == "GET":
+                await self._send(send, 200, metrics.REGISTRY.render().encode(),
+                                 [(b"content-type", b"text/plain; version=0.0.4")])
+                return
+
+            short_code = path.lstrip("/")
+            if method in ("GET", "HEAD") and "/" not in short_code:
+                await self._redirect(scope, short_code, send)
+                return
+
+            await self._send(send, 404, b"Not Found")
+        except Exception as e:
+            metrics.ERRORS.inc()
+            await self._send(send, 500, f"Error: {str(e)}".encode())
+
+    def _throttle(self, scope, budget: str) -> Optional[list]:
+        """Return Retry-After headers if the client is over budget, else None."""
+        if self.limiter is None:
+            return None
+        client = scope.get("client")
+        wait = self.limiter.admit(budget, client[0] if client else None)
+        if not wait:
+            return None
+        return [(b"retry-after", retry_after_header(wait).encode())]
+
+    async def _redirect(self, scope, short_code, send):
+        start = time.perf_counter()
+        try:
+            throttled = self._throttle(scope, "redirect")
+            if throttled:
+                await self._send(send, 429, b"Too many requests", throttled)
+                return
+            link = None
+            headers = dict(scope.get("headers") or [])
+            if is_valid_code(short_code):
+                referrer = headers.get(b"referer")
+                user_agent = headers.get(b"user-agent")
+                link = await self._run(
+                    self.shortener.get_redirect, short_code,
+                    referrer.decode("latin-1") if referrer else None,
+                    user_agent.decode("latin-1") if user_agent else None,
+                )
+            else:
+                metrics.NOT_FOUND.inc()
+
+            if link:
+                response_headers = [(name.lower().encode(), value.encode())
+                                    for name, value in cache_headers(link)]
+                if_none_match = headers.get(b"if-none-match")
+                if_modified_since = headers.get(b"if-modified-since")
+                if not_modified(
+                        link,
+                        if_none_match.decode("latin-1") if if_none_match else None,
+                        if_modified_since.decode("latin-1") if if_modified_since else None):
+                    await self._send(send, 304, b"", response_headers)
+                else:
+                    response_headers.append((b"location", link[1].encode()))
+                    await self._send(send, link[0], b"", response_headers)
+            else:
+                await self._send(send, 404, b"URL not found or expired")
+        finally:
+            metrics.REDIRECT_SECONDS.observe(time.perf_counter() - start)
+
+    async def _shorten(self, scope, body, send):
+        throttled = self._throttle(scope, "create")
+        if throttled:
+            await self._send(send, 429, b'{"error": "Too many requests"}',
+                             throttled + [(b"content-type", b"application/json")])
+            return
+        form = self._parse_form(scope, body)
+        url = str(form.get("url", "")).strip()
+
+        if not url:
+            await self._send_json(send, 400, {"error": "URL is required"})
+            return
+        if not validate_url(url):
+            await self._send_json(send, 400, {"error": "Invalid URL format"})
+            return
+
+        expire_hours = form.get("expire_hours")
+        try:
+            expire_hours = int(expire_hours) if expire_hours else 24
+        except ValueError:
+            await self._send_json(send, 400, {"error": "Invalid expiration hours"})
+            return
+
+        redirect_status = form.get("redirect_status")
+        cache_ttl = form.get("cache_ttl")
+        try:
+            redirect_status = int(redirect_status) if redirect_status else None
+            cache_ttl = int(cache_ttl) if cache_ttl else None
+        except ValueError:
+            await self._send_json(send, 400, {"error": "Invalid redirect policy"})
+            return
+
+        try:
+            started = time.perf_counter()
+            try:
+                code = await self._run(self.shortener.create_short_url, url, expire_hours,
+                                       redirect_status, cache_ttl)
+            finally:
+                # Failed writes are slow writes too
+                if self.limiter is not None:
+                    self.limiter.record_write(time.perf_counter() - started)
+            stats = await self._run(self.shortener.get_stats, code)
+        except Exception as e:
+            await self._send_json(send, 400, {"error": str(e)})
+            return
+
+        await self._send_json(send, 200, {
+            "short_url": f"{self._host_url(scope)}{code}",
+            "stats": stats,
+        })
+
+    async def _read_body(self, scope, receive) -> Optional[bytes]:
+        """Return the request body, None if it is larger than max_body."""
+        headers = dict(scope.get("headers") or [])
+        length = headers.get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.max_body:
+            return None
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_body:
+                return None
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                return b"".join(chunks)
+
+    @staticmethod
+    def _parse_form(scope, body: bytes) -> dict:
+        headers = dict(scope.get("headers") or [])
+        content_type = headers.get(b"content-type", b"").decode("latin-1")
+        if content_type.startswith("application/json"):
+            try:
+                data = json.loads(body or b"{}")
+            except ValueError:
+                return {}
+            return data if isinstance(data, dict) else {}
+        return {key: values[0] for key, values
+                in parse_qs(body.decode("utf-8", "replace")).items()}
+
+    @staticmethod
+    def _host_url(scope) -> str:
+        headers = dict(scope.get("headers") or [])
+        host = headers.get(b"host", b"").decode("latin-1")
+        if not host and scope.get("server"):
+            host = "%s:%s" % tuple(scope["server"])
+        return f"{scope.get('scheme', 'http')}://{host}/"
+
+    @staticmethod
+    async def _send(send, status, body, headers=None):
+        headers = list(headers or [])
+        if not any(name == b"content-type" for name, _ in headers):
+            headers.append((b"content-type", b"text/html; charset=utf-8"))
+        headers.append((b"content-length", str(len(body)).encode()))
+        await send({"type": "http.response.start", "status": status,
+                    "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _send_json(self, send, status, data):
+        with tracing.span("serialize"):
+            body = json.dumps(data, default=_json_default).encode()
+        await self._send(send, status, body,
+                         [(b"content-type", b"application/json")])
+
+
+def create_app(config: Optional[Config] = None) -> ASGIApp:
+    """Build the ASGI application from configuration."""
+    config = config or Config.load()
+    if config.METRICS_DIR:
+        metrics.REGISTRY.set_directory(config.METRICS_DIR)
+    shortener = PyTiny.from_config(config)
+    shortener.prewarm()
+    return ASGIApp(shortener, max_workers=config.ASGI_DB_THREADS,
+                   limiter=RateLimiter.from_config(config),
+                   slow_log=tracing.SlowLog.from_config(config),
+                   max_body=config.ASGI_MAX_BODY)
@@ -0,0 +1,212 @@
+import math
+import os
+import threading
+import time
+from typing import Iterable, Optional
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings.
+
+    Positions come from double hashing the two halves of Python's built-in
+    string hash, which is cached on the string and randomised per process.
+    A filter is therefore only meaningful inside the process that built it.
+
+    Args:
+        capacity: Number of items the filter is sized for
+        error_rate: Target false-positive rate at capacity
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        h = hash(item)
+        h1 = h & 0xFFFFFFFF
+        h2 = ((h >> 32) & 0xFFFFFFFF) | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def add(self, item: str) -> None:
+        bits = self._bits
+        for position in self._positions(item):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def update(self, items: Iterable[str]) -> None:
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item: str) -> bool:
+        bits = self._bits
+        for position in self._positions(item):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class CodeFilter:
+    """
+    Per-process Bloom filter of every short code in storage.
+
+    A code the filter has never seen cannot exist, so lookups for it are
+    answered without a database query. Codes created by this process are
+    added as they are inserted. Codes created elsewhere (other workers,
+    the CLI) are picked up on a miss: if ``storage.change_token()`` shows
+    a commit since the last sync, codes added since then are read by row
+    ID before the miss is trusted.
+
+    Deleted and reaped codes stay in the filter until the next rebuild,
+    which only costs the occasional database lookup. The filter is rebuilt
+    from scratch in the background every ``rebuild_interval`` seconds, and
+    as soon as it fills past its capacity.
+
+    Args:
+        storage: Storage backend providing codes_since() and change_token()
+        error_rate: Target false-positive rate
+        rebuild_interval: Seconds between full rebuilds, None to never
+            rebuild on a schedule
+        batch_size: Codes read per query while syncing
+    """
+
+    # Headroom for growth allocated on every (re)build
+    GROWTH_FACTOR = 2
+    MIN_CAPACITY = 10000
+
+    def __init__(self,
+                 storage,
+                 error_rate: float = 0.01,
+                 rebuild_interval: Optional[float] = 3600.0,
+                 batch_size: int = 10000):
+        self.storage = storage
+        self.error_rate = error_rate
+        self.rebuild_interval = rebuild_interval
+        self.batch_size = batch_size
+        self._bloom: Optional[BloomFilter] = None
+        self._watermark = None
+        self._token = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._rebuilding = False
+        self._rebuild_at = 0.0
+        self._pid = os.getpid()
+
+    def _check_fork(self) -> None:
+        # Locks may have been held by another thread at fork time
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._lock = threading.Lock()
+            self._build_lock = threading.Lock()
+            self._rebuilding = False
+
+    def might_contain(self, code: str) -> bool:
+        """Return False only if code is certainly not in storage."""
+        bloom = self._bloom
+        if bloom is None:
+            self._check_fork()
+            with self._build_lock:
+                if self._bloom is None:
+                    self.rebuild()
+            bloom = self._bloom
+        if code in bloom:
+            return True
+
+        token = self.storage.change_token()
+        if token is None or token != self._token:
+            # Someone committed since we last synced
+            self.sync()
+            bloom = self._bloom
+            if code in bloom:
+                return True
+
+        if time.monotonic() >= self._rebuild_at or bloom.count > bloom.capacity:
+            self._rebuild_in_background()
+        return False
+
+    def add(self, code: str) -> None:
+        """Record a code this process has just inserted."""
+        self._check_fork()
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(code)
+
+    def sync(self) -> int:
+        """Add codes inserted since the last sync. Returns codes added."""
+        self._check_fork()
+        with self._lock:
+            return self._catch_up(self._bloom)
+
+    def _catch_up(self, bloom: BloomFilter) -> int:
+        # Taken first: everything committed before it is read below
+        self._token = self.storage.change_token()
+        added = 0
+        while True:
+            codes, self._watermark = self.storage.codes_since(self._watermark,
+                                                              self.batch_size)
+            if not codes:
+                return added
+            bloom.update(codes)
+            added += len(codes)
+
+    def rebuild(self) -> None:
+        """Rebuild the filter from every code in storage."""
+        stored = self.storage.summary(int(time.time()))["urls"]
+        bloom = BloomFilter(max(self.MIN_CAPACITY, stored * self.GROWTH_FACTOR),
+                            self.error_rate)
+        watermark = None
+        while True:
+            codes, watermark = self.storage.codes_since(watermark, self.batch_size)
+            if not codes:
+                break
+            bloom.update(codes)
+
+        self._check_fork()
+        with self._lock:
+            # Codes committed while we were scanning are caught up before
+            # the new filter is used
+            self._watermark = watermark
+            self._catch_up(bloom)
+            self._bloom = bloom
+            if self.rebuild_interval:
+                self._rebuild_at = time.monotonic() + self.rebuild_interval
+            else:
+                self._rebuild_at = float("inf")
+
+    def _rebuild_in_background(self) -> None:
+        self._check_fork()
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+            # Don't retry on every miss if the rebuild fails
+            self._rebuild_at = time.monotonic() + (self.rebuild_interval or 60.0)
+
+        def run():
+            try:
+                self.rebuild()
+            except Exception as e:
+                print(f"Code filter rebuild error: {str(e)}")
+            finally:
+                self._rebuilding = False
+
+        threading.Thread(target=run, name="pytiny-bloom-rebuild", daemon=True).start()
+
+    def stats(self) -> Optional[dict]:
+        """Return the filter's size and fill, or None before the first build."""
+        bloom = self._bloom
+        if bloom is None:
+            return None
+        return {
+            "codes": bloom.count,
+            "capacity": bloom.capacity,
+            "bits": bloom.size,
+            "hashes": bloom.hashes,
+            "error_rate": bloom.error_rate,
+        }
@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class LRUCache:
+    """
+    Thread-safe bounded LRU cache whose entries carry their own deadline.
+
+    Every entry is stored with the absolute time at which it stops being
+    valid, so a cached link never outlives its ``expires_at``. An optional
+    ``ttl`` additionally bounds how long any entry may be served from memory.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: Optional[float] = None):
+        if max_size <= 0:
+            raise ValueError("max_size must be positive")
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Bumped by every invalidation, see set()
+        self.generation = 0
+
+    def get(self, key: Hashable, now: Optional[float] = None) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss."""
+        if now is None:
+            now = time.time()
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, deadline = entry
+            if deadline is not None and deadline <= now:
+                del self._data[key]
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self,
+            key: Hashable,
+            value: Any,
+            expires_at: Optional[float] = None,
+            now: Optional[float] = None,
+            generation: Optional[int] = None) -> None:
+        """
+        Store value under key.
+
+        Args:
+            key: Cache key
+            value: Value to cache
+            expires_at: Optional absolute time after which the entry is stale
+            now: Current time, defaults to time.time()
+            generation: ``self.generation`` from before value was read;
+                if anything was invalidated since, value may be outdated
+                and is not stored
+        """
+        if now is None:
+            now = time.time()
+
+        deadline = expires_at
+        if self.ttl is not None:
+            ttl_deadline = now + self.ttl
+            if deadline is None or ttl_deadline < deadline:
+                deadline = ttl_deadline
+
+        if deadline is not None and deadline <= now:
+            return
+
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (value, deadline)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> bool:
+        """Drop key from the cache. Returns True if it was present."""
+        with self._lock:
+            self.generation += 1
+            return self._data.pop(key, None) is not None
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Return hit/miss/eviction counters and current size."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._data),
+                "max_size": self.max_size,
+            }
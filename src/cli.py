@@ -1,9 +1,62 @@
 import argparse
+import csv
 import sys
+import time
 from datetime import datetime
+from .analytics import parse_range
+from .config import Config
 from .core import PyTiny
+from .export import FORMATS as EXPORT_FORMATS
+from .reaper import Reaper
+from .redirects import REDIRECT_STATUSES
+from .snapshot import Snapshot, build_snapshot
+from .storage import open_storage, reshard
 from .utils import sanitize_url
 
+def _import_rows(reader, default_hours, skipped):
+    """Yield (url, expire_hours) from CSV rows, counting skipped rows in skipped[0]."""
+    for row in reader:
+        if not row or not row[0].strip() or row[0].strip().lower() == "url":
+            continue
+        url = sanitize_url(row[0])
+        try:
+            expire_hours = int(row[1]) if len(row) > 1 and row[1].strip() else default_hours
+        except ValueError:
+            url = None
+        if not url:
+            skipped[0] += 1
+            continue
+        yield url, expire_hours
+
+def import_csv(shortener, path, expire_hours=None, batch_size=5000, output=None):
+    """
+    Bulk import URLs from a CSV file with a url column and an optional
+    expire_hours column, printing progress to stderr.
+
+    Returns:
+        Tuple[int, int]: Number of rows imported and skipped
+    """
+    skipped = [0]
+    imported = 0
+    start = time.time()
+
+    with open(path, newline="", encoding="utf-8") as fh:
+        writer = csv.writer(output) if output else None
+        rows = _import_rows(csv.reader(fh), expire_hours, skipped)
+        for long_url, code in shortener.create_short_urls_bulk(rows, batch_size=batch_size):
+            imported += 1
+            if writer:
+                writer.writerow([long_url, code])
+            if imported % batch_size == 0:
+                rate = imported / max(time.time() - start, 1e-9)
+                print(f"\rImported {imported} rows ({rate:.0f} rows/s)",
+                      end="", file=sys.stderr, flush=True)
+
+    rate = imported / max(time.time() - start, 1e-9)
+    print(f"\rImported {imported} rows ({rate:.0f} rows/s), skipped {skipped[0]}",
+          file=sys.stderr)
+    return imported, skipped[0]
+
 def main():
     parser = argparse.ArgumentParser(description="PyTiny URL Shortener CLI")
     subparsers = parser.add_subparsers(dest="command", help="Commands")
@@ -16,10 +69,182 @@ def main():
         type=int, 
         help="Expiration time in hours"
     )
+    shorten_parser.add_argument(
+        "--status",
+        type=int,
+        choices=REDIRECT_STATUSES,
+        help="Redirect status for this link (default: PYTINY_REDIRECT_STATUS)"
+    )
+    shorten_parser.add_argument(
+        "--cache-ttl",
+        type=int,
+        help="Seconds browsers and CDNs may cache the redirect, 0 to opt out"
+    )
+
+    # Policy command
+    policy_parser = subparsers.add_parser(
+        "policy", help="Set a link's redirect status and cache TTL"
+    )
+    policy_parser.add_argument("code", help="Short code to update")
+    policy_parser.add_argument(
+        "--status",
+        type=int,
+        choices=REDIRECT_STATUSES,
+        help="Redirect status, server default if omitted"
+    )
+    policy_parser.add_argument(
+        "--cache-ttl",
+        type=int,
+        help="Seconds the redirect may be cached, 0 to opt out, server default if omitted"
+    )
 
     # Stats command
     stats_parser = subparsers.add_parser("stats", help="Get URL statistics")
     stats_parser.add_argument("code", help="Short code to check")
+    stats_parser.add_argument(
+        "--series",
+        action="store_true",
+        help="Show clicks over time from the analytics rollups"
+    )
+    stats_parser.add_argument(
+        "--range",
+        default="24h",
+        help="How far back the series reaches, e.g. 90m, 24h or 30d"
+    )
+    stats_parser.add_argument(
+        "--resolution",
+        choices=["minute", "hour", "day"],
+        help="Bucket size of the series (default depends on --range)"
+    )
+
+    # Top command
+    top_parser = subparsers.add_parser(
+        "top", help="Show the most redirected links saved by the server's workers"
+    )
+    top_parser.add_argument("--limit", type=int, default=20, help="Number of links to show")
+
+    # Migrate command
+    subparsers.add_parser("migrate", help="Apply pending database schema migrations")
+
+    # Summary command
+    subparsers.add_parser("summary", help="Show link and click totals across shards")
+
+    # Reshard command
+    reshard_parser = subparsers.add_parser(
+        "reshard", help="Copy all links into a new set of shard files"
+    )
+    reshard_parser.add_argument(
+        "--to",
+        required=True,
+        help="Comma-separated SQLite paths of the target shards, or a redis:// URL"
+    )
+    reshard_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=5000,
+        help="Rows copied per transaction"
+    )
+
+    # Compact command
+    compact_parser = subparsers.add_parser(
+        "compact", help="Convert SQLite databases to the compact layout while in use"
+    )
+    compact_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=5000,
+        help="Rows copied per transaction"
+    )
+    compact_parser.add_argument(
+        "--vacuum",
+        action="store_true",
+        help="Then rebuild each file to return the freed space; blocks writers meanwhile"
+    )
+
+    # Reap command
+    reap_parser = subparsers.add_parser("reap", help="Delete expired URLs in small batches")
+    reap_parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running, reaping every --interval seconds and links "
+             "expiring within --horizon seconds right at their expiry"
+    )
+    reap_parser.add_argument(
+        "--interval",
+        type=float,
+        default=60.0,
+        help="Seconds between runs in daemon mode"
+    )
+    reap_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=500,
+        help="Rows deleted per transaction"
+    )
+    reap_parser.add_argument(
+        "--pause",
+        type=float,
+        default=0.05,
+        help="Seconds to pause between batches"
+    )
+    reap_parser.add_argument(
+        "--horizon",
+        type=int,
+        help="Seconds ahead to schedule expiring links in daemon mode, 0 disables "
+             "(default: PYTINY_REAPER_HORIZON)"
+    )
+
+    # Snapshot command
+    snapshot_parser = subparsers.add_parser(
+        "snapshot", help="Build or inspect the memory-mapped redirect snapshot"
+    )
+    snapshot_parser.add_argument("action", choices=["build", "info"])
+    snapshot_parser.add_argument(
+        "--path",
+        help="Snapshot file (default: PYTINY_SNAPSHOT_PATH)"
+    )
+    snapshot_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=10000,
+        help="Rows read per query while building"
+    )
+
+    # Export command
+    export_parser = subparsers.add_parser(
+        "export", help="Stream all links as NDJSON, CSV or Parquet"
+    )
+    export_parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="ndjson")
+    export_parser.add_argument(
+        "--output",
+        help="Write to this file instead of stdout (required for parquet)"
+    )
+    export_parser.add_argument("--filter", choices=PyTiny.URL_FILTERS, default="all")
+    export_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="Rows read per query"
+    )
+
+    # Import command
+    import_parser = subparsers.add_parser("import", help="Bulk import URLs from a CSV file")
+    import_parser.add_argument("file", help="CSV file with url[,expire_hours] rows")
+    import_parser.add_argument(
+        "--expire",
+        type=int,
+        help="Expiration time in hours for rows without their own"
+    )
+    import_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=5000,
+        help="Rows inserted per transaction"
+    )
+    import_parser.add_argument(
+        "--output",
+        help="Write url,short_code rows to this CSV file instead of stdout"
+    )
 
     args = parser.parse_args()
     
@@ -27,7 +252,17 @@ def main():
         parser.print_help()
         sys.exit(1)
 
-    shortener = PyTiny()
+    config = Config.load()
+
+    if args.command == "migrate":
+        # Before PyTiny, which would apply the migrations on its own
+        storage = open_storage(config.DB_PATH, config.DB_SHARDS, migrate=False)
+        applied = storage.migrate()
+        print(f"Applied {applied} migrations, schema version {storage.schema_version()}")
+        storage.close()
+        return
+
+    shortener = PyTiny.from_config(config)
 
     if args.command == "shorten":
         url = sanitize_url(args.url)
@@ -35,9 +270,47 @@ def main():
             print("Error: Invalid URL")
             sys.exit(1)
             
-        code = shortener.create_short_url(url, expire_hours=args.expire)
+        try:
+            code = shortener.create_short_url(url, expire_hours=args.expire,
+                                              redirect_status=args.status,
+                                              cache_ttl=args.cache_ttl)
+        except ValueError as e:
+            print(f"Error: {str(e)}")
+            sys.exit(1)
         print(f"Short URL: http://your-domain/{code}")
 
+    elif args.command == "policy":
+        try:
+            updated = shortener.set_redirect_policy(args.code, args.status, args.cache_ttl)
+        except ValueError as e:
+            print(f"Error: {str(e)}")
+            sys.exit(1)
+        if not updated:
+            print("Error: Code not found")
+            sys.exit(1)
+        print(f"Updated redirect policy of {args.code}")
+
+    elif args.command == "stats" and args.series:
+        try:
+            series = shortener.get_click_series(args.code, parse_range(args.range),
+                                                args.resolution)
+        except ValueError as e:
+            print(f"Error: {str(e)}")
+            sys.exit(1)
+        if not series:
+            print("Error: Code not found")
+            sys.exit(1)
+
+        print(f"\nClicks per {series['resolution']} ({series['clicks']} total):")
+        for point in series["series"]:
+            print(f"{point['time']:%Y-%m-%d %H:%M}  {point['clicks']}")
+        print("\nReferrers:")
+        for referrer, clicks in sorted(series["referrers"].items(), key=lambda item: -item[1]):
+            print(f"  {referrer or '(direct)'}: {clicks}")
+        print("\nUser agents:")
+        for agent, clicks in sorted(series["agents"].items(), key=lambda item: -item[1]):
+            print(f"  {agent}: {clicks}")
+
     elif args.command == "stats":
         stats = shortener.get_stats(args.code)
         if not stats:
@@ -49,6 +322,144 @@ def main():
         print(f"Expires: {stats['expires_at'] or 'Never'}")
         print(f"Clicks: {stats['clicks']}")
         print(f"Last clicked: {stats['last_clicked'] or 'Never'}")
+        print(f"Redirect: {stats['redirect_status']}, cached for {stats['cache_ttl']}s")
+
+    elif args.command == "export":
+        write = EXPORT_FORMATS[args.format]
+        if args.format == "parquet" and not args.output:
+            print("Error: Parquet export needs --output")
+            sys.exit(1)
+        # Buffered clicks would otherwise be missing from the counts
+        shortener.flush_clicks()
+        urls = shortener.iter_urls(args.filter, args.batch_size)
+        try:
+            if args.format == "parquet":
+                exported = write(urls, args.output)
+            elif args.output:
+                with open(args.output, "w", newline="", encoding="utf-8") as out:
+                    exported = write(urls, out)
+            else:
+                exported = write(urls, sys.stdout)
+        except RuntimeError as e:
+            print(f"Error: {str(e)}")
+            sys.exit(1)
+        print(f"Exported {exported} links", file=sys.stderr)
+
+    elif args.command == "import":
+        if args.output:
+            with open(args.output, "w", newline="", encoding="utf-8") as out:
+                import_csv(shortener, args.file, args.expire, args.batch_size, out)
+        else:
+            import_csv(shortener, args.file, args.expire, args.batch_size, sys.stdout)
+
+    elif args.command == "top":
+        if not config.HOT_CODES or not config.HOT_CODES_DIR:
+            print("Error: Set PYTINY_HOT_CODES and PYTINY_HOT_CODES_DIR as for the server")
+            sys.exit(1)
+        for rank, link in enumerate(shortener.top_codes(args.limit), 1):
+            print(f"{rank:4}. {link['short_code']}  ~{link['redirects']} redirects  "
+                  f"{link['long_url']}")
+
+    elif args.command == "summary":
+        summary = shortener.get_summary()
+        print("\nLink Summary:")
+        print(f"URLs: {summary['urls']}")
+        print(f"Expired: {summary['expired']}")
+        print(f"Clicks: {summary['clicks']}")
+        for shard in summary.get("shards", []):
+            print(f"  {shard['path']}: {shard['urls']} URLs, "
+                  f"{shard['expired']} expired, {shard['clicks']} clicks")
+
+    elif args.command == "reshard":
+        shortener.flush_clicks()
+        if args.to.startswith("redis://"):
+            target = open_storage(args.to)
+        else:
+            target = open_storage(shards=args.to)
+        copied = reshard(
+            shortener.storage, target, args.batch_size,
+            progress=lambda n: print(f"\rCopied {n} rows", end="",
+                                     file=sys.stderr, flush=True),
+        )
+        target.close()
+        destination = (args.to if args.to.startswith("redis://")
+                       else f"{len(args.to.split(','))} shards")
+        print(f"\rCopied {copied} rows into {destination}", file=sys.stderr)
+
+    elif args.command == "compact":
+        # Imported here: only needed for this one-off conversion
+        import sqlite3
+        from .compact_storage import compact
+
+        def database_bytes(path):
+            conn = sqlite3.connect(path)
+            try:
+                if args.vacuum:
+                    conn.execute("VACUUM")
+                    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                (pages,), (page_size,), (free,) = (
+                    conn.execute(f"PRAGMA {pragma}").fetchone()
+                    for pragma in ("page_count", "page_size", "freelist_count"))
+                return (pages - free) * page_size
+            finally:
+                conn.close()
+
+        paths = config.DB_SHARDS.split(",") if config.DB_SHARDS else [config.DB_PATH]
+        if any(path == ":memory:" or "://" in path for path in paths):
+            print("Error: Only SQLite databases can be compacted")
+            sys.exit(1)
+        shortener.flush_clicks()
+        for path in (path.strip() for path in paths):
+            before = database_bytes(path)
+            copied = compact(
+                path, shortener.chars, args.batch_size,
+                progress=lambda n: print(f"\rCopied {n} rows", end="",
+                                         file=sys.stderr, flush=True),
+            )
+            print(f"\r{path}: compacted {copied} links, "
+                  f"{before} -> {database_bytes(path)} bytes in use", file=sys.stderr)
+
+    elif args.command == "snapshot":
+        path = args.path or config.SNAPSHOT_PATH
+        if not path:
+            print("Error: No snapshot path, use --path or PYTINY_SNAPSHOT_PATH")
+            sys.exit(1)
+
+        if args.action == "build":
+            started = time.perf_counter()
+            report = build_snapshot(shortener.storage, path, args.batch_size)
+            print(f"Wrote {report['entries']} links to {path} "
+                  f"({report['bytes']} bytes) in {time.perf_counter() - started:.1f}s, "
+                  f"pruned {report['pruned']} change log entries")
+        else:
+            try:
+                snapshot = Snapshot(path)
+            except (OSError, ValueError) as e:
+                print(f"Error: {str(e)}")
+                sys.exit(1)
+            print(f"Links: {snapshot.count}")
+            print(f"Built: {datetime.fromtimestamp(snapshot.metadata['built_at'])}")
+            snapshot.close()
+
+    elif args.command == "reap":
+        horizon = args.horizon if args.horizon is not None else config.REAPER_HORIZON
+        reaper = Reaper(shortener, args.batch_size, args.pause, args.interval, horizon)
+        try:
+            while True:
+                report = reaper.run_once()
+                if report is None:
+                    print("Another reaper holds the lock, skipping")
+                else:
+                    print(f"Deleted {report['deleted']} expired URLs "
+                          f"({report['rows_per_sec']:.0f} rows/s, lag {report['lag']}s), "
+                          f"pruned {report['pruned']} click rollups")
+                if not args.daemon:
+                    break
+                reaper.sleep(args.interval)
+        except KeyboardInterrupt:
+            pass
+
+    shortener.close()
 
 if __name__ == "__main__":
     main()
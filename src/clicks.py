@@ -0,0 +1,144 @@
+import atexit
+import os
+import threading
+import weakref
+from typing import Callable, Dict, Optional, Tuple
+
+# short_code -> (click increment, latest click timestamp)
+ClickBatch = Dict[str, Tuple[int, int]]
+
+
+class ClickBuffer:
+    """
+    Write-behind aggregation of click statistics.
+
+    Redirects call :meth:`record`, which only updates an in-memory counter.
+    Pending increments are handed to ``flush_fn`` as a single batch from a
+    background thread every ``flush_interval`` seconds, as soon as
+    ``max_pending`` clicks have accumulated, and at interpreter shutdown.
+    A failed flush keeps the batch for the next one and never fails the
+    redirect that recorded the click.
+    """
+
+    def __init__(self,
+                 flush_fn: Callable[[ClickBatch], None],
+                 flush_interval: float = 1.0,
+                 max_pending: int = 1000):
+        self.flush_fn = flush_fn
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: ClickBatch = {}
+        self._flushing: ClickBatch = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = os.getpid()
+        atexit.register(_flush_at_exit, weakref.ref(self))
+
+    def record(self, short_code: str, timestamp: int) -> None:
+        """Count one click on short_code at timestamp."""
+        if self._pid != os.getpid():
+            self._after_fork()
+        if self._thread is None and self.flush_interval:
+            self._start()
+
+        with self._lock:
+            count, last = self._pending.get(short_code, (0, 0))
+            self._pending[short_code] = (count + 1, max(last, timestamp))
+            self._count += 1
+            full = self._count >= self.max_pending
+
+        if full:
+            if self._thread is not None:
+                self._wake.set()
+                return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Click flush error: {str(e)}")
+
+    def pending(self, short_code: str) -> Optional[Tuple[int, int]]:
+        """Return unflushed (clicks, last_clicked) for short_code, if any."""
+        with self._lock:
+            entries = [batch[short_code]
+                       for batch in (self._pending, self._flushing)
+                       if short_code in batch]
+        if not entries:
+            return None
+        return (sum(count for count, _ in entries),
+                max(last for _, last in entries))
+
+    def flush(self) -> int:
+        """Write all pending clicks through flush_fn. Returns codes flushed."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._flushing, self._pending = self._pending, {}
+                self._count = 0
+
+            try:
+                self.flush_fn(self._flushing)
+            except Exception:
+                # Put the batch back so the clicks are retried next time.
+                with self._lock:
+                    for code, (count, last) in self._flushing.items():
+                        pending = self._pending.get(code, (0, 0))
+                        self._pending[code] = (pending[0] + count,
+                                               max(pending[1], last))
+                        self._count += count
+                    self._flushing = {}
+                raise
+
+            with self._lock:
+                flushed = len(self._flushing)
+                self._flushing = {}
+            return flushed
+
+    def _start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="pytiny-click-flush", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Click flush error: {str(e)}")
+
+    def _after_fork(self) -> None:
+        # Clicks buffered by the parent are the parent's to flush.
+        self._pid = os.getpid()
+        self._pending = {}
+        self._flushing = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def close(self) -> None:
+        """Stop the background thread and flush what is left."""
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+def _flush_at_exit(ref: "weakref.ref[ClickBuffer]") -> None:
+    buffer = ref()
+    if buffer is not None:
+        buffer.close()
@@ -0,0 +1,710 @@
+"""
+Compact SQLite layout for links.
+
+The default layout keys ``urls`` by an AUTOINCREMENT row ID, indexes the
+text short code on top of it and stores every long URL in full. The
+compact layout keeps links in a ``links`` table clustered on the short
+code itself, decoded to an integer over the code alphabet, so a lookup is
+a single B-tree descent and the code costs at most 8 bytes. Each long URL
+is split into its ``scheme://host`` prefix, interned once in ``hosts``,
+and the rest, which is deflated against a preset dictionary of common
+URL fragments whenever that makes it shorter.
+
+Databases are converted with :func:`compact` (``pytiny compact``) while
+the service keeps running; ``open_storage`` picks :class:`CompactStorage`
+for a converted file on its own.
+"""
+import re
+import sqlite3
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from .clicks import ClickBatch
+from .pool import ConnectionPool
+from .storage import (FullRow, HashMatch, Link, NewRow, SQLiteStorage, StatsRow,
+                      sqlite_layout)
+
+# Primary key of a link: an integer, or the code's bytes if it has none
+Key = Union[int, bytes]
+
+# Fragments preloaded into the deflate window. Stored paths can only be
+# inflated with these exact bytes, so never edit them. Most common last:
+# matches nearer the end of the window are cheaper to encode.
+URL_DICTIONARY = (
+    b"/wp-content/uploads/2024/.jpg.png.pdf.html.php/index/en-us/products/item/"
+    b"/category/article/news/blog/posts/p/dp/gp/product//watch?v=/status/"
+    b"?id=&page=&q=&ref=&utm_term=&utm_content=&utm_campaign="
+    b"&utm_source=newsletter&utm_medium=email&utm_source=facebook"
+    b"&utm_source=twitter&utm_medium=social"
+)
+# Raw deflate with a 1 KiB window, which the dictionary has to fit in. A
+# small window and memLevel make a compressor cheap to set up per URL.
+_WBITS = -10
+_MEM_LEVEL = 1
+
+# scheme://host[:port], everything up to the path, query or fragment
+_PREFIX = re.compile(r"[a-zA-Z][a-zA-Z0-9+.-]*://[^/?#]*")
+
+# Sorts after every key: integers sort before blobs, and codes are ASCII
+_LAST_KEY = b"\xff" * 16
+
+
+def split_url(url: str) -> Tuple[str, str]:
+    """Split url into its scheme://host prefix and the rest."""
+    match = _PREFIX.match(url)
+    if not match:
+        return "", url
+    return url[:match.end()], url[match.end():]
+
+
+def pack_path(path: str) -> Union[str, bytes]:
+    """Deflate path if that makes it shorter; stored as a BLOB, else TEXT."""
+    raw = path.encode()
+    if len(raw) < 16:
+        return path
+    compressor = zlib.compressobj(9, zlib.DEFLATED, _WBITS, _MEM_LEVEL,
+                                  zdict=URL_DICTIONARY)
+    packed = compressor.compress(raw) + compressor.flush()
+    return packed if len(packed) < len(raw) else path
+
+
+def unpack_path(path: Union[str, bytes]) -> str:
+    """Inverse of pack_path()."""
+    if isinstance(path, str):
+        return path
+    # The stream ends in a final block, so one call inflates all of it
+    return zlib.decompressobj(_WBITS, zdict=URL_DICTIONARY).decompress(path).decode()
+
+
+class CodeKeys:
+    """
+    Short codes as integers in bijective base ``len(alphabet)``.
+
+    Every code over the alphabet maps to a distinct positive integer, with
+    no two lengths colliding, and back. Codes with other characters, or too
+    long for a signed 64-bit integer, keep their bytes as the key; SQLite
+    stores those as BLOBs in the same primary key column.
+    """
+
+    # Largest SQLite INTEGER
+    MAX_KEY = 2 ** 63 - 1
+
+    def __init__(self, alphabet: str):
+        if len(set(alphabet)) != len(alphabet) or len(alphabet) < 2:
+            raise ValueError("alphabet needs at least two distinct characters")
+        self.alphabet = alphabet
+        self._digits = {char: i + 1 for i, char in enumerate(alphabet)}
+        self._base = len(alphabet)
+
+    def key(self, code: str) -> Key:
+        """Return the primary key for code."""
+        digits = self._digits
+        base = self._base
+        value = 0
+        for char in code:
+            digit = digits.get(char)
+            if digit is None:
+                return code.encode()
+            value = value * base + digit
+        return value if value <= self.MAX_KEY else code.encode()
+
+    def code(self, key: Key) -> str:
+        """Return the short code for a primary key."""
+        if isinstance(key, bytes):
+            return key.decode()
+        chars = []
+        while key:
+            key, digit = divmod(key - 1, self._base)
+            chars.append(self.alphabet[digit])
+        return "".join(reversed(chars))
+
+
+def _create_tables(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS links (
+            code INTEGER PRIMARY KEY,
+            host INTEGER NOT NULL,
+            path NOT NULL,
+            created_at INTEGER NOT NULL,
+            expires_at INTEGER,
+            clicks INTEGER DEFAULT 0,
+            last_clicked INTEGER,
+            url_hash INTEGER,
+            redirect_status INTEGER,
+            cache_ttl INTEGER,
+            seq INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+    # seq numbers links in insertion order, like the row IDs of urls
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_links_seq ON links(seq)")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_links_url_hash ON links(url_hash)
+        WHERE url_hash IS NOT NULL
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_links_expires_at ON links(expires_at)
+        WHERE expires_at IS NOT NULL
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS hosts (
+            id INTEGER PRIMARY KEY,
+            prefix TEXT UNIQUE NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS layout (
+            name TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    """)
+
+
+def _intern_hosts(conn: sqlite3.Connection, prefixes: Iterable[str],
+                  host_ids: Dict[str, int]) -> None:
+    """Add the IDs of prefixes to host_ids, inserting new ones into hosts."""
+    missing = sorted({prefix for prefix in prefixes if prefix not in host_ids})
+    if not missing:
+        return
+    conn.executemany("INSERT OR IGNORE INTO hosts (prefix) VALUES (?)",
+                     [(prefix,) for prefix in missing])
+    for start in range(0, len(missing), SQLiteStorage.MAX_QUERY_PARAMS):
+        chunk = missing[start:start + SQLiteStorage.MAX_QUERY_PARAMS]
+        placeholders = ",".join("?" * len(chunk))
+        host_ids.update(conn.execute(
+            f"SELECT prefix, id FROM hosts WHERE prefix IN ({placeholders})", chunk))
+
+
+class CompactStorage(SQLiteStorage):
+    """
+    SQLiteStorage over the compact layout written by :func:`compact`.
+
+    The code alphabet is read from the database, not taken from
+    ``PyTiny``, so keys always decode the way they were encoded. Hosts are
+    never deleted, so their IDs are cached per process.
+    """
+
+    def __init__(self, db_path: str = "pytiny.db", migrate: bool = True):
+        super().__init__(db_path, migrate)
+        self.load_layout()
+
+    def load_layout(self) -> None:
+        """
+        Read the code alphabet. Also called on a SQLiteStorage of a file
+        converted while it was open, right before it becomes a CompactStorage.
+        """
+        (alphabet,) = self._pool.get().execute(
+            "SELECT value FROM layout WHERE name = 'alphabet'"
+        ).fetchone()
+        self.keys = CodeKeys(alphabet)
+        self._host_ids: Dict[str, int] = {}
+        self._prefixes: Dict[int, str] = {}
+
+    def _hosts_for(self, urls: Iterable[str]) -> List[Tuple[int, Union[str, bytes]]]:
+        """Return (host, path) column values for urls, interning new hosts."""
+        parts = [split_url(url) for url in urls]
+        if any(prefix not in self._host_ids for prefix, _ in parts):
+            # Committed on its own, so a rolled back insert never leaves a
+            # cached ID behind that is not in the table
+            with self._pool.get() as conn:
+                _intern_hosts(conn, (prefix for prefix, _ in parts), self._host_ids)
+        return [(self._host_ids[prefix], pack_path(path)) for prefix, path in parts]
+
+    def _url(self, host: int, path: Union[str, bytes]) -> str:
+        prefix = self._prefixes.get(host)
+        if prefix is None:
+            (prefix,) = self._pool.get().execute(
+                "SELECT prefix FROM hosts WHERE id = ?", (host,)
+            ).fetchone()
+            self._prefixes[host] = prefix
+        return prefix + unpack_path(path)
+
+    def _full_row(self, row) -> FullRow:
+        # (code, host, path, created_at, expires_at, clicks, last_clicked,
+        #  url_hash, redirect_status, cache_ttl)
+        return (self.keys.code(row[0]), self._url(row[1], row[2])) + tuple(row[3:10])
+
+    def insert(self, row: NewRow, url_hash: Optional[int] = None,
+               redirect_status: Optional[int] = None,
+               cache_ttl: Optional[int] = None) -> bool:
+        """Insert a new link. Returns False if its short code is taken."""
+        code, long_url, created_at, expires_at = row
+        ((host, path),) = self._hosts_for([long_url])
+        try:
+            with self._pool.get() as conn:
+                conn.execute("""
+                    INSERT INTO links (code, host, path, created_at, expires_at,
+                                       url_hash, redirect_status, cache_ttl, seq)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?,
+                            (SELECT next_id FROM sequences WHERE name = 'links'))
+                """, (self.keys.key(code), host, path, created_at, expires_at,
+                      url_hash, redirect_status, cache_ttl))
+                conn.execute(
+                    "UPDATE sequences SET next_id = next_id + 1 WHERE name = 'links'")
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def insert_many(self, rows: Sequence[NewRow],
+                    url_hashes: Optional[Sequence[Optional[int]]] = None) -> List[int]:
+        """
+        Insert new links in one transaction.
+
+        Rows whose short code is already taken (or repeated within rows) are
+        skipped; everything else is inserted.
+
+        Returns:
+            List[int]: Indexes of the rows that were not inserted
+        """
+        columns = self._hosts_for(row[1] for row in rows)
+        conn = self._pool.get()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            clashes = self._clashing_codes(conn, [row[0] for row in rows])
+            skip = set(clashes)
+            hashes = url_hashes or [None] * len(rows)
+            (seq,) = conn.execute(
+                "SELECT next_id FROM sequences WHERE name = 'links'").fetchone()
+            values = []
+            for i, (code, _, created_at, expires_at) in enumerate(rows):
+                if i not in skip:
+                    values.append((self.keys.key(code),) + columns[i] +
+                                  (created_at, expires_at, hashes[i], seq + len(values)))
+            conn.executemany("""
+                INSERT INTO links (code, host, path, created_at, expires_at,
+                                   url_hash, seq)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, values)
+            conn.execute("UPDATE sequences SET next_id = ? WHERE name = 'links'",
+                         (seq + len(values),))
+            conn.commit()
+            return clashes
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+
+    def _clashing_codes(self, conn, codes: List[str]) -> List[int]:
+        """Return indexes of codes that are already taken or repeated."""
+        keys = [self.keys.key(code) for code in codes]
+        taken = set()
+        for start in range(0, len(keys), self.MAX_QUERY_PARAMS):
+            chunk = keys[start:start + self.MAX_QUERY_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            taken.update(row[0] for row in conn.execute(
+                f"SELECT code FROM links WHERE code IN ({placeholders})", chunk))
+
+        clashes = []
+        seen = set()
+        for i, key in enumerate(keys):
+            if key in taken or key in seen:
+                clashes.append(i)
+            seen.add(key)
+        return clashes
+
+    def get(self, short_code: str) -> Optional[Link]:
+        """Return (long_url, expires_at, created_at, redirect_status, cache_ttl) for a short code."""
+        row = self._pool.get().execute("""
+            SELECT host, path, expires_at, created_at, redirect_status, cache_ttl
+            FROM links
+            WHERE code = ?
+        """, (self.keys.key(short_code),)).fetchone()
+        if row is None:
+            return None
+        return (self._url(row[0], row[1]),) + row[2:]
+
+    def find_by_hashes(self, url_hashes: Sequence[int]) -> List[HashMatch]:
+        """Return every link whose dedup hash is one of url_hashes, newest first."""
+        conn = self._pool.get()
+        url_hashes = list(url_hashes)
+        matches = []
+        for start in range(0, len(url_hashes), self.MAX_QUERY_PARAMS):
+            chunk = url_hashes[start:start + self.MAX_QUERY_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            matches.extend(
+                (url_hash, self.keys.code(key), self._url(host, path), created_at, expires_at)
+                for url_hash, key, host, path, created_at, expires_at in conn.execute(f"""
+                    SELECT url_hash, code, host, path, created_at, expires_at
+                    FROM links
+                    WHERE url_hash IN ({placeholders})
+                    ORDER BY seq DESC
+                """, chunk))
+        return matches
+
+    def get_stats(self, short_code: str) -> Optional[StatsRow]:
+        """
+        Return (created_at, expires_at, clicks, last_clicked, redirect_status,
+        cache_ttl) for a short code.
+        """
+        return self._pool.get().execute("""
+            SELECT created_at, expires_at, clicks, last_clicked,
+                   redirect_status, cache_ttl
+            FROM links
+            WHERE code = ?
+        """, (self.keys.key(short_code),)).fetchone()
+
+    def incr_clicks(self, batch: ClickBatch) -> None:
+        """Apply click increments in a single transaction."""
+        with self._pool.get() as conn:
+            conn.executemany("""
+                UPDATE links
+                SET clicks = clicks + ?,
+                    last_clicked = MAX(COALESCE(last_clicked, 0), ?)
+                WHERE code = ?
+            """, [(count, last, self.keys.key(code))
+                  for code, (count, last) in batch.items()])
+
+    def delete(self, short_code: str) -> bool:
+        """Delete a link and its click history. Returns True if it existed."""
+        with self._pool.get() as conn:
+            cursor = conn.execute("DELETE FROM links WHERE code = ?",
+                                  (self.keys.key(short_code),))
+            conn.execute("DELETE FROM click_rollups WHERE short_code = ?", (short_code,))
+            if cursor.rowcount:
+                self._log_change(conn, short_code)
+        return cursor.rowcount > 0
+
+    def update_expiry(self, short_code: str, expires_at: Optional[int]) -> bool:
+        """Set a link's expiry. Returns True if it exists."""
+        with self._pool.get() as conn:
+            cursor = conn.execute("""
+                UPDATE links
+                SET expires_at = ?
+                WHERE code = ?
+            """, (expires_at, self.keys.key(short_code)))
+            if cursor.rowcount:
+                self._log_change(conn, short_code)
+        return cursor.rowcount > 0
+
+    def set_redirect_policy(self, short_code: str, redirect_status: Optional[int],
+                            cache_ttl: Optional[int]) -> bool:
+        """Set a link's redirect status and cache lifetime. Returns True if it exists."""
+        with self._pool.get() as conn:
+            cursor = conn.execute("""
+                UPDATE links
+                SET redirect_status = ?, cache_ttl = ?
+                WHERE code = ?
+            """, (redirect_status, cache_ttl, self.keys.key(short_code)))
+            if cursor.rowcount:
+                self._log_change(conn, short_code)
+        return cursor.rowcount > 0
+
+    def delete_expired(self, now: int, limit: int) -> int:
+        """Delete up to limit links expired at now, oldest first, with their click history."""
+        conn = self._pool.get()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            keys = [key for (key,) in conn.execute("""
+                SELECT code FROM links
+                WHERE expires_at IS NOT NULL
+                AND expires_at <= ?
+                ORDER BY expires_at
+                LIMIT ?
+            """, (now, limit))]
+            conn.executemany("DELETE FROM links WHERE code = ?", [(key,) for key in keys])
+            conn.executemany("DELETE FROM click_rollups WHERE short_code = ?",
+                             [(self.keys.code(key),) for key in keys])
+            conn.commit()
+            return len(keys)
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+
+    def oldest_expired(self, now: int) -> Optional[int]:
+        """Return the earliest expires_at among links expired at now."""
+        (oldest,) = self._pool.get().execute("""
+            SELECT MIN(expires_at) FROM links
+            WHERE expires_at IS NOT NULL
+            AND expires_at <= ?
+        """, (now,)).fetchone()
+        return oldest
+
+    def iter_expiring(self, after: int, until: int,
+                      batch_size: int = 1000) -> Iterator[Tuple[str, int]]:
+        """Yield (short_code, expires_at) for links expiring in (after, until]."""
+        last = (after, _LAST_KEY)
+        while True:
+            rows = self._pool.get().execute("""
+                SELECT expires_at, code FROM links
+                WHERE expires_at <= ? AND (expires_at, code) > (?, ?)
+                ORDER BY expires_at, code
+                LIMIT ?
+            """, (until,) + last + (batch_size,)).fetchall()
+            if not rows:
+                return
+            for expires_at, key in rows:
+                yield self.keys.code(key), expires_at
+            last = rows[-1]
+
+    def iter_rows(self, batch_size: int = 1000) -> Iterator[FullRow]:
+        """Yield every stored link, reading batch_size rows per query."""
+        cursor = None
+        while True:
+            rows, cursor = self.list_rows(cursor, batch_size)
+            yield from rows
+            if cursor is None:
+                return
+
+    def _page(self, conn, after: Optional[int], limit: int, now: int,
+              state: str) -> Tuple[List[FullRow], Optional[int]]:
+        rows = conn.execute(f"""
+            SELECT code, host, path, created_at, expires_at, clicks,
+                   last_clicked, url_hash, redirect_status, cache_ttl, seq
+            FROM links
+            WHERE seq > :after {self.STATE_FILTERS[state]}
+            ORDER BY seq
+            LIMIT :limit
+        """, {"after": after or 0, "now": now, "limit": limit}).fetchall()
+        cursor = rows[-1][10] if len(rows) == limit else None
+        return [self._full_row(row) for row in rows], cursor
+
+    def codes_since(self, watermark: Optional[int] = None,
+                    limit: int = 10000) -> Tuple[List[str], Optional[int]]:
+        """
+        Return up to limit short codes added after watermark.
+
+        seq is taken from the sequences table under SQLite's writer lock,
+        so like the row IDs of the default layout it becomes visible in
+        increasing order.
+        """
+        rows = self._pool.get().execute("""
+            SELECT seq, code FROM links
+            WHERE seq > ?
+            ORDER BY seq
+            LIMIT ?
+        """, (watermark or 0, limit)).fetchall()
+        if not rows:
+            return [], watermark
+        return [self.keys.code(row[1]) for row in rows], rows[-1][0]
+
+    def iter_sorted(self, batch_size: int = 1000) -> Iterator[Tuple]:
+        """
+        Yield (short_code,) + Link for every link, ordered by code.
+
+        Integer keys do not sort like the codes they stand for, so this is
+        one query sorted by the decoded code on a connection of its own,
+        with SQLite's sorter spilling to temporary files instead of memory.
+        """
+        conn = self._pool.connect()
+        try:
+            conn.execute("PRAGMA temp_store=FILE")
+            conn.create_function("short_code", 1, self.keys.code, deterministic=True)
+            rows = conn.execute("""
+                SELECT short_code(code), host, path, expires_at, created_at,
+                       redirect_status, cache_ttl
+                FROM links
+                ORDER BY short_code(code)
+            """)
+            while True:
+                batch = rows.fetchmany(batch_size)
+                if not batch:
+                    return
+                for row in batch:
+                    yield (row[0], self._url(row[1], row[2])) + row[3:]
+        finally:
+            conn.close()
+
+    def copy_rows(self, rows: Sequence[FullRow]) -> None:
+        """Insert or overwrite complete rows, e.g. while resharding."""
+        columns = self._hosts_for(row[1] for row in rows)
+        with self._pool.get() as conn:
+            (seq,) = conn.execute(
+                "SELECT next_id FROM sequences WHERE name = 'links'").fetchone()
+            _upsert(conn, [(seq + i, self.keys.key(row[0])) + columns[i] + tuple(row[2:])
+                           for i, row in enumerate(rows)])
+            conn.execute("UPDATE sequences SET next_id = ? WHERE name = 'links'",
+                         (seq + len(rows),))
+
+    def summary(self, now: int) -> dict:
+        """Return link, expired-link and click totals."""
+        urls, expired, clicks = self._pool.get().execute("""
+            SELECT COUNT(*),
+                   COUNT(CASE WHEN expires_at <= ? THEN 1 END),
+                   COALESCE(SUM(clicks), 0)
+            FROM links
+        """, (now,)).fetchone()
+        return {"urls": urls, "expired": expired, "clicks": clicks}
+
+
+def _upsert(conn: sqlite3.Connection, rows: Sequence[Tuple]) -> None:
+    """
+    Insert or overwrite (seq, code, host, path, created_at, expires_at,
+    clicks, last_clicked, url_hash, redirect_status, cache_ttl) rows,
+    keeping the seq of links that already exist.
+    """
+    conn.executemany("""
+        INSERT INTO links (seq, code, host, path, created_at, expires_at,
+                           clicks, last_clicked, url_hash,
+                           redirect_status, cache_ttl)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(code) DO UPDATE SET
+            host = excluded.host,
+            path = excluded.path,
+            created_at = excluded.created_at,
+            expires_at = excluded.expires_at,
+            clicks = excluded.clicks,
+            last_clicked = excluded.last_clicked,
+            url_hash = excluded.url_hash,
+            redirect_status = excluded.redirect_status,
+            cache_ttl = excluded.cache_ttl
+    """, rows)
+
+
+class _Converter:
+    """Copies rows of the default ``urls`` table into ``links``."""
+
+    def __init__(self, conn: sqlite3.Connection, keys: CodeKeys):
+        self.conn = conn
+        self.keys = keys
+        self.host_ids: Dict[str, int] = {}
+
+    def copy(self, rows: Sequence[Tuple]) -> None:
+        """Upsert (id, short_code, long_url, ...) rows of urls; id becomes seq."""
+        parts = [split_url(row[2]) for row in rows]
+        _intern_hosts(self.conn, (prefix for prefix, _ in parts), self.host_ids)
+        _upsert(self.conn, [
+            (row[0], self.keys.key(row[1]), self.host_ids[prefix], pack_path(path))
+            + tuple(row[3:])
+            for row, (prefix, path) in zip(rows, parts)
+        ])
+
+    def drain(self, batch_size: int) -> int:
+        """
+        Re-copy links changed since they were copied, as logged by the
+        triggers. Returns the number of log entries applied.
+        """
+        entries = self.conn.execute("""
+            SELECT id, short_code FROM compact_backlog
+            ORDER BY id
+            LIMIT ?
+        """, (batch_size,)).fetchall()
+        if not entries:
+            return 0
+        codes = sorted({code for _, code in entries})
+        found = []
+        for start in range(0, len(codes), SQLiteStorage.MAX_QUERY_PARAMS):
+            chunk = codes[start:start + SQLiteStorage.MAX_QUERY_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            found.extend(self.conn.execute(f"""
+                SELECT {_URL_COLUMNS} FROM urls
+                WHERE short_code IN ({placeholders})
+            """, chunk))
+        self.copy(found)
+        deleted = set(codes).difference(row[1] for row in found)
+        self.conn.executemany("DELETE FROM links WHERE code = ?",
+                              [(self.keys.key(code),) for code in deleted])
+        self.conn.execute("DELETE FROM compact_backlog WHERE id <= ?", (entries[-1][0],))
+        return len(entries)
+
+
+_URL_COLUMNS = """id, short_code, long_url, created_at, expires_at, clicks,
+                  last_clicked, url_hash, redirect_status, cache_ttl"""
+
+# Log every change to urls while it is being copied
+_TRIGGERS = {
+    "compact_insert": "AFTER INSERT ON urls BEGIN "
+                      "INSERT INTO compact_backlog (short_code) VALUES (NEW.short_code); END",
+    "compact_update": "AFTER UPDATE ON urls BEGIN "
+                      "INSERT INTO compact_backlog (short_code) VALUES (NEW.short_code); END",
+    "compact_delete": "AFTER DELETE ON urls BEGIN "
+                      "INSERT INTO compact_backlog (short_code) VALUES (OLD.short_code); END",
+}
+
+
+def compact(db_path: str, alphabet: str, batch_size: int = 5000,
+            progress=None) -> int:
+    """
+    Convert a SQLite database to the compact layout while it is in use.
+
+    Triggers on ``urls`` first log every insert, update and delete to a
+    backlog table. Links are then copied in batches, each in a short write
+    transaction, and the backlog is replayed until it is nearly empty.
+    The switch happens in one final transaction that replays the rest,
+    drops the triggers and the ``urls`` table and carries row IDs over as
+    ``seq``. Writers only ever wait for one batch, and an interrupted
+    conversion picks up where it left off when run again.
+
+    Processes that opened the database before the switch find ``urls``
+    gone on their next query and carry on as ``CompactStorage``.
+
+    Args:
+        db_path: SQLite file to convert
+        alphabet: Code alphabet, PyTiny.chars
+        batch_size: Rows copied per transaction
+        progress: Optional callable receiving the running row count
+
+    Returns:
+        int: Number of links copied, 0 if the file was already compact
+
+    Raises:
+        ValueError: If a conversion was started with a different alphabet
+    """
+    # Bring the default layout up to date first
+    SQLiteStorage(db_path).close()
+    keys = CodeKeys(alphabet)
+    conn = ConnectionPool(db_path).connect()
+    try:
+        if sqlite_layout(conn) == "compact":
+            return 0
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            _create_tables(conn)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS compact_backlog (
+                    id INTEGER PRIMARY KEY,
+                    short_code TEXT NOT NULL
+                )
+            """)
+            conn.execute("INSERT OR IGNORE INTO layout (name, value) VALUES ('alphabet', ?)",
+                         (alphabet,))
+            (stored,) = conn.execute(
+                "SELECT value FROM layout WHERE name = 'alphabet'").fetchone()
+            if stored != alphabet:
+                raise ValueError("conversion was started with a different code alphabet")
+            for name, body in _TRIGGERS.items():
+                conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+        converter = _Converter(conn, keys)
+        copied = 0
+        last_id = 0
+        while True:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                rows = conn.execute(f"""
+                    SELECT {_URL_COLUMNS} FROM urls
+                    WHERE id > ?
+                    ORDER BY id
+                    LIMIT ?
+                """, (last_id, batch_size)).fetchall()
+                converter.copy(rows)
+            if not rows:
+                break
+            copied += len(rows)
+            last_id = rows[-1][0]
+            if progress:
+                progress(copied)
+
+        # Catch up with writes made while copying, then switch under the
+        # writer lock once little is left
+        while True:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                if converter.drain(batch_size) < batch_size:
+                    while converter.drain(batch_size):
+                        pass
+                    _switch(conn)
+                    return copied
+    finally:
+        conn.close()
+
+
+def _switch(conn: sqlite3.Connection) -> None:
+    for name in _TRIGGERS:
+        conn.execute(f"DROP TRIGGER {name}")
+    conn.execute("DROP TABLE compact_backlog")
+    # AUTOINCREMENT's high-water mark, so seq never reuses a deleted row's ID
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'urls'").fetchone()
+    conn.execute("""
+        INSERT INTO sequences (name, next_id) VALUES ('links', ?)
+        ON CONFLICT(name) DO UPDATE SET next_id = MAX(next_id, excluded.next_id)
+    """, ((row[0] if row else 0) + 1,))
+    conn.execute("DROP TABLE urls")
+
@@ -9,7 +9,50 @@ class Config:
     BASE_URL: str = None  # Will be set based on environment
     DEBUG: bool = False
     SECRET_KEY: str = "your-secret-key-change-this"
-    DB_PATH: str = "pytiny.db"
+    ADMIN_TOKEN: str = None  # Bearer token for the /api admin endpoints, unset disables them
+    DB_PATH: str = "pytiny.db"  # SQLite file, ":memory:" or a redis:// URL
+    DB_SHARDS: str = None  # Comma-separated SQLite paths to hash-partition links across
+    CACHE_SIZE: int = 10000  # Links kept in each worker's lookup cache, 0 disables
+    CACHE_TTL: float = 60.0  # Bounds staleness across workers after deletes/updates
+    INVALIDATION_URL: str = None  # udp://<multicast group>:<port> or unix://<dir> bus for cache invalidations
+    INVALIDATION_HEARTBEAT: float = 1.0  # Seconds until a lost invalidation forces a cache flush
+    HOT_CODES: int = 0  # Most redirected codes tracked per worker, 0 disables
+    HOT_CODES_DIR: str = None  # Directory of saved hot codes that new workers warm their cache from
+    HOT_CODES_SAVE_INTERVAL: float = 60.0  # Seconds between saves of each worker's hot codes
+    CLICK_FLUSH_INTERVAL: float = 1.0  # Seconds between batched click writes, 0 = per redirect
+    CLICK_FLUSH_SIZE: int = 1000  # Buffered clicks that force an early flush
+    CODE_STRATEGY: str = "random"  # Short-code allocation: "random" or "counter"
+    CODE_SECRET: str = None  # Scrambles "counter" codes so they are not sequential
+    ASGI_DB_THREADS: int = 16  # Thread pool size for blocking DB calls in the ASGI app
+    ASGI_MAX_BODY: int = 64 * 1024  # Largest request body the ASGI app reads, larger get 413
+    QR_CACHE_BYTES: int = 16 * 1024 * 1024  # Memory bound for rendered QR images per worker
+    QR_PROCESSES: int = 1  # QR render processes per worker, 0 renders inline
+    QR_MAX_AGE: int = 86400  # Cache-Control max-age for QR images
+    REAPER_INTERVAL: float = 0  # Seconds between background expired-link reaps, 0 disables
+    REAPER_BATCH_SIZE: int = 500  # Rows deleted per reaper transaction
+    REAPER_HORIZON: int = 3600  # Seconds ahead the reaper schedules deletes at exact expiry, 0 disables
+    BLOOM_ERROR_RATE: float = 0.01  # False-positive rate of the unknown-code filter (not on Redis), 0 disables
+    BLOOM_REBUILD_INTERVAL: float = 3600  # Seconds between rebuilds that drop deleted codes
+    DEDUP: bool = False  # Reuse the live code of an identical URL and expiry on create
+    ANALYTICS_FLUSH_INTERVAL: float = 5.0  # Seconds between click rollup writes, 0 disables analytics
+    ANALYTICS_RETENTION: str = "minute=2,hour=90,day=0"  # Days kept per rollup resolution, 0 = forever
+    ANALYTICS_BUFFER_SIZE: int = 65536  # Redirect events buffered per worker before the oldest drop
+    METRICS_DIR: str = None  # Directory for per-worker metric files, aggregated by /metrics
+    SNAPSHOT_PATH: str = None  # Memory-mapped link snapshot consulted before the database
+    REDIRECT_STATUS: int = 302  # Redirect status for links without their own: 301, 302, 307 or 308
+    REDIRECT_CACHE_TTL: int = 0  # Seconds redirects may be cached by browsers and CDNs, 0 = no-store
+    RATE_LIMIT_CREATE: str = None  # Creates per client, e.g. "30/m"; unset = unlimited
+    RATE_LIMIT_CREATE_GLOBAL: str = None  # Creates across all clients, e.g. "200/s"
+    RATE_LIMIT_REDIRECT: str = None  # Redirects per client, e.g. "50/s"
+    RATE_LIMIT_REDIRECT_GLOBAL: str = None  # Redirects across all clients
+    RATE_LIMIT_PATH: str = None  # File sharing bucket state across workers, unset = per worker
+    RATE_LIMIT_CLIENTS: int = 65536  # Client buckets kept per limit file
+    SHED_WRITE_LATENCY: float = 0  # Average create seconds above which creates get 429, 0 disables
+    TRUSTED_PROXIES: int = 0  # Reverse proxies whose X-Forwarded-For names the client
+    SLOW_REQUEST_SECONDS: float = 0  # Requests at least this slow are logged with span timings, 0 disables
+    SLOW_LOG_SIZE: int = 1000  # Slow requests kept per worker for /api/slow
+    SLOW_LOG_PATH: str = None  # JSON-lines file all workers also append slow requests to
+    PROFILER: bool = False  # Enable the admin-only sampling profiler at /api/profile
 
     @classmethod
     def load(cls):
@@ -31,8 +74,137 @@ class Config:
             
         if os.getenv("PYTINY_SECRET_KEY"):
             config.SECRET_KEY = os.getenv("PYTINY_SECRET_KEY")
+
+        if os.getenv("PYTINY_ADMIN_TOKEN"):
+            config.ADMIN_TOKEN = os.getenv("PYTINY_ADMIN_TOKEN")
             
         if os.getenv("PYTINY_DB_PATH"):
             config.DB_PATH = os.getenv("PYTINY_DB_PATH")
+
+        if os.getenv("PYTINY_DB_SHARDS"):
+            config.DB_SHARDS = os.getenv("PYTINY_DB_SHARDS")
+
+        if os.getenv("PYTINY_CACHE_SIZE"):
+            config.CACHE_SIZE = int(os.getenv("PYTINY_CACHE_SIZE"))
+
+        if os.getenv("PYTINY_CACHE_TTL"):
+            config.CACHE_TTL = float(os.getenv("PYTINY_CACHE_TTL"))
+
+        if os.getenv("PYTINY_INVALIDATION_URL"):
+            config.INVALIDATION_URL = os.getenv("PYTINY_INVALIDATION_URL")
+
+        if os.getenv("PYTINY_INVALIDATION_HEARTBEAT"):
+            config.INVALIDATION_HEARTBEAT = float(os.getenv("PYTINY_INVALIDATION_HEARTBEAT"))
+
+        if os.getenv("PYTINY_HOT_CODES"):
+            config.HOT_CODES = int(os.getenv("PYTINY_HOT_CODES"))
+
+        if os.getenv("PYTINY_HOT_CODES_DIR"):
+            config.HOT_CODES_DIR = os.getenv("PYTINY_HOT_CODES_DIR")
+
+        if os.getenv("PYTINY_HOT_CODES_SAVE_INTERVAL"):
+            config.HOT_CODES_SAVE_INTERVAL = float(os.getenv("PYTINY_HOT_CODES_SAVE_INTERVAL"))
+
+        if os.getenv("PYTINY_CLICK_FLUSH_INTERVAL"):
+            config.CLICK_FLUSH_INTERVAL = float(os.getenv("PYTINY_CLICK_FLUSH_INTERVAL"))
+
+        if os.getenv("PYTINY_CLICK_FLUSH_SIZE"):
+            config.CLICK_FLUSH_SIZE = int(os.getenv("PYTINY_CLICK_FLUSH_SIZE"))
+
+        if os.getenv("PYTINY_CODE_STRATEGY"):
+            config.CODE_STRATEGY = os.getenv("PYTINY_CODE_STRATEGY")
+
+        if os.getenv("PYTINY_CODE_SECRET"):
+            config.CODE_SECRET = os.getenv("PYTINY_CODE_SECRET")
+
+        if os.getenv("PYTINY_ASGI_DB_THREADS"):
+            config.ASGI_DB_THREADS = int(os.getenv("PYTINY_ASGI_DB_THREADS"))
+
+        if os.getenv("PYTINY_ASGI_MAX_BODY"):
+            config.ASGI_MAX_BODY = int(os.getenv("PYTINY_ASGI_MAX_BODY"))
+
+        if os.getenv("PYTINY_QR_CACHE_BYTES"):
+            config.QR_CACHE_BYTES = int(os.getenv("PYTINY_QR_CACHE_BYTES"))
+
+        if os.getenv("PYTINY_QR_PROCESSES"):
+            config.QR_PROCESSES = int(os.getenv("PYTINY_QR_PROCESSES"))
+
+        if os.getenv("PYTINY_QR_MAX_AGE"):
+            config.QR_MAX_AGE = int(os.getenv("PYTINY_QR_MAX_AGE"))
+
+        if os.getenv("PYTINY_REAPER_INTERVAL"):
+            config.REAPER_INTERVAL = float(os.getenv("PYTINY_REAPER_INTERVAL"))
+
+        if os.getenv("PYTINY_REAPER_BATCH_SIZE"):
+            config.REAPER_BATCH_SIZE = int(os.getenv("PYTINY_REAPER_BATCH_SIZE"))
+
+        if os.getenv("PYTINY_REAPER_HORIZON"):
+            config.REAPER_HORIZON = int(os.getenv("PYTINY_REAPER_HORIZON"))
+
+        if os.getenv("PYTINY_BLOOM_ERROR_RATE"):
+            config.BLOOM_ERROR_RATE = float(os.getenv("PYTINY_BLOOM_ERROR_RATE"))
+
+        if os.getenv("PYTINY_BLOOM_REBUILD_INTERVAL"):
+            config.BLOOM_REBUILD_INTERVAL = float(os.getenv("PYTINY_BLOOM_REBUILD_INTERVAL"))
+
+        if os.getenv("PYTINY_DEDUP"):
+            config.DEDUP = os.getenv("PYTINY_DEDUP").lower() == "true"
+
+        if os.getenv("PYTINY_ANALYTICS_FLUSH_INTERVAL"):
+            config.ANALYTICS_FLUSH_INTERVAL = float(os.getenv("PYTINY_ANALYTICS_FLUSH_INTERVAL"))
+
+        if os.getenv("PYTINY_ANALYTICS_RETENTION"):
+            config.ANALYTICS_RETENTION = os.getenv("PYTINY_ANALYTICS_RETENTION")
+
+        if os.getenv("PYTINY_ANALYTICS_BUFFER_SIZE"):
+            config.ANALYTICS_BUFFER_SIZE = int(os.getenv("PYTINY_ANALYTICS_BUFFER_SIZE"))
+
+        if os.getenv("PYTINY_METRICS_DIR"):
+            config.METRICS_DIR = os.getenv("PYTINY_METRICS_DIR")
+
+        if os.getenv("PYTINY_SNAPSHOT_PATH"):
+            config.SNAPSHOT_PATH = os.getenv("PYTINY_SNAPSHOT_PATH")
+
+        if os.getenv("PYTINY_REDIRECT_STATUS"):
+            config.REDIRECT_STATUS = int(os.getenv("PYTINY_REDIRECT_STATUS"))
+
+        if os.getenv("PYTINY_REDIRECT_CACHE_TTL"):
+            config.REDIRECT_CACHE_TTL = int(os.getenv("PYTINY_REDIRECT_CACHE_TTL"))
+
+        if os.getenv("PYTINY_RATE_LIMIT_CREATE"):
+            config.RATE_LIMIT_CREATE = os.getenv("PYTINY_RATE_LIMIT_CREATE")
+
+        if os.getenv("PYTINY_RATE_LIMIT_CREATE_GLOBAL"):
+            config.RATE_LIMIT_CREATE_GLOBAL = os.getenv("PYTINY_RATE_LIMIT_CREATE_GLOBAL")
+
+        if os.getenv("PYTINY_RATE_LIMIT_REDIRECT"):
+            config.RATE_LIMIT_REDIRECT = os.getenv("PYTINY_RATE_LIMIT_REDIRECT")
+
+        if os.getenv("PYTINY_RATE_LIMIT_REDIRECT_GLOBAL"):
+            config.RATE_LIMIT_REDIRECT_GLOBAL = os.getenv("PYTINY_RATE_LIMIT_REDIRECT_GLOBAL")
+
+        if os.getenv("PYTINY_RATE_LIMIT_PATH"):
+            config.RATE_LIMIT_PATH = os.getenv("PYTINY_RATE_LIMIT_PATH")
+
+        if os.getenv("PYTINY_RATE_LIMIT_CLIENTS"):
+            config.RATE_LIMIT_CLIENTS = int(os.getenv("PYTINY_RATE_LIMIT_CLIENTS"))
+
+        if os.getenv("PYTINY_SHED_WRITE_LATENCY"):
+            config.SHED_WRITE_LATENCY = float(os.getenv("PYTINY_SHED_WRITE_LATENCY"))
+
+        if os.getenv("PYTINY_TRUSTED_PROXIES"):
+            config.TRUSTED_PROXIES = int(os.getenv("PYTINY_TRUSTED_PROXIES"))
+
+        if os.getenv("PYTINY_SLOW_REQUEST_SECONDS"):
+            config.SLOW_REQUEST_SECONDS = float(os.getenv("PYTINY_SLOW_REQUEST_SECONDS"))
+
+        if os.getenv("PYTINY_SLOW_LOG_SIZE"):
+            config.SLOW_LOG_SIZE = int(os.getenv("PYTINY_SLOW_LOG_SIZE"))
+
+        if os.getenv("PYTINY_SLOW_LOG_PATH"):
+            config.SLOW_LOG_PATH = os.getenv("PYTINY_SLOW_LOG_PATH")
+
+        if os.getenv("PYTINY_PROFILER"):
+            config.PROFILER = os.getenv("PYTINY_PROFILER").lower() == "true"
             
         return config
@@ -1,148 +1,784 @@
-import sqlite3
+import base64
+import json
 import string
-import random
 import time
-from datetime import datetime, timedelta
-from typing import Optional, Tuple
-from pathlib import Path
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from .allocators import make_allocator
+from .analytics import (DEFAULT_RETENTION, MAX_SERIES_BUCKETS, RESOLUTIONS, EventBuffer,
+                        parse_retention, resolution_for, rollup)
+from .bloom import CodeFilter
+from .cache import LRUCache
+from .clicks import ClickBuffer
+from .expiry import ExpiryWheel
+from .hot import HotCodes, load_top
+from .invalidation import Invalidator, open_bus
+from .metrics import (CACHE_LOOKUP_SECONDS, CREATES, DB_QUERY_SECONDS, DEDUP_HITS,
+                      EXPIRED_HITS, FILTER_REJECTS, NOT_FOUND, REDIRECTS, SNAPSHOT_HITS)
+from .redirects import Redirect, link_etag, max_age, validate_policy
+from .snapshot import SnapshotView
+from .storage import FullRow, Link, open_storage
+from .tracing import span
+from .utils import is_valid_code, sanitize_url, url_fingerprint
 
 class PyTiny:
     """
     A lightweight URL shortener implementation with optional link expiration.
     """
+
+    # Inserts attempted before giving up on finding a free short code
+    MAX_CODE_ATTEMPTS = 32
+
+    # Filters accepted by list_urls() and iter_urls()
+    URL_FILTERS = ("all", "active", "expired")
     
-    def __init__(self, db_path: str = "pytiny.db"):
-        self.db_path = db_path
-        self._init_db()
+    def __init__(self,
+                 db_path: str = "pytiny.db",
+                 cache_size: int = 10000,
+                 cache_ttl: Optional[float] = None,
+                 click_flush_interval: Optional[float] = 1.0,
+                 click_flush_size: int = 1000,
+                 code_strategy: str = "random",
+                 code_secret: Optional[str] = None,
+                 storage=None,
+                 bloom_error_rate: Optional[float] = None,
+                 bloom_rebuild_interval: Optional[float] = 3600.0,
+                 dedup: bool = False,
+                 analytics_flush_interval: Optional[float] = None,
+                 analytics_retention: str = DEFAULT_RETENTION,
+                 analytics_buffer_size: int = 65536,
+                 snapshot_path: Optional[str] = None,
+                 redirect_status: int = 302,
+                 redirect_cache_ttl: int = 0,
+                 invalidation_bus=None,
+                 invalidation_heartbeat: float = 1.0,
+                 hot_codes: int = 0,
+                 hot_codes_dir: Optional[str] = None,
+                 hot_codes_save_interval: float = 60.0):
+        """
+        Args:
+            db_path: Path to the SQLite database file, ":memory:" for
+                in-process storage or a redis:// URL
+            cache_size: Maximum number of links kept in the in-process
+                lookup cache, 0 to disable it
+            cache_ttl: Optional upper bound in seconds on how long a link is
+                served from the cache without re-reading the database
+            click_flush_interval: Seconds between batched writes of click
+                statistics, None to update them synchronously per redirect
+            click_flush_size: Number of buffered clicks that forces a flush
+            code_strategy: Short-code allocation strategy, "random" or
+                "counter"
+            code_secret: Key used by the "counter" strategy to scramble
+                codes so they are not sequential
+            storage: Storage backend to use instead of the one named by
+                db_path, e.g. a ShardedStorage
+            bloom_error_rate: False-positive rate of a Bloom filter of
+                existing codes that answers lookups of unknown codes without
+                a database query, None to disable it. Backends without a
+                change_token() get none, as trusting a miss would take a
+                round trip of its own
+            bloom_rebuild_interval: Seconds between full rebuilds of the
+                Bloom filter, dropping deleted codes
+            dedup: Return the existing live code when the same URL is
+                shortened again with the same expiry
+            analytics_flush_interval: Seconds between writes of buffered
+                redirect events to the time-bucketed click rollups, None to
+                disable click analytics
+            analytics_retention: Rollup resolutions to keep and for how
+                many days, e.g. "minute=2,hour=90,day=0" (0 keeps forever)
+            analytics_buffer_size: Redirect events buffered in memory
+                before the oldest are dropped
+            snapshot_path: Snapshot file built by ``pytiny snapshot build``
+                to resolve cache misses from before querying the database
+            redirect_status: HTTP status of redirects for links without
+                their own, one of 301, 302, 307 or 308
+            redirect_cache_ttl: Seconds browsers and CDNs may cache
+                redirects of links without their own cache TTL, 0 to forbid
+                caching
+            invalidation_bus: Bus from ``invalidation.open_bus()`` to publish
+                deleted and changed codes on and to drop the codes other
+                workers publish from the lookup cache
+            invalidation_heartbeat: Seconds between heartbeats on the bus,
+                which bounds how long a lost invalidation goes unnoticed
+            hot_codes: Number of most redirected codes to track, 0 to
+                disable tracking
+            hot_codes_dir: Directory every worker saves its most redirected
+                codes to, and reads them from to warm its cache in
+                ``prewarm()``
+            hot_codes_save_interval: Seconds between saves to hot_codes_dir
+        """
+        validate_policy(redirect_status, redirect_cache_ttl)
+        self.storage = storage if storage is not None else open_storage(db_path)
+        self.db_path = self.storage.db_path
+        self.dedup = dedup
+        self.redirect_status = redirect_status
+        self.redirect_cache_ttl = redirect_cache_ttl
+        self._cache = LRUCache(cache_size, cache_ttl) if cache_size > 0 else None
+        self._invalidator = None
+        if invalidation_bus is not None:
+            self._invalidator = Invalidator(self._cache, invalidation_bus,
+                                            invalidation_heartbeat)
+        self._clicks = None
+        if click_flush_interval is not None:
+            self._clicks = ClickBuffer(self._flush_clicks,
+                                       click_flush_interval,
+                                       click_flush_size)
+        self._retention = parse_retention(analytics_retention)
+        self._analytics = None
+        if analytics_flush_interval is not None:
+            self._analytics = EventBuffer(self._flush_analytics,
+                                          analytics_buffer_size,
+                                          analytics_flush_interval)
+        self._filter = None
+        if bloom_error_rate and self.storage.change_token() is not None:
+            self._filter = CodeFilter(self.storage, bloom_error_rate,
+                                      bloom_rebuild_interval)
+        self._snapshot = None
+        if snapshot_path:
+            self._snapshot = SnapshotView(self.storage, snapshot_path)
+        self._wheel: Optional[ExpiryWheel] = None
+        self._hot = None
+        if hot_codes > 0:
+            self._hot = HotCodes(hot_codes, hot_codes_dir, hot_codes_save_interval)
         
         # Characters to use for short URLs (excluding similar looking ones)
         self.chars = string.ascii_letters + string.digits
         self.chars = self.chars.replace('1', '').replace('l', '').replace('I', '')
         self.chars = self.chars.replace('0', '').replace('O', '').replace('o', '')
+
+        options = {"secret": code_secret} if code_strategy == "counter" else {}
+        self._allocator = make_allocator(code_strategy, self.chars,
+                                         self.storage.reserve_ids, **options)
         
-    def _init_db(self) -> None:
-        """Initialize SQLite database with required schema."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS urls (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    short_code TEXT UNIQUE NOT NULL,
-                    long_url TEXT NOT NULL,
-                    created_at INTEGER NOT NULL,
-                    expires_at INTEGER,
-                    clicks INTEGER DEFAULT 0,
-                    last_clicked INTEGER
-                )
-            """)
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_short_code ON urls(short_code)")
-    
-    def _generate_code(self, length: int = 6) -> str:
-        """Generate a unique short code."""
-        while True:
-            code = ''.join(random.choices(self.chars, k=length))
-            # Check if code already exists
-            with sqlite3.connect(self.db_path) as conn:
-                exists = conn.execute(
-                    "SELECT 1 FROM urls WHERE short_code = ?", (code,)
-                ).fetchone()
-                if not exists:
-                    return code
+    @classmethod
+    def from_config(cls, config) -> "PyTiny":
+        """Build a PyTiny from a Config."""
+        return cls(config.DB_PATH,
+                   cache_size=config.CACHE_SIZE,
+                   cache_ttl=config.CACHE_TTL,
+                   click_flush_interval=config.CLICK_FLUSH_INTERVAL or None,
+                   click_flush_size=config.CLICK_FLUSH_SIZE,
+                   code_strategy=config.CODE_STRATEGY,
+                   code_secret=config.CODE_SECRET,
+                   storage=open_storage(config.DB_PATH, config.DB_SHARDS),
+                   bloom_error_rate=config.BLOOM_ERROR_RATE or None,
+                   bloom_rebuild_interval=config.BLOOM_REBUILD_INTERVAL or None,
+                   dedup=config.DEDUP,
+                   analytics_flush_interval=config.ANALYTICS_FLUSH_INTERVAL or None,
+                   analytics_retention=config.ANALYTICS_RETENTION,
+                   analytics_buffer_size=config.ANALYTICS_BUFFER_SIZE,
+                   snapshot_path=config.SNAPSHOT_PATH,
+                   redirect_status=config.REDIRECT_STATUS,
+                   redirect_cache_ttl=config.REDIRECT_CACHE_TTL,
+                   invalidation_bus=(open_bus(config.INVALIDATION_URL)
+                                     if config.INVALIDATION_URL else None),
+                   invalidation_heartbeat=config.INVALIDATION_HEARTBEAT,
+                   hot_codes=config.HOT_CODES,
+                   hot_codes_dir=config.HOT_CODES_DIR,
+                   hot_codes_save_interval=config.HOT_CODES_SAVE_INTERVAL)
     
     def create_short_url(self, 
                         long_url: str, 
-                        expire_hours: Optional[int] = None) -> str:
+                        expire_hours: Optional[int] = None,
+                        redirect_status: Optional[int] = None,
+                        cache_ttl: Optional[int] = None) -> str:
         """
         Create a new short URL.
+
+        In dedup mode an existing live code for the same URL and expiry is
+        returned instead, if at least half of its lifetime is left. Links
+        created with their own redirect policy are never deduplicated.
         
         Args:
             long_url: The URL to shorten
             expire_hours: Optional expiration time in hours
+            redirect_status: Optional redirect status for this link
+            cache_ttl: Optional seconds its redirect may be cached, 0 to
+                opt out of caching
             
         Returns:
             str: The generated short code
         """
-        code = self._generate_code()
+        validate_policy(redirect_status, cache_ttl)
         now = int(time.time())
         expires_at = None
         
         if expire_hours:
             expires_at = now + (expire_hours * 3600)
-            
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                INSERT INTO urls (short_code, long_url, created_at, expires_at)
-                VALUES (?, ?, ?, ?)
-            """, (code, long_url, now, expires_at))
-            
-        return code
+
+        url_hash = None
+        if self.dedup and redirect_status is None and cache_ttl is None:
+            key = self._dedup_key(long_url, expire_hours)
+            url_hash = key[1]
+            existing = self._find_duplicates([key], now)
+            if existing[0] is not None:
+                return existing[0]
+
+        for _ in range(self.MAX_CODE_ATTEMPTS):
+            code = self._allocator.next_code()
+            start = time.perf_counter()
+            with span("db.insert"):
+                inserted = self.storage.insert((code, long_url, now, expires_at), url_hash,
+                                               redirect_status, cache_ttl)
+            DB_QUERY_SECONDS["insert"].observe(time.perf_counter() - start)
+            if inserted:
+                CREATES.inc()
+                if self._filter is not None:
+                    self._filter.add(code)
+                if self._wheel is not None and expires_at is not None:
+                    self._wheel.schedule(code, expires_at)
+                return code
+            # Code already taken, let the allocator adapt and retry
+            self._allocator.collision(code)
+
+        raise RuntimeError("Could not allocate a unique short code")
     
-    def get_long_url(self, short_code: str) -> Optional[str]:
+    def create_short_urls_bulk(self,
+                               urls: Iterable[Union[str, Tuple[str, Optional[int]]]],
+                               expire_hours: Optional[int] = None,
+                               batch_size: int = 5000) -> Iterator[Tuple[str, str]]:
+        """
+        Create short URLs for many long URLs.
+
+        Input is consumed lazily, batch_size items at a time. Each batch gets
+        its codes allocated up front and is inserted with a single
+        executemany in one transaction, so memory use stays constant no
+        matter how many URLs are streamed through.
+
+        Args:
+            urls: Long URLs, or (long_url, expire_hours) pairs
+            expire_hours: Expiration for items that don't carry their own
+            batch_size: Number of URLs inserted per transaction
+
+        Yields:
+            Tuple[str, str]: (long_url, short_code) for every URL created
+        """
+        items = iter(urls)
+        while True:
+            batch = list(islice(items, batch_size))
+            if not batch:
+                return
+
+            now = int(time.time())
+            rows = []
+            keys = []
+            for item in batch:
+                if isinstance(item, str):
+                    long_url, hours = item, expire_hours
+                else:
+                    long_url, hours = item
+                expires_at = now + (hours * 3600) if hours else None
+                rows.append((long_url, now, expires_at))
+                if self.dedup:
+                    keys.append(self._dedup_key(long_url, hours))
+
+            if not self.dedup:
+                codes = self._insert_batch(rows)
+            else:
+                codes = self._find_duplicates(keys, now)
+                # Repeats within the batch share the first occurrence's code
+                first: Dict[Tuple[str, int], int] = {}
+                new = []
+                for i, key in enumerate(keys):
+                    if codes[i] is None and first.setdefault(key, i) == i:
+                        new.append(i)
+                inserted = self._insert_batch([rows[i] for i in new],
+                                              [keys[i][1] for i in new])
+                for i, code in zip(new, inserted):
+                    codes[i] = code
+                for i, key in enumerate(keys):
+                    if codes[i] is None:
+                        codes[i] = codes[first[key]]
+
+            for (long_url, _, _), code in zip(rows, codes):
+                yield long_url, code
+
+    def _dedup_key(self, long_url: str, expire_hours: Optional[int]) -> Tuple[str, int]:
+        """Return (normalized URL, url_hash) identifying a link for dedup."""
+        normalized = sanitize_url(long_url) or long_url.strip()
+        return normalized, url_fingerprint(normalized, expire_hours)
+
+    def _find_duplicates(self, keys: List[Tuple[str, int]], now: int) -> List[Optional[str]]:
+        """Return a reusable existing code, or None, for each dedup key."""
+        matches: Dict[Tuple[str, int], str] = {}
+        for url_hash, code, long_url, created_at, expires_at in \
+                self.storage.find_by_hashes({key[1] for key in keys}):
+            # Hand out links with at least half their lifetime left only
+            if expires_at is not None and (expires_at - now) * 2 < expires_at - created_at:
+                continue
+            # The hash is only an index; the URL itself must match
+            key = ((sanitize_url(long_url) or long_url.strip()), url_hash)
+            matches.setdefault(key, code)
+
+        codes = [matches.get(key) for key in keys]
+        DEDUP_HITS.inc(sum(code is not None for code in codes))
+        return codes
+
+    def _insert_batch(self, rows: List[Tuple[str, int, Optional[int]]],
+                      url_hashes: Optional[List[int]] = None) -> List[str]:
+        """Insert (long_url, created_at, expires_at) rows. Returns their codes."""
+        if not rows:
+            return []
+        codes = self._allocator.next_codes(len(rows))
+        pending = list(range(len(rows)))
+
+        for _ in range(self.MAX_CODE_ATTEMPTS):
+            start = time.perf_counter()
+            with span("db.insert_many"):
+                skipped = self.storage.insert_many(
+                    [(codes[i],) + rows[i] for i in pending],
+                    [url_hashes[i] for i in pending] if url_hashes else None,
+                )
+            DB_QUERY_SECONDS["insert_many"].observe(time.perf_counter() - start)
+            CREATES.inc(len(pending) - len(skipped))
+            if self._filter is not None or self._wheel is not None:
+                skip = set(skipped)
+                for j, i in enumerate(pending):
+                    if j in skip:
+                        continue
+                    if self._filter is not None:
+                        self._filter.add(codes[i])
+                    if self._wheel is not None and rows[i][2] is not None:
+                        self._wheel.schedule(codes[i], rows[i][2])
+            if not skipped:
+                return codes
+
+            # Only rows whose code was taken still need inserting
+            pending = [pending[j] for j in skipped]
+            for i in pending:
+                self._allocator.collision(codes[i])
+                codes[i] = self._allocator.next_code()
+
+        raise RuntimeError("Could not allocate unique short codes")
+
+    def get_long_url(self,
+                     short_code: str,
+                     referrer: Optional[str] = None,
+                     user_agent: Optional[str] = None) -> Optional[str]:
         """
         Retrieve the original URL and update click statistics.
         Returns None if code doesn't exist or has expired.
+
+        The referrer and user_agent of the redirect request, if given, are
+        recorded in the click analytics.
+        """
+        link = self._resolve(short_code, int(time.time()), referrer, user_agent)
+        return link[0] if link is not None else None
+
+    def get_redirect(self,
+                     short_code: str,
+                     referrer: Optional[str] = None,
+                     user_agent: Optional[str] = None) -> Optional[Redirect]:
+        """
+        Resolve a short code like get_long_url, along with how to redirect.
+
+        Returns:
+            Optional[Redirect]: (status, long_url, max_age, etag,
+            last_modified) or None if the code doesn't exist or has expired
         """
         now = int(time.time())
+        link = self._resolve(short_code, now, referrer, user_agent)
+        if link is None:
+            return None
+
+        long_url, expires_at, created_at, status, cache_ttl = link
+        status = status or self.redirect_status
+        if cache_ttl is None:
+            cache_ttl = self.redirect_cache_ttl
+        return (status, long_url, max_age(expires_at, cache_ttl, now),
+                link_etag(long_url, status), created_at)
+
+    def _resolve(self, short_code: str, now: int,
+                 referrer: Optional[str], user_agent: Optional[str]) -> Optional[Link]:
+        """Look up a live link and count the click."""
+        link = self._lookup(short_code, now)
+        if link is None:
+            NOT_FOUND.inc()
+            return None
         
-        with sqlite3.connect(self.db_path) as conn:
-            result = conn.execute("""
-                SELECT long_url, expires_at 
-                FROM urls 
-                WHERE short_code = ?
-            """, (short_code,)).fetchone()
+        # Update click statistics only if not expired
+        self._record_click(short_code, now)
+        if self._hot is not None:
+            self._hot.record(short_code)
+        if self._analytics is not None:
+            self._analytics.record((now, short_code, referrer, user_agent))
+        REDIRECTS.inc()
+            
+        return link
+
+    def is_active(self, short_code: str) -> bool:
+        """Check whether a short code exists and has not expired, without counting a click."""
+        return self._lookup(short_code, int(time.time())) is not None
+
+    def _lookup(self, short_code: str, now: int) -> Optional[Link]:
+        """Resolve a live short code through the cache, snapshot, then the DB."""
+        if not is_valid_code(short_code):
+            # e.g. favicon.ico or a scanner probing paths
+            return None
+
+        cached = None
+        if self._cache is not None:
+            start = time.perf_counter()
+            cached = self._cache.get(short_code, now)
+            CACHE_LOOKUP_SECONDS.observe(time.perf_counter() - start)
+
+        if cached is not None:
+            result = cached
+        else:
+            result = None
+            if self._cache is not None:
+                if self._invalidator is not None:
+                    self._invalidator.listen()
+                generation = self._cache.generation
+            if self._snapshot is not None:
+                result = self._snapshot.get(short_code)
+
+            if result is not None:
+                SNAPSHOT_HITS.inc()
+            else:
+                # Codes newer than the snapshot, or changed since it was built
+                if self._filter is not None and not self._filter.might_contain(short_code):
+                    FILTER_REJECTS.inc()
+                    return None
+
+                start = time.perf_counter()
+                with span("db.lookup"):
+                    result = self.storage.get(short_code)
+                DB_QUERY_SECONDS["lookup"].observe(time.perf_counter() - start)
             
             if not result:
                 return None
                 
-            long_url, expires_at = result
-            
-            # Check expiration more strictly
-            if expires_at is not None and expires_at <= now:
-                # URL has expired
-                return None
-            
-            # Update click statistics only if not expired
-            conn.execute("""
-                UPDATE urls 
-                SET clicks = clicks + 1,
-                    last_clicked = ?
-                WHERE short_code = ?
-            """, (now, short_code))
-            
-        return long_url
+        expires_at = result[1]
+        
+        # Check expiration more strictly
+        if expires_at is not None and expires_at <= now:
+            # URL has expired
+            EXPIRED_HITS.inc()
+            return None
+
+        if cached is None and self._cache is not None:
+            self._cache.set(short_code, result, expires_at, now, generation)
+
+        return result
+
+    def _record_click(self, short_code: str, now: int) -> None:
+        """Count a click, buffered unless write-behind is disabled."""
+        if self._clicks is not None:
+            self._clicks.record(short_code, now)
+            return
+
+        self._flush_clicks({short_code: (1, now)})
+
+    def _flush_clicks(self, batch: dict) -> None:
+        """Apply buffered click counts in a single transaction."""
+        start = time.perf_counter()
+        with span("db.clicks"):
+            self.storage.incr_clicks(batch)
+        DB_QUERY_SECONDS["clicks"].observe(time.perf_counter() - start)
+
+    def flush_clicks(self) -> int:
+        """Write buffered click statistics now. Returns codes flushed."""
+        if self._analytics is not None:
+            self._analytics.flush()
+        if self._clicks is None:
+            return 0
+        return self._clicks.flush()
+
+    def _flush_analytics(self, events: list) -> None:
+        """Add buffered redirect events to the click rollups."""
+        start = time.perf_counter()
+        self.storage.add_rollups(rollup(events, list(self._retention)))
+        DB_QUERY_SECONDS["rollups"].observe(time.perf_counter() - start)
+
+    def _covers(self, resolution: str, range_seconds: int) -> bool:
+        """Check that a series over range_seconds at resolution is kept and small enough."""
+        days = self._retention[resolution]
+        if days and range_seconds > days * 86400:
+            return False
+        return -(-range_seconds // RESOLUTIONS[resolution]) <= MAX_SERIES_BUCKETS
+
+    def get_click_series(self,
+                         short_code: str,
+                         range_seconds: int = 86400,
+                         resolution: Optional[str] = None,
+                         now: Optional[int] = None) -> Optional[dict]:
+        """
+        Get clicks over time for a short URL from the analytics rollups.
+
+        Args:
+            short_code: The short code to report on
+            range_seconds: How far back the series reaches
+            resolution: "minute", "hour" or "day"; defaults to the finest
+                one suited to the range that is retained for all of it. A
+                resolution that is not retained falls back to the next
+                coarser one.
+            now: Reference time, defaults to the current time
+
+        Returns:
+            Optional[dict]: Total clicks, a per-bucket series and click
+            counts by referrer host and user-agent class, or None if the
+            code doesn't exist
+
+        Raises:
+            ValueError: If the range needs more than MAX_SERIES_BUCKETS
+                buckets, or reaches further back than the resolution's
+                retention
+        """
+        if self.storage.get(short_code) is None:
+            return None
+        if now is None:
+            now = int(time.time())
+
+        names = list(RESOLUTIONS)
+        requested = resolution
+        resolution = resolution or resolution_for(range_seconds)
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {resolution}")
+        retained = [name for name in names[names.index(resolution):]
+                    if name in self._retention]
+        if not retained:
+            raise ValueError(f"No analytics retained at {resolution} resolution or coarser")
+        if requested is None:
+            # Go coarser rather than pad the series with buckets not kept
+            fits = [name for name in retained if self._covers(name, range_seconds)]
+            retained = fits or retained[-1:]
+        resolution = retained[0]
+        if not self._covers(resolution, range_seconds):
+            raise ValueError(f"Range reaches past the {self._retention[resolution]} days "
+                             f"of {resolution} analytics retained, or needs more than "
+                             f"{MAX_SERIES_BUCKETS} buckets")
+
+        if self._analytics is not None:
+            self._analytics.flush()
+
+        size = RESOLUTIONS[resolution]
+        end = now - now % size + size
+        start = end - -(-range_seconds // size) * size
+        counts = {bucket: 0 for bucket in range(start, end, size)}
+        referrers: Dict[str, int] = {}
+        agents: Dict[str, int] = {}
+        for bucket, referrer, agent, clicks in \
+                self.storage.get_rollups(short_code, size, start, end):
+            counts[bucket] += clicks
+            referrers[referrer] = referrers.get(referrer, 0) + clicks
+            agents[agent] = agents.get(agent, 0) + clicks
+
+        return {
+            "resolution": resolution,
+            "start": datetime.fromtimestamp(start),
+            "end": datetime.fromtimestamp(end),
+            "clicks": sum(counts.values()),
+            "series": [{"time": datetime.fromtimestamp(bucket), "clicks": clicks}
+                       for bucket, clicks in counts.items()],
+            "referrers": referrers,
+            "agents": agents,
+        }
+
+    def prune_analytics(self, now: Optional[int] = None, batch_size: int = 1000) -> int:
+        """
+        Delete click rollups past their resolution's retention, in batches.
+
+        Rollups at resolutions that are no longer retained are removed
+        entirely. Returns the number of rows deleted.
+        """
+        if now is None:
+            now = int(time.time())
+
+        deleted = 0
+        for name, size in RESOLUTIONS.items():
+            days = self._retention.get(name)
+            if days == 0:
+                continue
+            before = now - days * 86400 if days is not None else now + size
+            while True:
+                batch = self.storage.prune_rollups(size, before, batch_size)
+                deleted += batch
+                if batch < batch_size:
+                    break
+        return deleted
     
     def get_stats(self, short_code: str) -> Optional[dict]:
         """Get usage statistics for a short URL."""
-        with sqlite3.connect(self.db_path) as conn:
-            result = conn.execute("""
-                SELECT created_at, expires_at, clicks, last_clicked
-                FROM urls
-                WHERE short_code = ?
-            """, (short_code,)).fetchone()
-            
-            if not result:
-                return None
-                
-            created_at, expires_at, clicks, last_clicked = result
+        start = time.perf_counter()
+        with span("db.stats"):
+            result = self.storage.get_stats(short_code)
+        DB_QUERY_SECONDS["stats"].observe(time.perf_counter() - start)
+        
+        if not result:
+            return None
             
-            return {
-                "created_at": datetime.fromtimestamp(created_at),
-                "expires_at": datetime.fromtimestamp(expires_at) if expires_at else None,
-                "clicks": clicks,
-                "last_clicked": datetime.fromtimestamp(last_clicked) if last_clicked else None
-            }
+        created_at, expires_at, clicks, last_clicked, redirect_status, cache_ttl = result
+
+        # Merge in clicks that have not been flushed yet
+        pending = None
+        if self._clicks is not None:
+            pending = self._clicks.pending(short_code)
+        if pending:
+            clicks += pending[0]
+            last_clicked = max(last_clicked or 0, pending[1])
+        
+        return {
+            "created_at": datetime.fromtimestamp(created_at),
+            "expires_at": datetime.fromtimestamp(expires_at) if expires_at else None,
+            "clicks": clicks,
+            "last_clicked": datetime.fromtimestamp(last_clicked) if last_clicked else None,
+            "redirect_status": redirect_status or self.redirect_status,
+            "cache_ttl": self.redirect_cache_ttl if cache_ttl is None else cache_ttl
+        }
+
+    def list_urls(self,
+                  cursor: Optional[str] = None,
+                  limit: int = 100,
+                  filter: str = "all") -> Tuple[List[dict], Optional[str]]:
+        """
+        Return one page of links, oldest first.
+
+        Pages are keyset-paginated, so fetching a page costs the same no
+        matter how deep into the listing it is, and links created or
+        deleted between requests never shift later pages.
+
+        Args:
+            cursor: next_cursor of the previous page, None for the first
+            limit: Maximum number of links on the page
+            filter: "all", "active" or "expired"
+
+        Returns:
+            Tuple[List[dict], Optional[str]]: The links and the cursor of
+            the next page, None after the last one
+
+        Raises:
+            ValueError: For an unknown filter or a malformed cursor
+        """
+        if filter not in self.URL_FILTERS:
+            raise ValueError(f"Filter must be one of {self.URL_FILTERS}")
+        if limit < 1:
+            raise ValueError("Limit must be positive")
+
+        rows, after = self.storage.list_rows(self._decode_cursor(cursor), limit,
+                                             int(time.time()), filter)
+        return [self._url_record(row) for row in rows], self._encode_cursor(after)
+
+    def iter_urls(self, filter: str = "all", batch_size: int = 1000) -> Iterator[dict]:
+        """
+        Yield every link, reading batch_size rows at a time.
+
+        Memory use stays constant however many links there are. On SQLite
+        the rows come from one consistent read snapshot that does not
+        block writers, so redirects and creates continue during an export.
+
+        Args:
+            filter: "all", "active" or "expired"
+            batch_size: Rows read per query
+        """
+        if filter not in self.URL_FILTERS:
+            raise ValueError(f"Filter must be one of {self.URL_FILTERS}")
+
+        for row in self.storage.export_rows(batch_size, int(time.time()), filter):
+            yield self._url_record(row)
+
+    def _url_record(self, row: FullRow) -> dict:
+        """Turn a storage row into the dict returned by list_urls() and iter_urls()."""
+        (short_code, long_url, created_at, expires_at, clicks, last_clicked, _,
+         redirect_status, cache_ttl) = row
+        pending = self._clicks.pending(short_code) if self._clicks is not None else None
+        if pending:
+            clicks += pending[0]
+            last_clicked = max(last_clicked or 0, pending[1])
+        return {
+            "short_code": short_code,
+            "long_url": long_url,
+            "created_at": created_at,
+            "expires_at": expires_at,
+            "clicks": clicks,
+            "last_clicked": last_clicked,
+            "redirect_status": redirect_status,
+            "cache_ttl": cache_ttl,
+        }
+
+    @staticmethod
+    def _encode_cursor(after) -> Optional[str]:
+        """Wrap a storage cursor into an opaque URL-safe token."""
+        if after is None:
+            return None
+        data = json.dumps(after, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+    def _decode_cursor(self, cursor: Optional[str]):
+        """Unwrap a token made by _encode_cursor(), checked against the backend."""
+        if not cursor:
+            return None
+        try:
+            after = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        except ValueError:
+            raise ValueError("Invalid cursor") from None
+        return self.storage.check_cursor(after)
+
+    def get_summary(self) -> dict:
+        """Get link and click totals, broken down per shard when sharded."""
+        self.flush_clicks()
+        return self.storage.summary(int(time.time()))
     
-    def cleanup_expired(self) -> int:
+    def cleanup_expired(self, batch_size: int = 1000) -> int:
         """Remove expired URLs from database. Returns number of URLs removed."""
         now = int(time.time())
+        removed = 0
         
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("""
-                DELETE FROM urls
-                WHERE expires_at IS NOT NULL
-                AND expires_at <= ?
-            """, (now,))
-            
-        return cursor.rowcount
+        # Delete in bounded batches so the write lock is released regularly
+        while True:
+            deleted = self.delete_expired_batch(batch_size, now)
+            removed += deleted
+            if deleted < batch_size:
+                return removed
+
+    def delete_expired_batch(self, limit: int, now: Optional[int] = None) -> int:
+        """
+        Delete up to limit expired URLs, oldest expiry first.
+
+        Args:
+            limit: Maximum number of rows to delete
+            now: Reference time, defaults to the current time
+
+        Returns:
+            int: Number of URLs removed
+        """
+        if now is None:
+            now = int(time.time())
+
+        return self.storage.delete_expired(now, limit)
+
+    def track_expiry(self, horizon: int = 3600) -> ExpiryWheel:
+        """
+        Keep links expiring within horizon seconds on a timing wheel.
+
+        Links created or given a new expiry by this instance are scheduled
+        on it directly; the caller fills it from storage with
+        ``ExpiryWheel.load()``. Used by the background reaper to delete
+        links right as they expire.
+        """
+        if self._wheel is None:
+            self._wheel = ExpiryWheel(horizon)
+        return self._wheel
+
+    def expire_due(self, now: Optional[int] = None) -> List[str]:
+        """Fire the expiry wheel and drop the expired links from the cache."""
+        if self._wheel is None:
+            return []
+        if now is None:
+            now = int(time.time())
+
+        expired = self._wheel.advance(now)
+        self._invalidate(expired)
+        return expired
+
+    def expired_lag(self, now: Optional[int] = None) -> int:
+        """Seconds since the oldest expired URL that is still stored expired."""
+        if now is None:
+            now = int(time.time())
+
+        oldest = self.storage.oldest_expired(now)
+        return now - oldest if oldest is not None else 0
 
     def delete_url(self, short_code: str) -> bool:
         """
@@ -154,13 +790,13 @@ class PyTiny:
         Returns:
             bool: True if URL was deleted, False if not found
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("""
-                DELETE FROM urls
-                WHERE short_code = ?
-            """, (short_code,))
+        deleted = self.storage.delete(short_code)
+
+        self._invalidate([short_code])
+        if self._wheel is not None:
+            self._wheel.cancel(short_code)
             
-        return cursor.rowcount > 0
+        return deleted
 
     def update_expiry(self, short_code: str, expire_hours: Optional[int]) -> bool:
         """
@@ -179,14 +815,108 @@ class PyTiny:
         if expire_hours is not None:
             expires_at = now + (expire_hours * 3600)
             
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("""
-                UPDATE urls
-                SET expires_at = ?
-                WHERE short_code = ?
-            """, (expires_at, short_code))
+        updated = self.storage.update_expiry(short_code, expires_at)
+
+        self._invalidate([short_code])
+        if updated and self._wheel is not None:
+            self._wheel.schedule(short_code, expires_at)
             
-        return cursor.rowcount > 0
+        return updated
+
+    def set_redirect_policy(self,
+                            short_code: str,
+                            redirect_status: Optional[int] = None,
+                            cache_ttl: Optional[int] = None) -> bool:
+        """
+        Set how a URL is redirected and how long the redirect may be cached.
+
+        Args:
+            short_code: The short code to update
+            redirect_status: 301, 302, 307 or 308, None for the server default
+            cache_ttl: Seconds browsers and CDNs may cache the redirect, 0
+                to opt out of caching, None for the server default
+
+        Returns:
+            bool: True if URL was updated, False if not found
+        """
+        validate_policy(redirect_status, cache_ttl)
+        updated = self.storage.set_redirect_policy(short_code, redirect_status, cache_ttl)
+
+        self._invalidate([short_code])
+
+        return updated
+
+    def _invalidate(self, codes: List[str]) -> None:
+        """Drop changed codes from this worker's cache and everyone else's."""
+        if self._cache is not None:
+            for code in codes:
+                self._cache.invalidate(code)
+        if self._invalidator is not None and codes:
+            self._invalidator.publish(codes)
+
+    def top_codes(self, limit: int = 20) -> List[dict]:
+        """
+        Return the most redirected live links, most redirected first.
+
+        Redirects are estimated by the hot-code tracker of this instance
+        and the top lists other workers saved to hot_codes_dir, with
+        counts halved every save so that they favour recent traffic.
+        Returns an empty list if tracking is disabled.
+        """
+        if self._hot is None:
+            return []
+        now = int(time.time())
+        top = []
+        for code, redirects in self._hot.top(limit):
+            link = self._lookup(code, now)
+            if link is not None:
+                top.append({"short_code": code, "long_url": link[0],
+                            "redirects": redirects})
+        return top
+
+    def prewarm(self, limit: Optional[int] = None) -> int:
+        """
+        Load the links workers saved as most redirected into the lookup cache.
+
+        Call it once at startup, before taking traffic, so a fresh worker
+        answers its hottest codes from memory right away.
+
+        Args:
+            limit: Number of codes to load, at most the cache size;
+                defaults to the number of codes tracked
+
+        Returns:
+            int: Number of live links loaded
+        """
+        if self._cache is None or self._hot is None or not self._hot.directory:
+            return 0
+        if limit is None:
+            limit = self._hot.capacity
+        limit = min(limit, self._cache.max_size)
+        totals = load_top(self._hot.directory)
+        now = int(time.time())
+        loaded = 0
+        for code, _ in sorted(totals.items(), key=lambda item: item[1])[-limit:]:
+            # Coldest first, so the hottest end up most recently used
+            if self._lookup(code, now) is not None:
+                loaded += 1
+        return loaded
+
+    def cache_stats(self) -> Optional[dict]:
+        """Return lookup cache counters, or None if caching is disabled."""
+        return self._cache.stats() if self._cache is not None else None
+
+    def close(self) -> None:
+        """Flush buffered clicks and close the storage backend."""
+        if self._hot is not None:
+            self._hot.close()
+        if self._invalidator is not None:
+            self._invalidator.close()
+        if self._analytics is not None:
+            self._analytics.close()
+        if self._clicks is not None:
+            self._clicks.close()
+        self.storage.close()
 
 if __name__ == "__main__":
     # Example usage
@@ -0,0 +1,109 @@
+import heapq
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+
+class ExpiryWheel:
+    """
+    Timing wheel of the links that expire within the next ``horizon`` seconds.
+
+    Each slot is one second wide and holds the codes expiring in it; slots
+    live in a dict keyed by the second, with a heap of slot seconds to find
+    the next one due. Scheduling into and cancelling from an existing slot
+    is O(1), and firing a slot hands over all of its codes at once, so the
+    reaper can delete links in a batch right when they expire.
+
+    Only links expiring before ``loaded_until`` are held, so memory is
+    proportional to the links about to expire rather than to all links.
+    ``load()`` moves the window forward with a range scan of the storage's
+    ``expires_at`` index, which also picks up links created or updated by
+    other processes.
+    """
+
+    def __init__(self, horizon: int = 3600, now: Optional[int] = None):
+        if horizon <= 0:
+            raise ValueError("horizon must be positive")
+        self.horizon = horizon
+        self._slots: Dict[int, Set[str]] = {}
+        self._seconds: List[int] = []
+        self._deadlines: Dict[str, int] = {}
+        # Seconds before this have fired
+        self._current = int(now if now is not None else time.time())
+        self.loaded_until = self._current
+        self._lock = threading.Lock()
+
+    def schedule(self, code: str, expires_at: Optional[int]) -> bool:
+        """
+        (Re)schedule code to fire at expires_at, or cancel it if None.
+
+        Returns:
+            bool: True if the wheel holds the code, False if it expires
+            beyond the loaded window and is left to the next load()
+        """
+        with self._lock:
+            self._cancel(code)
+            if expires_at is None or expires_at > self.loaded_until:
+                return False
+            second = max(expires_at, self._current)
+            slot = self._slots.get(second)
+            if slot is None:
+                slot = self._slots[second] = set()
+                heapq.heappush(self._seconds, second)
+            slot.add(code)
+            self._deadlines[code] = second
+            return True
+
+    def cancel(self, code: str) -> None:
+        """Stop tracking code, e.g. after it was deleted."""
+        with self._lock:
+            self._cancel(code)
+
+    def _cancel(self, code: str) -> None:
+        second = self._deadlines.pop(code, None)
+        if second is not None:
+            slot = self._slots[second]
+            slot.discard(code)
+            # An emptied slot's second stays in the heap until it is due
+            if not slot:
+                del self._slots[second]
+
+    def advance(self, now: int) -> List[str]:
+        """Fire every slot due at now. Returns the codes that expired."""
+        fired: List[str] = []
+        with self._lock:
+            while self._seconds and self._seconds[0] <= now:
+                slot = self._slots.pop(heapq.heappop(self._seconds), None)
+                if slot:
+                    fired.extend(slot)
+                    for code in slot:
+                        del self._deadlines[code]
+            self._current = max(self._current, now + 1)
+        return fired
+
+    def next_deadline(self) -> Optional[int]:
+        """Return the second the next slot fires, None if nothing is scheduled."""
+        with self._lock:
+            while self._seconds and self._seconds[0] not in self._slots:
+                heapq.heappop(self._seconds)
+            return self._seconds[0] if self._seconds else None
+
+    def load(self, storage, now: int, batch_size: int = 1000) -> int:
+        """
+        Schedule every stored link expiring in (now, now + horizon].
+
+        Returns:
+            int: Number of links read from storage
+        """
+        until = now + self.horizon
+        with self._lock:
+            # Set first: links created during the scan are scheduled directly
+            self.loaded_until = max(self.loaded_until, until)
+        loaded = 0
+        for code, expires_at in storage.iter_expiring(now, until, batch_size):
+            self.schedule(code, expires_at)
+            loaded += 1
+        return loaded
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
@@ -0,0 +1,84 @@
+"""
+Streaming exports of links.
+
+Every writer consumes the link dicts of ``PyTiny.iter_urls()`` as they
+come (Parquet one row group at a time), so exports of any size run in
+constant memory. Parquet needs the optional ``pyarrow`` dependency:
+``pip install "pytiny[parquet]"``.
+"""
+import csv
+import json
+from itertools import islice
+from typing import IO, Iterable
+
+FIELDS = ("short_code", "long_url", "created_at", "expires_at", "clicks",
+          "last_clicked", "redirect_status", "cache_ttl")
+
+
+def write_ndjson(urls: Iterable[dict], out: IO[str]) -> int:
+    """Write one JSON object per link. Returns the number of links written."""
+    count = 0
+    for url in urls:
+        out.write(json.dumps(url) + "\n")
+        count += 1
+    return count
+
+
+def write_csv(urls: Iterable[dict], out: IO[str]) -> int:
+    """Write links as CSV with a header row, empty cells for unset values."""
+    writer = csv.DictWriter(out, FIELDS)
+    writer.writeheader()
+    count = 0
+    for url in urls:
+        writer.writerow(url)
+        count += 1
+    return count
+
+
+def write_parquet(urls: Iterable[dict], out, row_group_size: int = 10000) -> int:
+    """
+    Write links as a Parquet file, row_group_size links per row group.
+
+    Args:
+        urls: Link dicts from PyTiny.iter_urls()
+        out: Path or binary file to write to
+        row_group_size: Links buffered before a row group is written
+
+    Raises:
+        RuntimeError: If pyarrow is not installed
+    """
+    # Optional and heavy; only imported for Parquet exports
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError('Parquet export needs pyarrow: pip install "pytiny[parquet]"')
+
+    schema = pa.schema([
+        ("short_code", pa.string()),
+        ("long_url", pa.string()),
+        ("created_at", pa.timestamp("s")),
+        ("expires_at", pa.timestamp("s")),
+        ("clicks", pa.int64()),
+        ("last_clicked", pa.timestamp("s")),
+        ("redirect_status", pa.int16()),
+        ("cache_ttl", pa.int64()),
+    ])
+    urls = iter(urls)
+    count = 0
+    with pq.ParquetWriter(out, schema) as writer:
+        while True:
+            batch = list(islice(urls, row_group_size))
+            if not batch:
+                return count
+            writer.write_table(pa.Table.from_pydict(
+                {field: [url[field] for url in batch] for field in FIELDS}, schema=schema))
+            count += len(batch)
+
+
+# Writers by format name; Parquet is written to a binary file
+FORMATS = {
+    "ndjson": write_ndjson,
+    "csv": write_csv,
+    "parquet": write_parquet,
+}
@@ -0,0 +1,235 @@
+"""
+Heavy-hitter tracking of redirected short codes.
+
+``SpaceSaving`` counts the most frequent codes of an unbounded stream in a
+fixed number of counters: a code without a counter takes over the one
+with the lowest count, inheriting that count as its possible
+overestimate. Every code occurring more than ``1/capacity`` of the time
+is guaranteed a counter, which is all it takes to find the hot codes of a
+heavily skewed workload.
+
+``HotCodes`` feeds one per worker from redirects and periodically writes
+its top codes to a file per worker in a shared directory, halving the
+counts after each write so they follow what is hot now. New workers read
+the files to warm their lookup cache before taking traffic.
+"""
+import atexit
+import heapq
+import json
+import os
+import threading
+import time
+import weakref
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
+
+# Saved top lists older than this are ignored and removed
+STALE_AFTER = 86400
+
+
+class SpaceSaving:
+    """
+    Space-Saving top-k counter with O(1) updates.
+
+    Counters are grouped in buckets of equal count, so the one to take
+    over is found without a scan.
+
+    Args:
+        capacity: Number of counters
+    """
+
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self._counts: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        # count -> codes with that count, as an insertion-ordered set
+        self._buckets: Dict[int, Dict[str, None]] = {}
+        self._min = 0
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def add(self, key: str) -> None:
+        """Count one occurrence of key."""
+        counts = self._counts
+        count = counts.get(key)
+        if count is not None:
+            self._unlink(key, count)
+            if self._min == count and count not in self._buckets:
+                self._min = count + 1
+        elif len(counts) < self.capacity:
+            count = 0
+            self._errors[key] = 0
+            self._min = 1
+        else:
+            count = self._min
+            bucket = self._buckets[count]
+            victim = next(iter(bucket))
+            self._unlink(victim, count)
+            del counts[victim], self._errors[victim]
+            self._errors[key] = count
+            if count not in self._buckets:
+                self._min = count + 1
+        counts[key] = count + 1
+        self._buckets.setdefault(count + 1, {})[key] = None
+
+    def _unlink(self, key: str, count: int) -> None:
+        bucket = self._buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[count]
+
+    def top(self, n: int) -> List[Tuple[str, int, int]]:
+        """Return up to n (key, count, overestimate) tuples, most frequent first."""
+        return [(key, count, self._errors[key]) for key, count in
+                heapq.nlargest(n, self._counts.items(), key=itemgetter(1))]
+
+    def decay(self) -> None:
+        """Halve every count, dropping keys that reach zero."""
+        counts = {key: count // 2 for key, count in self._counts.items() if count > 1}
+        self._errors = {key: self._errors[key] // 2 for key in counts}
+        self._counts = counts
+        self._buckets = {}
+        for key, count in counts.items():
+            self._buckets.setdefault(count, {})[key] = None
+        self._min = min(self._buckets) if self._buckets else 0
+
+
+class HotCodes:
+    """
+    Per-worker tracker of the most redirected codes.
+
+    Args:
+        capacity: Codes tracked, and saved, per worker
+        directory: Directory shared by all workers to save top lists in,
+            None to only track in memory
+        save_interval: Seconds between saves
+    """
+
+    def __init__(self,
+                 capacity: int = 1000,
+                 directory: Optional[str] = None,
+                 save_interval: float = 60.0):
+        self.capacity = capacity
+        self.directory = directory
+        self.save_interval = save_interval
+        self._summary = SpaceSaving(capacity)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = os.getpid()
+        atexit.register(_save_at_exit, weakref.ref(self))
+
+    def record(self, short_code: str) -> None:
+        """Count one redirect of short_code."""
+        if self._pid != os.getpid():
+            self._after_fork()
+        if self._thread is None and self.directory:
+            self._start()
+        with self._lock:
+            self._summary.add(short_code)
+
+    def top(self, n: int) -> List[Tuple[str, int]]:
+        """
+        Return the n most redirected (code, estimated redirects), counting
+        what the other workers saved last along with this worker's own.
+        """
+        with self._lock:
+            own = self._summary.top(self.capacity)
+        totals = load_top(self.directory, exclude=self._path()) if self.directory else {}
+        for code, count, _ in own:
+            totals[code] = totals.get(code, 0) + count
+        return heapq.nlargest(n, totals.items(), key=itemgetter(1))
+
+    def _path(self) -> str:
+        return os.path.join(self.directory, f"{os.getpid()}.json")
+
+    def save(self) -> int:
+        """Write this worker's top codes to its file, then halve the counts."""
+        with self._lock:
+            top = self._summary.top(self.capacity)
+            self._summary.decay()
+        if not top or not self.directory:
+            return 0
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path()
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as fh:
+            json.dump({"saved_at": int(time.time()),
+                       "top": [[code, count] for code, count, _ in top]}, fh)
+        os.replace(tmp, path)
+        return len(top)
+
+    def _start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="pytiny-hot-codes", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.save_interval):
+            try:
+                self.save()
+            except Exception as e:
+                print(f"Hot codes save error: {str(e)}")
+
+    def _after_fork(self) -> None:
+        # The parent's counts are the parent's to save.
+        self._pid = os.getpid()
+        self._summary = SpaceSaving(self.capacity)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def close(self) -> None:
+        """Stop the background thread and save what was counted."""
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.save()
+
+
+def load_top(directory: str, exclude: Optional[str] = None) -> Dict[str, int]:
+    """
+    Sum the top lists saved by all workers in directory.
+
+    Lists not rewritten for STALE_AFTER seconds, left by workers that have
+    exited, are removed.
+    """
+    totals: Dict[str, int] = {}
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return totals
+    now = time.time()
+    for name in names:
+        path = os.path.join(directory, name)
+        if not name.endswith(".json") or path == exclude:
+            continue
+        try:
+            if now - os.path.getmtime(path) > STALE_AFTER:
+                os.unlink(path)
+                continue
+            with open(path) as fh:
+                top = json.load(fh)["top"]
+        except (OSError, ValueError, KeyError):
+            # Removed by another worker, or not one of ours
+            continue
+        for code, count in top:
+            totals[code] = totals.get(code, 0) + count
+    return totals
+
+
+def _save_at_exit(ref: "weakref.ref[HotCodes]") -> None:
+    hot = ref()
+    if hot is not None:
+        try:
+            hot.close()
+        except OSError as e:
+            print(f"Hot codes save error: {str(e)}")
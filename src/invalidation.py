@@ -0,0 +1,362 @@
+"""
+Lookup-cache invalidation shared between workers and nodes.
+
+Every ``PyTiny`` with a bus publishes the short codes it deletes or
+changes, and drops the codes published by everyone else from its own
+cache. Messages are datagrams, so they can be lost: each carries the
+sender's id and a per-sender sequence number, and every sender repeats
+its latest number as a heartbeat. A receiver that sees a number jump, or
+hears from a sender it does not know yet, clears its whole cache instead
+of serving links that might have changed.
+
+Transports, picked by ``open_bus()`` from a URL:
+
+- ``udp://239.255.7.7:7907``: UDP multicast to every worker on every
+  node that joined the group (add ``?ttl=N`` to cross routers)
+- ``unix:///run/pytiny/bus``: Unix datagram sockets in that directory,
+  one per worker, for the workers of a single host
+- ``LoopbackBus``: in-process, for tests
+"""
+import ipaddress
+import os
+import secrets
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from . import metrics
+
+_MAGIC = b"PYTI"
+# magic, kind, sender id, sequence number
+_HEADER = struct.Struct("<4sBQQ")
+CODES, HEARTBEAT = 0, 1
+# Stays under the usual 1500-byte MTU, so multicast is not fragmented
+MAX_DATAGRAM = 1400
+# Heartbeats a sender may miss before it is forgotten
+SENDER_TIMEOUT = 10
+
+
+class LoopbackBus:
+    """
+    In-process bus. Every peer receives what any peer sends, itself included.
+
+    Args:
+        peers: Shared list of peers, use ``peer()`` rather than passing it
+    """
+
+    def __init__(self, peers: Optional[list] = None):
+        self._peers = peers if peers is not None else []
+        self._peers.append(self)
+        self._inbox: deque = deque()
+        self._ready = threading.Condition()
+        # Set by tests to drop the next n messages sent to this peer
+        self.drop = 0
+
+    def peer(self) -> "LoopbackBus":
+        """Return another bus joined to the same peers."""
+        return LoopbackBus(self._peers)
+
+    def send(self, message: bytes) -> None:
+        for peer in list(self._peers):
+            with peer._ready:
+                if peer.drop:
+                    peer.drop -= 1
+                    continue
+                peer._inbox.append(message)
+                peer._ready.notify()
+
+    def receive(self, timeout: float) -> Optional[bytes]:
+        with self._ready:
+            if not self._inbox:
+                self._ready.wait(timeout)
+            return self._inbox.popleft() if self._inbox else None
+
+    def close(self) -> None:
+        if self in self._peers:
+            self._peers.remove(self)
+
+
+class _SocketBus:
+    """Datagram socket transport, reopened in each forked worker."""
+
+    def __init__(self):
+        self._sock: Optional[socket.socket] = None
+        self._pid = os.getpid()
+
+    def _socket(self) -> socket.socket:
+        if self._pid != os.getpid():
+            # The parent's socket would split datagrams between processes
+            self._sock = None
+            self._pid = os.getpid()
+        if self._sock is None:
+            self._sock = self._open()
+        return self._sock
+
+    def _open(self) -> socket.socket:
+        raise NotImplementedError
+
+    def receive(self, timeout: float) -> Optional[bytes]:
+        sock = self._socket()
+        sock.settimeout(timeout)
+        try:
+            return sock.recv(65535)
+        except socket.timeout:
+            return None
+
+    def close(self) -> None:
+        if self._sock is not None and self._pid == os.getpid():
+            self._sock.close()
+        self._sock = None
+
+
+class MulticastBus(_SocketBus):
+    """
+    UDP multicast transport.
+
+    Args:
+        group: Multicast group address, e.g. "239.255.7.7"
+        port: UDP port shared by all workers
+        ttl: Router hops datagrams may cross, 1 keeps them on the local network
+    """
+
+    def __init__(self, group: str, port: int, ttl: int = 1):
+        if not ipaddress.ip_address(group).is_multicast:
+            raise ValueError(f"Not a multicast group: {group}")
+        super().__init__()
+        self.group = group
+        self.port = port
+        self.ttl = ttl
+
+    def _open(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        # Every worker on the host binds the same port and gets its own copy
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(("", self.port))
+        membership = struct.pack("4s4s", socket.inet_aton(self.group),
+                                 socket.inet_aton("0.0.0.0"))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.ttl)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        return sock
+
+    def send(self, message: bytes) -> None:
+        self._socket().sendto(message, (self.group, self.port))
+
+
+class UnixBus(_SocketBus):
+    """
+    Unix datagram transport for the workers of one host.
+
+    Each worker binds a socket in directory and sends to every socket
+    there, removing those of workers that have exited.
+    """
+
+    def __init__(self, directory: str):
+        super().__init__()
+        self.directory = directory
+        self.path: Optional[str] = None
+
+    def _open(self) -> socket.socket:
+        os.makedirs(self.directory, exist_ok=True)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.path = os.path.join(self.directory,
+                                 f"{os.getpid()}-{secrets.token_hex(4)}.sock")
+        sock.bind(self.path)
+        return sock
+
+    def send(self, message: bytes) -> None:
+        sock = self._socket()
+        for name in os.listdir(self.directory):
+            if not name.endswith(".sock"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                # A full queue drops the message; its receiver sees the gap
+                sock.sendto(message, socket.MSG_DONTWAIT, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self) -> None:
+        if self._sock is not None and self._pid == os.getpid() and self.path:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        super().close()
+
+
+def open_bus(url: str):
+    """Return the bus for a udp:// multicast or unix:// directory URL."""
+    parts = urlsplit(url)
+    if parts.scheme == "udp":
+        ttl = int(parse_qs(parts.query).get("ttl", ["1"])[0])
+        return MulticastBus(parts.hostname, parts.port, ttl)
+    if parts.scheme == "unix":
+        return UnixBus(parts.path)
+    raise ValueError(f"Unsupported invalidation URL: {url}")
+
+
+def pack(kind: int, sender: int, seq: int, codes: Iterable[str] = ()) -> bytes:
+    return _HEADER.pack(_MAGIC, kind, sender, seq) + "\n".join(codes).encode()
+
+
+def unpack(message: bytes):
+    """Return (kind, sender, seq, codes), or None for a foreign datagram."""
+    if len(message) < _HEADER.size or message[:4] != _MAGIC:
+        return None
+    _, kind, sender, seq = _HEADER.unpack_from(message)
+    body = message[_HEADER.size:]
+    return kind, sender, seq, body.decode().split("\n") if body else []
+
+
+class Invalidator:
+    """
+    Publishes this worker's cache invalidations and applies everyone else's.
+
+    The listener thread starts on first use and again in each forked
+    worker, which also starts with an empty cache: entries copied from
+    the parent were cached before the child was listening.
+
+    Args:
+        cache: Lookup cache to invalidate, None to only publish
+        bus: Transport, e.g. from ``open_bus()``
+        heartbeat: Seconds between heartbeats, which bounds how long the
+            loss of a sender's latest message goes unnoticed
+    """
+
+    def __init__(self, cache, bus, heartbeat: float = 1.0):
+        self.cache = cache
+        self.bus = bus
+        self.heartbeat = heartbeat
+        self._seen: Dict[int, List[float]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        self.sender = secrets.randbits(64)
+        self.seq = 0
+        self._seen = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def listen(self) -> None:
+        """Make sure the listener thread of this process is running."""
+        if self._pid != os.getpid():
+            self._reset()
+            if self.cache is not None:
+                self.cache.clear()
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="pytiny-invalidation", daemon=True)
+                    self._thread.start()
+
+    def publish(self, codes: Iterable[str]) -> None:
+        """Tell the other workers to drop codes from their caches."""
+        self.listen()
+        batch: List[str] = []
+        size = _HEADER.size
+        for code in codes:
+            if batch and size + len(code) + 1 > MAX_DATAGRAM:
+                self._send(batch)
+                batch, size = [], _HEADER.size
+            batch.append(code)
+            size += len(code) + 1
+        if batch:
+            self._send(batch)
+
+    def _send(self, codes: List[str]) -> None:
+        with self._lock:
+            self.seq += 1
+            seq = self.seq
+        try:
+            self.bus.send(pack(CODES, self.sender, seq, codes))
+        except OSError as e:
+            # Receivers notice the skipped number and clear their caches
+            print(f"Invalidation error: {str(e)}")
+
+    def _run(self) -> None:
+        next_beat = 0.0
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if now >= next_beat:
+                self._beat(now)
+                next_beat = now + self.heartbeat
+            try:
+                message = self.bus.receive(next_beat - now)
+            except OSError as e:
+                print(f"Invalidation error: {str(e)}")
+                # Whatever arrived meanwhile is lost
+                self._flush()
+                self._stop.wait(self.heartbeat)
+                continue
+            if message is not None:
+                self.apply(message)
+
+    def _beat(self, now: float) -> None:
+        with self._lock:
+            seq = self.seq
+        try:
+            self.bus.send(pack(HEARTBEAT, self.sender, seq))
+        except OSError as e:
+            print(f"Invalidation error: {str(e)}")
+        timeout = SENDER_TIMEOUT * self.heartbeat
+        for sender, (_, heard) in list(self._seen.items()):
+            if now - heard > timeout:
+                del self._seen[sender]
+
+    def apply(self, message: bytes) -> None:
+        """Apply one received message to the cache."""
+        decoded = unpack(message)
+        if decoded is None:
+            return
+        kind, sender, seq, codes = decoded
+        if sender == self.sender:
+            return
+
+        last = self._seen.get(sender)
+        expected = (last[0] if last else 0) + (kind == CODES)
+        if seq > expected:
+            # Missed messages, or a sender heard from for the first time
+            # after it already published: anything cached may be stale
+            self._flush()
+        if last is None or seq > last[0]:
+            self._seen[sender] = [seq, time.monotonic()]
+        else:
+            last[1] = time.monotonic()
+
+        if kind == CODES and self.cache is not None:
+            metrics.CACHE_INVALIDATIONS.inc(len(codes))
+            for code in codes:
+                self.cache.invalidate(code)
+
+    def _flush(self) -> None:
+        if self.cache is not None:
+            metrics.CACHE_FLUSHES.inc()
+            self.cache.clear()
+
+    def close(self) -> None:
+        """Stop the listener thread and close the bus."""
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.bus.close()
@@ -0,0 +1,439 @@
+import heapq
+import os
+import threading
+from bisect import bisect_right
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from .analytics import RollupRow
+from .clicks import ClickBatch
+from .storage import FullRow, HashMatch, Link, NewRow, StatsRow, Storage
+
+
+class _Record:
+    """One stored link; slots keep the per-link overhead small."""
+
+    __slots__ = ("id", "long_url", "created_at", "expires_at", "clicks",
+                 "last_clicked", "url_hash", "redirect_status", "cache_ttl")
+
+    def __init__(self, id: int, long_url: str, created_at: int,
+                 expires_at: Optional[int], clicks: int = 0,
+                 last_clicked: Optional[int] = None,
+                 url_hash: Optional[int] = None,
+                 redirect_status: Optional[int] = None,
+                 cache_ttl: Optional[int] = None):
+        self.id = id
+        self.long_url = long_url
+        self.created_at = created_at
+        self.expires_at = expires_at
+        self.clicks = clicks
+        self.last_clicked = last_clicked
+        self.url_hash = url_hash
+        self.redirect_status = redirect_status
+        self.cache_ttl = cache_ttl
+
+
+class MemoryStorage(Storage):
+    """
+    Link storage held in process memory, for tests and ephemeral edge nodes.
+
+    Links live in a dict of slotted records, expiring links additionally in
+    a heap ordered by ``expires_at`` so reaping never scans live links.
+    Lookups take no lock; writes are serialized by one. Nothing is persisted
+    and nothing is shared with other processes, including forked workers.
+    """
+
+    def __init__(self):
+        self.db_path = ":memory:"
+        self._links: Dict[str, _Record] = {}
+        # (expires_at, id, short_code); entries whose record was deleted or
+        # given another expiry are skipped when they reach the top
+        self._expiry: List[Tuple[int, int, str]] = []
+        self._by_hash: Dict[int, Set[str]] = {}
+        # Row IDs and codes in insertion order, read by codes_since()
+        self._order_ids: List[int] = []
+        self._order_codes: List[str] = []
+        # Changes kept for snapshots once track_changes() is called
+        self._change_ids: List[int] = []
+        self._change_codes: List[str] = []
+        self._track_changes = False
+        self._rollups: Dict[str, Dict[Tuple[int, int, str, str], int]] = {}
+        self._next_row = 1
+        self._next_change = 1
+        self._sequence = 0
+        self._version = 0
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _writer(self) -> threading.Lock:
+        # The lock may have been held by another thread at fork time
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._lock = threading.Lock()
+        return self._lock
+
+    def reserve_ids(self, count: int) -> int:
+        """Reserve count consecutive code IDs. Returns the first one."""
+        with self._writer():
+            start = self._sequence
+            self._sequence += count
+        return start
+
+    def sequence_value(self) -> int:
+        """Return the next unreserved code ID."""
+        return self._sequence
+
+    def advance_sequence(self, value: int) -> None:
+        """Make sure IDs below value are never reserved again."""
+        with self._writer():
+            self._sequence = max(self._sequence, value)
+
+    def _add(self, short_code: str, record: _Record) -> None:
+        # Callers hold the write lock
+        self._links[short_code] = record
+        self._order_ids.append(record.id)
+        self._order_codes.append(short_code)
+        if record.expires_at is not None:
+            heapq.heappush(self._expiry, (record.expires_at, record.id, short_code))
+        if record.url_hash is not None:
+            self._by_hash.setdefault(record.url_hash, set()).add(short_code)
+        self._version += 1
+
+    def _remove(self, short_code: str) -> Optional[_Record]:
+        # Callers hold the write lock
+        record = self._links.pop(short_code, None)
+        if record is None:
+            return None
+        if record.url_hash is not None:
+            codes = self._by_hash.get(record.url_hash)
+            if codes is not None:
+                codes.discard(short_code)
+                if not codes:
+                    del self._by_hash[record.url_hash]
+        self._rollups.pop(short_code, None)
+        self._version += 1
+        if len(self._order_ids) > 2 * len(self._links) + 1000:
+            self._compact_order()
+        return record
+
+    def _compact_order(self) -> None:
+        # Drop deleted codes from the insertion order; watermarks are row
+        # IDs, so ones handed out earlier stay valid
+        live = [(record.id, code) for code, record in self._links.items()]
+        live.sort()
+        self._order_ids = [row_id for row_id, _ in live]
+        self._order_codes = [code for _, code in live]
+
+    def _log_change(self, short_code: str) -> None:
+        # Read by snapshots built before the change, see changes_since();
+        # without any, nothing would ever prune the log
+        if not self._track_changes:
+            return
+        self._change_ids.append(self._next_change)
+        self._change_codes.append(short_code)
+        self._next_change += 1
+
+    def insert(self, row: NewRow, url_hash: Optional[int] = None,
+               redirect_status: Optional[int] = None,
+               cache_ttl: Optional[int] = None) -> bool:
+        """Insert a new link. Returns False if its short code is taken."""
+        short_code, long_url, created_at, expires_at = row
+        with self._writer():
+            if short_code in self._links:
+                return False
+            self._add(short_code, _Record(self._next_row, long_url, created_at,
+                                          expires_at, url_hash=url_hash,
+                                          redirect_status=redirect_status,
+                                          cache_ttl=cache_ttl))
+            self._next_row += 1
+        return True
+
+    def insert_many(self, rows: Sequence[NewRow],
+                    url_hashes: Optional[Sequence[Optional[int]]] = None) -> List[int]:
+        """Insert new links, skipping taken codes. Returns indexes of skipped rows."""
+        hashes = url_hashes or [None] * len(rows)
+        clashes = []
+        with self._writer():
+            for i, (short_code, long_url, created_at, expires_at) in enumerate(rows):
+                if short_code in self._links:
+                    clashes.append(i)
+                    continue
+                self._add(short_code, _Record(self._next_row, long_url, created_at,
+                                              expires_at, url_hash=hashes[i]))
+                self._next_row += 1
+        return clashes
+
+    def get(self, short_code: str) -> Optional[Link]:
+        """Return (long_url, expires_at, created_at, redirect_status, cache_ttl) for a short code."""
+        record = self._links.get(short_code)
+        if record is None:
+            return None
+        return (record.long_url, record.expires_at, record.created_at,
+                record.redirect_status, record.cache_ttl)
+
+    def find_by_hashes(self, url_hashes: Sequence[int]) -> List[HashMatch]:
+        """Return every link whose dedup hash is one of url_hashes, newest first."""
+        matches = []
+        for url_hash in set(url_hashes):
+            for short_code in list(self._by_hash.get(url_hash, ())):
+                record = self._links.get(short_code)
+                if record is not None:
+                    matches.append((record.id, url_hash, short_code, record.long_url,
+                                    record.created_at, record.expires_at))
+        matches.sort(reverse=True)
+        return [match[1:] for match in matches]
+
+    def get_stats(self, short_code: str) -> Optional[StatsRow]:
+        """
+        Return (created_at, expires_at, clicks, last_clicked, redirect_status,
+        cache_ttl) for a short code.
+        """
+        record = self._links.get(short_code)
+        if record is None:
+            return None
+        return (record.created_at, record.expires_at, record.clicks,
+                record.last_clicked, record.redirect_status, record.cache_ttl)
+
+    def incr_clicks(self, batch: ClickBatch) -> None:
+        """Apply click increments."""
+        with self._writer():
+            for short_code, (count, last) in batch.items():
+                record = self._links.get(short_code)
+                if record is not None:
+                    record.clicks += count
+                    record.last_clicked = max(record.last_clicked or 0, last)
+
+    def delete(self, short_code: str) -> bool:
+        """Delete a link and its click history. Returns True if it existed."""
+        with self._writer():
+            if self._remove(short_code) is None:
+                return False
+            self._log_change(short_code)
+        return True
+
+    def add_rollups(self, rows: Sequence[RollupRow]) -> None:
+        """Add click counts to the time-bucketed rollups."""
+        with self._writer():
+            for short_code, resolution, bucket, referrer, agent, clicks in rows:
+                counts = self._rollups.setdefault(short_code, {})
+                key = (resolution, bucket, referrer, agent)
+                counts[key] = counts.get(key, 0) + clicks
+
+    def get_rollups(self, short_code: str, resolution: int,
+                    start: int, end: int) -> List[Tuple[int, str, str, int]]:
+        """Return (bucket, referrer, agent, clicks) rows in [start, end)."""
+        with self._writer():
+            counts = list(self._rollups.get(short_code, {}).items())
+        return sorted((bucket, referrer, agent, clicks)
+                      for (size, bucket, referrer, agent), clicks in counts
+                      if size == resolution and start <= bucket < end)
+
+    def prune_rollups(self, resolution: int, before: int, limit: int) -> int:
+        """Delete up to limit rollup rows of a resolution older than before."""
+        pruned = 0
+        with self._writer():
+            for short_code, counts in list(self._rollups.items()):
+                for key in [key for key in counts
+                            if key[0] == resolution and key[1] < before]:
+                    if pruned >= limit:
+                        return pruned
+                    del counts[key]
+                    pruned += 1
+                if not counts:
+                    del self._rollups[short_code]
+        return pruned
+
+    def update_expiry(self, short_code: str, expires_at: Optional[int]) -> bool:
+        """Set a link's expiry. Returns True if it exists."""
+        with self._writer():
+            record = self._links.get(short_code)
+            if record is None:
+                return False
+            record.expires_at = expires_at
+            if expires_at is not None:
+                heapq.heappush(self._expiry, (expires_at, record.id, short_code))
+            self._log_change(short_code)
+            self._version += 1
+        return True
+
+    def set_redirect_policy(self, short_code: str, redirect_status: Optional[int],
+                            cache_ttl: Optional[int]) -> bool:
+        """Set a link's redirect status and cache lifetime. Returns True if it exists."""
+        with self._writer():
+            record = self._links.get(short_code)
+            if record is None:
+                return False
+            record.redirect_status = redirect_status
+            record.cache_ttl = cache_ttl
+            self._log_change(short_code)
+            self._version += 1
+        return True
+
+    def _expired_top(self) -> Optional[Tuple[int, int, str]]:
+        # Callers hold the write lock. Pops stale heap entries and returns
+        # the live link that expires first, if any.
+        while self._expiry:
+            expires_at, row_id, short_code = self._expiry[0]
+            record = self._links.get(short_code)
+            if (record is not None and record.id == row_id
+                    and record.expires_at == expires_at):
+                return self._expiry[0]
+            heapq.heappop(self._expiry)
+        return None
+
+    def delete_expired(self, now: int, limit: int) -> int:
+        """Delete up to limit links expired at now, oldest first."""
+        deleted = 0
+        with self._writer():
+            while deleted < limit:
+                top = self._expired_top()
+                if top is None or top[0] > now:
+                    break
+                heapq.heappop(self._expiry)
+                self._remove(top[2])
+                deleted += 1
+        return deleted
+
+    def oldest_expired(self, now: int) -> Optional[int]:
+        """Return the earliest expires_at among links expired at now."""
+        with self._writer():
+            top = self._expired_top()
+        if top is None or top[0] > now:
+            return None
+        return top[0]
+
+    def iter_expiring(self, after: int, until: int,
+                      batch_size: int = 1000) -> Iterator[Tuple[str, int]]:
+        """Yield (short_code, expires_at) for links expiring in (after, until]."""
+        with self._writer():
+            entries = [entry for entry in self._expiry if after < entry[0] <= until]
+        for expires_at, row_id, short_code in sorted(entries):
+            record = self._links.get(short_code)
+            if record is not None and record.id == row_id and record.expires_at == expires_at:
+                yield short_code, expires_at
+
+    def iter_rows(self, batch_size: int = 1000) -> Iterator[FullRow]:
+        """Yield every stored link, in insertion order."""
+        with self._writer():
+            items = list(self._links.items())
+        for short_code, record in items:
+            yield (short_code, record.long_url, record.created_at, record.expires_at,
+                   record.clicks, record.last_clicked, record.url_hash,
+                   record.redirect_status, record.cache_ttl)
+
+    def list_rows(self, after: Optional[int] = None, limit: int = 1000, now: int = 0,
+                  state: str = "all") -> Tuple[List[FullRow], Optional[int]]:
+        """Return a page of up to limit links with a row ID above after."""
+        rows: List[FullRow] = []
+        with self._writer():
+            i = bisect_right(self._order_ids, after or 0)
+            while i < len(self._order_ids) and len(rows) < limit:
+                row_id, short_code = self._order_ids[i], self._order_codes[i]
+                i += 1
+                record = self._links.get(short_code)
+                if (record is None or record.id != row_id
+                        or not self._in_state(record.expires_at, now, state)):
+                    continue
+                rows.append((short_code, record.long_url, record.created_at,
+                             record.expires_at, record.clicks, record.last_clicked,
+                             record.url_hash, record.redirect_status, record.cache_ttl))
+            more = i < len(self._order_ids)
+        return rows, (self._order_ids[i - 1] if more else None)
+
+    def codes_since(self, watermark: Optional[int] = None,
+                    limit: int = 10000) -> Tuple[List[str], Optional[int]]:
+        """
+        Return up to limit short codes added after watermark.
+
+        Returns:
+            Tuple[List[str], Optional[int]]: The codes and the watermark to
+            pass on the next call
+        """
+        with self._writer():
+            start = bisect_right(self._order_ids, watermark or 0)
+            ids = self._order_ids[start:start + limit]
+            codes = self._order_codes[start:start + limit]
+        if not ids:
+            return [], watermark
+        return codes, ids[-1]
+
+    def iter_sorted(self, batch_size: int = 1000) -> Iterator[Tuple]:
+        """Yield (short_code,) + Link for every link, ordered by code."""
+        with self._writer():
+            codes = sorted(self._links)
+        for short_code in codes:
+            link = self.get(short_code)
+            if link is not None:
+                yield (short_code,) + link
+
+    def track_changes(self) -> None:
+        """Start keeping the change log; until then changes are not logged."""
+        with self._writer():
+            self._track_changes = True
+
+    def last_change(self) -> int:
+        """Return the newest entry in the change log, a watermark for changes_since()."""
+        return self._next_change - 1
+
+    def changes_since(self, watermark: Optional[int] = None,
+                      limit: int = 10000) -> Tuple[List[str], Optional[int]]:
+        """
+        Return up to limit codes deleted or updated after watermark.
+
+        Returns:
+            Tuple[List[str], Optional[int]]: The codes and the watermark to
+            pass on the next call
+        """
+        with self._writer():
+            start = bisect_right(self._change_ids, watermark or 0)
+            ids = self._change_ids[start:start + limit]
+            codes = self._change_codes[start:start + limit]
+        if not ids:
+            return [], watermark
+        return codes, ids[-1]
+
+    def prune_changes(self, watermark: Optional[int]) -> int:
+        """Forget change log entries up to and including watermark."""
+        with self._writer():
+            end = bisect_right(self._change_ids, watermark or 0)
+            del self._change_ids[:end]
+            del self._change_codes[:end]
+        return end
+
+    def change_token(self) -> int:
+        """Return a counter bumped by every write to a link."""
+        return self._version
+
+    def copy_rows(self, rows: Sequence[FullRow]) -> None:
+        """Insert or overwrite complete rows, e.g. while resharding."""
+        with self._writer():
+            for row in rows:
+                short_code = row[0]
+                record = self._links.get(short_code)
+                if record is None:
+                    self._add(short_code, _Record(self._next_row, *row[1:]))
+                    self._next_row += 1
+                    continue
+                # Overwritten in place, keeping the code's insertion order
+                if record.url_hash is not None:
+                    self._by_hash.get(record.url_hash, set()).discard(short_code)
+                (record.long_url, record.created_at, record.expires_at, record.clicks,
+                 record.last_clicked, record.url_hash, record.redirect_status,
+                 record.cache_ttl) = row[1:]
+                if record.expires_at is not None:
+                    heapq.heappush(self._expiry, (record.expires_at, record.id, short_code))
+                if record.url_hash is not None:
+                    self._by_hash.setdefault(record.url_hash, set()).add(short_code)
+                self._log_change(short_code)
+                self._version += 1
+
+    def summary(self, now: int) -> dict:
+        """Return link, expired-link and click totals."""
+        with self._writer():
+            records = list(self._links.values())
+        expired = sum(1 for record in records
+                      if record.expires_at is not None and record.expires_at <= now)
+        return {"urls": len(records), "expired": expired,
+                "clicks": sum(record.clicks for record in records)}
+
+    def close(self) -> None:
+        """Nothing to release; the links stay until the object is dropped."""
@@ -0,0 +1,305 @@
+"""
+Counters and latency histograms exported in the Prometheus text format.
+
+Every metric is a fixed slot in a flat array of doubles, so recording a
+value is a lock-protected add with no allocation. By default the array
+lives in process memory; after ``REGISTRY.set_directory(path)`` it is a
+memory-mapped file ``<path>/<pid>.metrics`` instead, one per process, and
+``render()`` sums the files of every process that has written there. That
+is how ``/metrics`` reports totals across all gunicorn workers.
+
+The directory should be emptied before the server starts so counts from a
+previous deployment are not carried over.
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_MAGIC = b"PYTM"
+_HEADER = 8  # magic + layout checksum
+
+
+class Counter:
+    """Monotonically increasing count."""
+
+    kind = "counter"
+
+    def __init__(self, registry: "Registry", offset: int):
+        self._registry = registry
+        self._offset = offset
+
+    @staticmethod
+    def slots() -> int:
+        return 1
+
+    def inc(self, amount: float = 1.0) -> None:
+        # Explicit acquire/release is markedly cheaper than a with block
+        registry = self._registry
+        lock = registry._lock
+        lock.acquire()
+        try:
+            registry._values[self._offset] += amount
+        finally:
+            lock.release()
+
+
+class Histogram:
+    """Distribution of observed values, usually latencies in seconds."""
+
+    kind = "histogram"
+
+    def __init__(self, registry: "Registry", offset: int,
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self._registry = registry
+        self._offset = offset
+        self.buckets = tuple(buckets)
+        # Slot layout: one count per bucket, the +Inf count, then the sum
+        self._sum = offset + len(self.buckets) + 1
+
+    @staticmethod
+    def slots(buckets: Sequence[float] = DEFAULT_BUCKETS) -> int:
+        return len(buckets) + 2
+
+    def observe(self, value: float) -> None:
+        index = self._offset + bisect_left(self.buckets, value)
+        registry = self._registry
+        lock = registry._lock
+        lock.acquire()
+        try:
+            values = registry._values
+            values[index] += 1
+            values[self._sum] += value
+        finally:
+            lock.release()
+
+    @contextmanager
+    def time(self):
+        """Observe the wall time spent in a with block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Registry:
+    """
+    Fixed set of metrics backed by one array of doubles per process.
+
+    Metrics must all be defined before set_directory() is called, since the
+    layout of the shared files is derived from them.
+    """
+
+    def __init__(self):
+        # (name, documentation, kind, label, [(label value, metric)])
+        self._families: List[tuple] = []
+        self._values = array("d")
+        self._lock = threading.Lock()
+        self.directory: Optional[str] = None
+        self._mmap: Optional[mmap.mmap] = None
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def counter(self, name: str, documentation: str,
+                label: Optional[str] = None,
+                label_values: Sequence[str] = ()):
+        """
+        Define a counter.
+
+        Args:
+            name: Metric name, conventionally ending in ``_total``
+            documentation: HELP text
+            label: Optional label name splitting the counter by label_values
+
+        Returns:
+            Counter, or a dict of label value to Counter when label is set
+        """
+        return self._define(name, documentation, label, label_values,
+                            Counter.slots(), lambda offset: Counter(self, offset))
+
+    def histogram(self, name: str, documentation: str,
+                  label: Optional[str] = None,
+                  label_values: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """
+        Define a histogram.
+
+        Args:
+            name: Metric name, conventionally ending in ``_seconds``
+            documentation: HELP text
+            label: Optional label name splitting the histogram by label_values
+            buckets: Sorted upper bounds of the buckets
+
+        Returns:
+            Histogram, or a dict of label value to Histogram when label is set
+        """
+        return self._define(name, documentation, label, label_values,
+                            Histogram.slots(buckets),
+                            lambda offset: Histogram(self, offset, buckets))
+
+    def _define(self, name, documentation, label, label_values, slots, make):
+        if self._mmap is not None:
+            raise RuntimeError("Metrics must be defined before set_directory()")
+
+        children = []
+        for value in (label_values if label else (None,)):
+            children.append((value, make(len(self._values))))
+            self._values.extend([0.0] * slots)
+        self._families.append((name, documentation, children[0][1].kind, label, children))
+
+        if label:
+            return {value: metric for value, metric in children}
+        return children[0][1]
+
+    def _layout(self) -> bytes:
+        """Header identifying the metric layout, so stale files are ignored."""
+        layout = "\n".join(f"{name} {kind} {label} {[v for v, _ in children]}"
+                           for name, _, kind, label, children in self._families)
+        return _MAGIC + struct.pack("<I", zlib.crc32(layout.encode()))
+
+    def set_directory(self, directory: str) -> None:
+        """
+        Share metrics with other processes through files in directory.
+
+        Values recorded so far are carried over into this process's file.
+        """
+        if self._mmap is not None and directory == self.directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self.directory = directory
+            self._open_file(list(self._values))
+
+    def _open_file(self, initial: List[float]) -> None:
+        header = self._layout()
+        size = _HEADER + 8 * len(self._values)
+        path = os.path.join(self.directory, f"{os.getpid()}.metrics")
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # A file left by an earlier process with the same pid keeps its
+            # counts, so totals never go backwards
+            if os.read(fd, _HEADER) != header or os.fstat(fd).st_size != size:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+                os.pwrite(fd, header, 0)
+            self._mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        values = memoryview(self._mmap)[_HEADER:].cast("d")
+        for index, value in enumerate(initial):
+            if value:
+                values[index] += value
+        self._values = values
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+        if self._mmap is not None:
+            # The child must not write into its parent's file
+            self._values = array("d", [0.0] * len(self._values))
+            self._mmap = None
+            self._open_file([])
+
+    def collect(self) -> List[float]:
+        """Return current values, summed over all processes when shared."""
+        if self.directory is None:
+            with self._lock:
+                return list(self._values)
+
+        header = self._layout()
+        totals = [0.0] * len(self._values)
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".metrics"):
+                continue
+            try:
+                with open(entry.path, "rb") as fh:
+                    data = fh.read()
+            except OSError:
+                continue
+            if data[:_HEADER] != header or len(data) != _HEADER + 8 * len(totals):
+                continue
+            for index, value in enumerate(array("d", data[_HEADER:])):
+                totals[index] += value
+        return totals
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        values = self.collect()
+        lines = []
+        for name, documentation, kind, label, children in self._families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for label_value, metric in children:
+                labels = f'{label}="{label_value}"' if label else ""
+                offset = metric._offset
+                if kind == "counter":
+                    lines.append(f"{name}{_braces(labels)} {_format(values[offset])}")
+                    continue
+
+                cumulative = 0.0
+                for index, bound in enumerate(metric.buckets + (float("inf"),)):
+                    cumulative += values[offset + index]
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    bucket_labels = f'{labels},le="{le}"' if labels else f'le="{le}"'
+                    lines.append(f"{name}_bucket{{{bucket_labels}}} {_format(cumulative)}")
+                lines.append(f"{name}_sum{_braces(labels)} {_format(values[metric._sum])}")
+                lines.append(f"{name}_count{_braces(labels)} {_format(cumulative)}")
+        return "\n".join(lines) + "\n"
+
+
+def _braces(labels: str) -> str:
+    return f"{{{labels}}}" if labels else ""
+
+
+def _format(value: float) -> str:
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+REGISTRY = Registry()
+
+DB_QUERY_SECONDS: Dict[str, Histogram] = REGISTRY.histogram(
+    "pytiny_db_query_seconds", "Time spent in database calls by operation",
+    label="op", label_values=("lookup", "insert", "insert_many", "stats", "clicks", "rollups"))
+CACHE_LOOKUP_SECONDS = REGISTRY.histogram(
+    "pytiny_cache_lookup_seconds", "Time spent looking links up in the in-process cache")
+REDIRECT_SECONDS = REGISTRY.histogram(
+    "pytiny_redirect_seconds", "Time to resolve a short code and answer the redirect request")
+QR_RENDER_SECONDS = REGISTRY.histogram(
+    "pytiny_qr_render_seconds", "Time to render a QR code image on a cache miss")
+
+REDIRECTS = REGISTRY.counter(
+    "pytiny_redirects_total", "Short codes resolved to their long URL")
+NOT_FOUND = REGISTRY.counter(
+    "pytiny_not_found_total", "Redirect lookups for unknown or expired short codes")
+EXPIRED_HITS = REGISTRY.counter(
+    "pytiny_expired_hits_total", "Lookups that found a link past its expiry")
+CREATES = REGISTRY.counter(
+    "pytiny_links_created_total", "Short links created")
+DEDUP_HITS = REGISTRY.counter(
+    "pytiny_dedup_hits_total", "Creates answered with an existing code in dedup mode")
+FILTER_REJECTS = REGISTRY.counter(
+    "pytiny_filter_rejects_total", "Unknown short codes answered by the Bloom filter without a DB query")
+SNAPSHOT_HITS = REGISTRY.counter(
+    "pytiny_snapshot_hits_total", "Cache misses answered from the memory-mapped snapshot")
+CACHE_INVALIDATIONS = REGISTRY.counter(
+    "pytiny_cache_invalidations_total", "Short codes dropped from the cache on another worker's change")
+CACHE_FLUSHES = REGISTRY.counter(
+    "pytiny_cache_flushes_total", "Lookup cache flushes after missed invalidation messages")
+ERRORS = REGISTRY.counter(
+    "pytiny_errors_total", "Requests that failed with an unexpected error")
+THROTTLED: Dict[str, Counter] = REGISTRY.counter(
+    "pytiny_throttled_total", "Requests refused with 429 by rate limits or load shedding",
+    label="limit", label_values=("create", "create_global", "redirect", "redirect_global",
+                                 "shed"))
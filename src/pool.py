@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import threading
+from typing import List
+
+from .tracing import span
+
+# Pragmas applied once when a connection is opened. WAL lets readers run
+# concurrently with the single writer, and NORMAL sync is durable across
+# application crashes in WAL mode while avoiding an fsync per commit.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=268435456",
+)
+
+
+class ConnectionPool:
+    """
+    Thread-local SQLite connection manager.
+
+    Every thread lazily opens a single connection and keeps it for its
+    lifetime, so the file open, schema parse and pragma setup happen once
+    per thread instead of once per call. Reusing the connection also lets
+    sqlite3's per-connection statement cache reuse prepared statements.
+
+    Connections are never shared across ``fork()``: a gunicorn worker that
+    inherits the pool from the master process opens fresh connections.
+    """
+
+    def __init__(self,
+                 db_path: str,
+                 timeout: float = 5.0,
+                 cached_statements: int = 256):
+        self.db_path = db_path
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+        self._inherited: List[sqlite3.Connection] = []
+        self._pid = os.getpid()
+
+    def _open(self) -> sqlite3.Connection:
+        with span("db.connect"):
+            conn = sqlite3.connect(
+                self.db_path,
+                timeout=self.timeout,
+                cached_statements=self.cached_statements,
+                check_same_thread=False,
+            )
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+        return conn
+
+    def connect(self) -> sqlite3.Connection:
+        """Open a connection outside the pool, e.g. for a long read transaction."""
+        return self._open()
+
+    def get(self) -> sqlite3.Connection:
+        """Return the calling thread's connection, opening it if needed."""
+        if self._pid != os.getpid():
+            self._after_fork()
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _after_fork(self) -> None:
+        # Connections inherited from the parent must not be used or closed
+        # in the child (closing them can release the parent's file locks),
+        # so they are parked here to keep them from being garbage collected.
+        self._inherited.extend(self._connections)
+        self._pid = os.getpid()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def close(self) -> None:
+        """Close every connection opened by this pool in this process."""
+        if self._pid != os.getpid():
+            self._after_fork()
+            return
+
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
@@ -0,0 +1,74 @@
+"""
+On-demand statistical profiler of a live worker.
+
+Samples the stack of every thread in the process at a fixed interval
+with ``sys._current_frames()`` and counts identical stacks, in the
+collapsed format that flamegraph.pl and speedscope read::
+
+    pytiny-db-0;thread.py:_worker;core.py:PyTiny._lookup;storage.py:SQLiteStorage.get 42
+
+Nothing runs between profiles. While one runs, each sample costs a few
+microseconds per thread, so the default 200 samples per second stay well
+under 1% of a core.
+"""
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+# Upper bound on a single profile
+MAX_SECONDS = 60.0
+# Lower bound on the time between samples
+MIN_INTERVAL = 0.001
+
+_running = threading.Lock()
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def profile(seconds: float, interval: float = 0.005) -> Optional[str]:
+    """
+    Sample all other threads for seconds, every interval seconds.
+
+    Returns:
+        Optional[str]: Collapsed stacks, one "frames count" line each,
+        most frequent first, or None if a profile is already running
+
+    Raises:
+        ValueError: If seconds or interval is not finite
+    """
+    if not (math.isfinite(seconds) and math.isfinite(interval)):
+        raise ValueError("seconds and interval must be finite")
+    interval = min(max(interval, MIN_INTERVAL), MAX_SECONDS)
+    seconds = min(max(seconds, interval), MAX_SECONDS)
+    if not _running.acquire(blocking=False):
+        return None
+    try:
+        own = threading.get_ident()
+        stacks: Counter = Counter()
+        deadline = time.perf_counter() + seconds
+        while True:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                frames = []
+                while frame is not None:
+                    frames.append(_frame_name(frame))
+                    frame = frame.f_back
+                frames.append(names.get(ident, str(ident)))
+                stacks[";".join(reversed(frames))] += 1
+            # Keep the frames from holding on to their locals
+            frame = None
+            if time.perf_counter() + interval > deadline:
+                break
+            time.sleep(interval)
+    finally:
+        _running.release()
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
@@ -0,0 +1,165 @@
+import hashlib
+import io
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, Future
+from typing import Dict, Optional, Tuple
+
+from .metrics import QR_RENDER_SECONDS
+from .tracing import span
+
+# Supported output formats and their content types
+FORMATS = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+
+# Allowed range for the size (pixels per QR module) of rendered images
+MIN_BOX_SIZE = 1
+MAX_BOX_SIZE = 40
+
+
+def render_qr(data: str, box_size: int = 10, fmt: str = "png") -> bytes:
+    """
+    Render data as a QR code image.
+
+    Args:
+        data: Content to encode, usually a short URL
+        box_size: Pixels per QR module
+        fmt: "png" or "svg"
+
+    Returns:
+        bytes: The encoded image
+    """
+    # Imported on first render: qrcode pulls in PIL, which would otherwise
+    # slow down every worker boot and CLI start
+    import qrcode
+    import qrcode.image.svg
+
+    qr = qrcode.QRCode(version=1, box_size=box_size, border=5)
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    buffer = io.BytesIO()
+    if fmt == "svg":
+        img = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+        img.save(buffer)
+    else:
+        img = qr.make_image(fill_color="black", back_color="white")
+        img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class QRCache:
+    """
+    Byte-bounded LRU cache of rendered QR images.
+
+    Images are keyed by (data, box_size, format) and stored together with
+    a strong ETag. Misses are rendered in a small process pool so CPU-heavy
+    bursts of QR requests don't hold the GIL of the serving worker;
+    concurrent requests for the same image share a single render.
+
+    Args:
+        max_bytes: Upper bound on the total size of cached images
+        processes: Size of the render process pool, 0 to render inline
+        timeout: Seconds to wait for a render before giving up
+    """
+
+    def __init__(self,
+                 max_bytes: int = 16 * 1024 * 1024,
+                 processes: int = 1,
+                 timeout: float = 10.0):
+        self.max_bytes = max_bytes
+        self.processes = processes
+        self.timeout = timeout
+        self._images: "OrderedDict[tuple, Tuple[bytes, str]]" = OrderedDict()
+        self._size = 0
+        self._inflight: Dict[tuple, Future] = {}
+        self._lock = threading.Lock()
+        self._pool: Optional[Executor] = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, data: str, box_size: int = 10, fmt: str = "png") -> Tuple[bytes, str]:
+        """
+        Return (image bytes, etag) for a QR code, rendering it if needed.
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported QR format: {fmt}")
+        box_size = max(MIN_BOX_SIZE, min(MAX_BOX_SIZE, box_size))
+        key = (data, box_size, fmt)
+
+        with self._lock:
+            cached = self._images.get(key)
+            if cached is not None:
+                self._images.move_to_end(key)
+                self.hits += 1
+                return cached
+
+            self.misses += 1
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+
+        if not owner:
+            return future.result(self.timeout)
+
+        try:
+            start = time.perf_counter()
+            with span("qr.render"):
+                image = self._render(data, box_size, fmt)
+            QR_RENDER_SECONDS.observe(time.perf_counter() - start)
+            entry = (image, hashlib.sha1(image).hexdigest())
+            self._store(key, entry)
+            future.set_result(entry)
+            return entry
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _render(self, data: str, box_size: int, fmt: str) -> bytes:
+        if not self.processes:
+            return render_qr(data, box_size, fmt)
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    from concurrent.futures import ProcessPoolExecutor
+                    self._pool = ProcessPoolExecutor(self.processes)
+        return self._pool.submit(render_qr, data, box_size, fmt).result(self.timeout)
+
+    def _store(self, key: tuple, entry: Tuple[bytes, str]) -> None:
+        size = len(entry[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._images.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[0])
+            self._images[key] = entry
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (image, _) = self._images.popitem(last=False)
+                self._size -= len(image)
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the cache's current footprint."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._images),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
+
+    def close(self) -> None:
+        """Shut down the render process pool."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
@@ -0,0 +1,268 @@
+"""
+Token-bucket rate limits and load shedding shared by all workers.
+
+Each budget ("create" for /shorten, "redirect" for short links) has an
+optional per-client and an optional global bucket. Bucket state is a
+fixed-size table of ``(client key, tokens, updated_at)`` slots; with a
+``path`` that table is a memory-mapped file, so every gunicorn worker on
+the host draws from the same buckets without an external service.
+Updates are serialised by an ``fcntl`` lock on the file's first byte,
+which is held for a few microseconds per request.
+
+Clients hash to a set of ``WAYS`` slots. When all of them are taken by
+other clients, the least recently seen one is evicted and starts over
+with a full bucket, so the table only needs to be sized for the clients
+active within a bucket's refill time.
+
+Creates are also shed while the average create latency, shared the same
+way and decaying while no writes complete, is above ``shed_latency``.
+"""
+import hashlib
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: buckets are per process
+    fcntl = None
+
+from . import metrics
+
+BUDGETS = ("create", "redirect")
+# Slots per client set
+WAYS = 4
+# Weight of the newest create latency in the shared average
+LATENCY_WEIGHT = 0.2
+# Seconds for the average to halve while no create completes, so shedding
+# lets a trickle of writes through to notice when the database recovers
+LATENCY_HALF_LIFE = 1.0
+
+_MAGIC = b"PYTR"
+# magic, slot count, padding
+_HEADER = struct.Struct("<4sI8x")
+# tokens or latency average, updated_at
+_STATE = struct.Struct("<dd")
+# client key (0 = free), tokens, updated_at
+_SLOT = struct.Struct("<Qdd")
+# Shed latency average, then one global bucket per budget
+_SHED = _HEADER.size
+_GLOBALS = _SHED + _STATE.size
+_TABLE = _GLOBALS + _STATE.size * len(BUDGETS)
+
+_LIMIT_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)/(s|m|h)$")
+_PERIODS = {"s": 1, "m": 60, "h": 3600}
+
+
+class Limit(NamedTuple):
+    """Refill rate in tokens per second and bucket size."""
+    rate: float
+    burst: float
+
+
+def parse_limit(spec: Optional[str]) -> Optional[Limit]:
+    """
+    Parse a limit like "30/m" or "100/s": that many requests per period,
+    all of which may come at once. Returns None for an empty spec.
+    """
+    if not spec or not spec.strip():
+        return None
+    match = _LIMIT_PATTERN.match(spec.strip())
+    if not match or float(match.group(1)) <= 0:
+        raise ValueError(f"Invalid rate limit: {spec}")
+    count = float(match.group(1))
+    return Limit(count / _PERIODS[match.group(2)], count)
+
+
+class RateLimiter:
+    """
+    Per-client and global token buckets for each budget.
+
+    Args:
+        limits: Budget name -> (per-client Limit, global Limit), either None
+        path: File to share bucket state through, None for this process only
+        slots: Client slots in the table, rounded up to a multiple of WAYS
+        shed_latency: Average create latency in seconds above which creates
+            are refused, 0 disables shedding
+    """
+
+    def __init__(self,
+                 limits: Dict[str, Tuple[Optional[Limit], Optional[Limit]]],
+                 path: Optional[str] = None,
+                 slots: int = 65536,
+                 shed_latency: float = 0.0):
+        self.limits = {budget: limits.get(budget, (None, None)) for budget in BUDGETS}
+        self.path = path
+        self.sets = max(1, -(-slots // WAYS))
+        self.shed_latency = shed_latency
+        size = _TABLE + self.sets * WAYS * _SLOT.size
+        self._fd = None
+        if path and fcntl is not None:
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            header = _HEADER.pack(_MAGIC, self.sets * WAYS)
+            self._lock_file()
+            try:
+                # A table left by a different configuration starts over
+                if os.pread(self._fd, _HEADER.size, 0) != header or \
+                        os.fstat(self._fd).st_size != size:
+                    os.ftruncate(self._fd, 0)
+                    os.ftruncate(self._fd, size)
+                    os.pwrite(self._fd, header, 0)
+            finally:
+                self._unlock_file()
+            self._buffer = mmap.mmap(self._fd, size)
+        else:
+            self._buffer = bytearray(size)
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    @classmethod
+    def from_config(cls, config) -> Optional["RateLimiter"]:
+        """Build a RateLimiter from a Config, None if no limit is set."""
+        limits = {
+            "create": (parse_limit(config.RATE_LIMIT_CREATE),
+                       parse_limit(config.RATE_LIMIT_CREATE_GLOBAL)),
+            "redirect": (parse_limit(config.RATE_LIMIT_REDIRECT),
+                         parse_limit(config.RATE_LIMIT_REDIRECT_GLOBAL)),
+        }
+        if not config.SHED_WRITE_LATENCY and not any(
+                limit for pair in limits.values() for limit in pair):
+            return None
+        return cls(limits, config.RATE_LIMIT_PATH, config.RATE_LIMIT_CLIENTS,
+                   config.SHED_WRITE_LATENCY)
+
+    def _lock_file(self) -> None:
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, 0)
+
+    def _unlock_file(self) -> None:
+        fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, 0)
+
+    def _acquire(self) -> None:
+        if self._pid != os.getpid():
+            # A thread of the parent may have held the lock while forking
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+        self._lock.acquire()
+        if self._fd is not None:
+            try:
+                self._lock_file()
+            except BaseException:
+                self._lock.release()
+                raise
+
+    def _release(self) -> None:
+        if self._fd is not None:
+            self._unlock_file()
+        self._lock.release()
+
+    def admit(self, budget: str, client: Optional[str], cost: float = 1.0) -> float:
+        """
+        Take cost tokens from client's and the global bucket of budget.
+
+        Nothing is taken unless every applicable bucket has enough, and
+        creates are refused outright while shedding.
+
+        Returns:
+            float: 0 if admitted, else seconds until a retry can succeed
+        """
+        client_limit, global_limit = self.limits[budget]
+        shed = budget == "create" and self.shed_latency
+        if not (client_limit or global_limit or shed):
+            return 0.0
+
+        now = time.time()
+        buffer = self._buffer
+        self._acquire()
+        try:
+            if shed and self._latency(now) > self.shed_latency:
+                reason, wait = "shed", LATENCY_HALF_LIFE
+            else:
+                reason, wait = None, 0.0
+                taken = []
+                if client_limit and client:
+                    offset = self._slot(budget, client, now, client_limit)
+                    tokens, wait = _refill(buffer, offset + 8, client_limit, now, cost)
+                    reason = budget if wait else None
+                    taken.append((offset + 8, tokens))
+                if global_limit and not wait:
+                    offset = _GLOBALS + _STATE.size * BUDGETS.index(budget)
+                    tokens, wait = _refill(buffer, offset, global_limit, now, cost)
+                    reason = f"{budget}_global" if wait else None
+                    taken.append((offset, tokens))
+                if not wait:
+                    for offset, tokens in taken:
+                        _STATE.pack_into(buffer, offset, tokens - cost, now)
+        finally:
+            self._release()
+
+        if reason:
+            metrics.THROTTLED[reason].inc()
+        return wait
+
+    def _slot(self, budget: str, client: str, now: float, limit: Limit) -> int:
+        """Return the offset of client's slot, claiming one if needed."""
+        digest = hashlib.blake2b(f"{budget}\0{client}".encode(), digest_size=8).digest()
+        key = int.from_bytes(digest, "little") | 1
+        first = _TABLE + (key % self.sets) * WAYS * _SLOT.size
+        oldest = None
+        for way in range(WAYS):
+            offset = first + way * _SLOT.size
+            slot_key, _, updated_at = _SLOT.unpack_from(self._buffer, offset)
+            if slot_key == key:
+                return offset
+            if oldest is None or updated_at < oldest[0]:
+                oldest = (updated_at, offset)
+        offset = oldest[1]
+        _SLOT.pack_into(self._buffer, offset, key, limit.burst, now)
+        return offset
+
+    def record_write(self, seconds: float) -> None:
+        """Fold the latency of a completed create into the shared average."""
+        if not self.shed_latency:
+            return
+        now = time.time()
+        self._acquire()
+        try:
+            average = self._latency(now)
+            _STATE.pack_into(self._buffer, _SHED,
+                             average + LATENCY_WEIGHT * (seconds - average), now)
+        finally:
+            self._release()
+
+    def _latency(self, now: float) -> float:
+        average, updated_at = _STATE.unpack_from(self._buffer, _SHED)
+        return average * 0.5 ** (max(0.0, now - updated_at) / LATENCY_HALF_LIFE)
+
+    def close(self) -> None:
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def _refill(buffer, offset: int, limit: Limit, now: float,
+            cost: float) -> Tuple[float, float]:
+    """Return (tokens after refilling the bucket at offset, seconds to wait for cost)."""
+    tokens, updated_at = _STATE.unpack_from(buffer, offset)
+    if updated_at == 0:
+        tokens = limit.burst
+    else:
+        tokens = min(limit.burst, tokens + max(0.0, now - updated_at) * limit.rate)
+    if tokens >= cost:
+        return tokens, 0.0
+    if cost > limit.burst:
+        # Can never be admitted; retrying after a full refill at least
+        # lets smaller requests through
+        return tokens, limit.burst / limit.rate
+    return tokens, (cost - tokens) / limit.rate
+
+
+def retry_after_header(seconds: float) -> str:
+    """Format a wait for the Retry-After header, in whole seconds."""
+    return str(max(1, math.ceil(seconds)))
@@ -0,0 +1,194 @@
+import threading
+import time
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from .core import PyTiny
+from .expiry import ExpiryWheel
+
+
+class Reaper:
+    """
+    Incremental remover of expired links.
+
+    Each run deletes expired rows in batches of ``batch_size`` using the
+    ``expires_at`` index and sleeps ``pause`` seconds between batches, so
+    the SQLite write lock is only ever held briefly and redirects and
+    creates keep flowing. When several processes run a reaper against the
+    same database, a lock file ensures only one of them reaps at a time.
+
+    Between runs, a background reaper keeps the links expiring within the
+    next ``horizon`` seconds on an ``ExpiryWheel`` and deletes them as
+    they expire, instead of letting them linger for up to ``interval``.
+
+    Args:
+        shortener: PyTiny instance to reap
+        batch_size: Rows deleted per transaction
+        pause: Seconds to yield between batches
+        interval: Seconds between runs when running in the background
+        horizon: Seconds ahead to schedule expiring links between runs,
+            0 to only reap every interval
+    """
+
+    def __init__(self,
+                 shortener: PyTiny,
+                 batch_size: int = 500,
+                 pause: float = 0.05,
+                 interval: float = 60.0,
+                 horizon: int = 3600):
+        self.shortener = shortener
+        self.batch_size = batch_size
+        self.pause = pause
+        self.interval = interval
+        self.horizon = horizon
+        self.wheel: Optional[ExpiryWheel] = None
+        self.last_run: Optional[dict] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> Optional[dict]:
+        """
+        Delete every currently expired link, batch by batch.
+
+        Returns:
+            Optional[dict]: Rows deleted, elapsed seconds, rows/sec, the
+            lag (age of the oldest expired link) before the run, the
+            number of click rollups pruned and of links scheduled on the
+            expiry wheel, or None if another process holds the reaper lock
+        """
+        lock = self._acquire_lock()
+        if lock is False:
+            return None
+
+        try:
+            now = int(time.time())
+            lag = self.shortener.expired_lag(now)
+            deleted = 0
+            start = time.perf_counter()
+
+            while not self._stop.is_set():
+                batch = self.shortener.delete_expired_batch(self.batch_size, now)
+                deleted += batch
+                if batch < self.batch_size:
+                    break
+                time.sleep(self.pause)
+
+            elapsed = time.perf_counter() - start
+            pruned = self.shortener.prune_analytics(now, self.batch_size)
+            if self.wheel is not None:
+                # Picks up links other processes created since the last run
+                self.wheel.load(self.shortener.storage, now, self.batch_size)
+            self.last_run = {
+                "deleted": deleted,
+                "elapsed": elapsed,
+                "rows_per_sec": deleted / elapsed if elapsed > 0 else 0.0,
+                "lag": lag,
+                "pruned": pruned,
+                "scheduled": len(self.wheel) if self.wheel is not None else 0,
+                "finished_at": int(time.time()),
+            }
+            return self.last_run
+        finally:
+            if lock:
+                lock.close()
+
+    def run_due(self, now: Optional[int] = None) -> int:
+        """
+        Delete the links the expiry wheel says have just expired.
+
+        Returns:
+            int: Rows deleted, 0 if nothing was due or another process
+            holds the reaper lock
+        """
+        if now is None:
+            now = int(time.time())
+
+        if not self.shortener.expire_due(now):
+            return 0
+        lock = self._acquire_lock()
+        if lock is False:
+            return 0
+
+        try:
+            deleted = 0
+            while True:
+                batch = self.shortener.delete_expired_batch(self.batch_size, now)
+                deleted += batch
+                if batch < self.batch_size:
+                    return deleted
+        finally:
+            if lock:
+                lock.close()
+
+    def sleep(self, seconds: float) -> None:
+        """
+        Wait up to seconds, deleting links at their expiry in the meantime.
+
+        Returns early when stop() is called.
+        """
+        if self.horizon and self.wheel is None:
+            self.wheel = self.shortener.track_expiry(self.horizon)
+            self.wheel.load(self.shortener.storage, int(time.time()), self.batch_size)
+
+        end = time.monotonic() + seconds
+        while not self._stop.is_set():
+            wait = end - time.monotonic()
+            if wait <= 0:
+                return
+            if self.wheel is None:
+                self._stop.wait(wait)
+                continue
+            # Look again at least every second for links scheduled meanwhile
+            due = self.wheel.next_deadline()
+            if due is not None:
+                wait = min(wait, max(0.0, due - time.time()))
+            if self._stop.wait(min(wait, 1.0)):
+                return
+            try:
+                self.run_due()
+            except Exception as e:
+                print(f"Reaper error: {str(e)}")
+
+    def _acquire_lock(self):
+        """Take the per-database reaper lock, False if someone else has it."""
+        db_path = self.shortener.db_path
+        if fcntl is None or db_path == ":memory:" or "://" in db_path:
+            # Memory storage has one process; on a server, concurrent
+            # reapers delete each expired link in its own transaction
+            return None
+        lock = open(db_path + ".reaper.lock", "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return False
+        return lock
+
+    def start(self) -> None:
+        """Run the reaper every interval seconds on a daemon thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever,
+                                        name="pytiny-reaper", daemon=True)
+        self._thread.start()
+
+    def run_forever(self) -> None:
+        """Reap, then wait interval seconds, until stop() is called."""
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Reaper error: {str(e)}")
+            self.sleep(self.interval)
+
+    def stop(self) -> None:
+        """Stop the background thread."""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
@@ -0,0 +1,91 @@
+"""
+HTTP caching policy for redirect responses.
+
+Each link may carry its own redirect status and cache lifetime; links
+without one use the server defaults. The ``max-age`` sent with a redirect
+never reaches past the link's ``expires_at``, so neither browsers nor CDNs
+can keep serving a link after it expired. A cache lifetime of 0 opts a link
+out of caching entirely, e.g. when every click has to be counted.
+"""
+import hashlib
+import time
+from typing import List, Optional, Tuple
+
+REDIRECT_STATUSES = (301, 302, 307, 308)
+
+_DAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun",
+           "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+# (status, long_url, max_age, etag, last_modified)
+Redirect = Tuple[int, str, int, str, int]
+
+
+def validate_policy(redirect_status: Optional[int], cache_ttl: Optional[int]) -> None:
+    """Raise ValueError for a redirect status or cache lifetime that can't be used."""
+    if redirect_status is not None and redirect_status not in REDIRECT_STATUSES:
+        raise ValueError(f"Redirect status must be one of {REDIRECT_STATUSES}")
+    if cache_ttl is not None and cache_ttl < 0:
+        raise ValueError("Cache TTL must not be negative")
+
+
+def max_age(expires_at: Optional[int], cache_ttl: int, now: int) -> int:
+    """Return the seconds a redirect may be cached, capped at the link's expiry."""
+    if expires_at is not None:
+        return max(0, min(cache_ttl, expires_at - now))
+    return cache_ttl
+
+
+def link_etag(long_url: str, redirect_status: int) -> str:
+    """Return a strong ETag for a redirect, changing with its target or status."""
+    digest = hashlib.blake2b(f"{redirect_status} {long_url}".encode(), digest_size=8)
+    return f'"{digest.hexdigest()}"'
+
+
+def http_date(timestamp: int) -> str:
+    """Format a Unix timestamp as an HTTP date, independent of the locale."""
+    t = time.gmtime(timestamp)
+    return (f"{_DAYS[t.tm_wday]}, {t.tm_mday:02d} {_MONTHS[t.tm_mon - 1]} "
+            f"{t.tm_year} {t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d} GMT")
+
+
+def cache_headers(redirect: Redirect) -> List[Tuple[str, str]]:
+    """Return the caching headers of a redirect response."""
+    _, _, age, etag, last_modified = redirect
+    cache_control = f"public, max-age={age}" if age > 0 else "no-store"
+    return [
+        ("Cache-Control", cache_control),
+        ("ETag", etag),
+        ("Last-Modified", http_date(last_modified)),
+    ]
+
+
+def not_modified(redirect: Redirect,
+                 if_none_match: Optional[str],
+                 if_modified_since: Optional[str]) -> bool:
+    """
+    Check whether a conditional request can be answered with 304.
+
+    Args:
+        redirect: The redirect that would be sent
+        if_none_match: If-None-Match request header
+        if_modified_since: If-Modified-Since request header, only used
+            without If-None-Match
+
+    Returns:
+        bool: True if the client's cached copy is still current
+    """
+    _, _, age, etag, last_modified = redirect
+    if age <= 0:
+        return False
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    if if_modified_since:
+        # email.utils is only needed here; importing it costs worker startup
+        from email.utils import parsedate_to_datetime
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
@@ -0,0 +1,616 @@
+"""
+Link storage on a Redis-protocol key-value server.
+
+Pointing several nodes at one Redis (or a compatible server such as
+KeyDB, Dragonfly or Valkey) gives them a shared link table, so a link
+created on one node redirects on every other without a database file to
+replicate. The client speaks RESP over plain sockets and needs no extra
+dependency.
+
+Every link is a hash, ``{prefix}link:{code}``, with one single-letter
+field per column; unset columns are absent. Writes that must not act on a
+link that was deleted meanwhile run as WATCH/MULTI/EXEC transactions and
+are retried when a watched key changes.
+"""
+import json
+import os
+import socket
+import threading
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import unquote, urlsplit
+
+from .analytics import RollupRow
+from .clicks import ClickBatch
+from .storage import FullRow, HashMatch, Link, NewRow, StatsRow, Storage
+
+# Hash fields of a link
+_URL, _CREATED, _EXPIRES, _STATUS, _TTL = "u", "c", "e", "s", "t"
+_HASH, _CLICKS, _LAST_CLICKED, _ROW = "h", "n", "l", "i"
+
+
+class RedisError(Exception):
+    """Error reply from the server."""
+
+
+class RedisClient:
+    """
+    Minimal RESP client with one connection per thread.
+
+    Like ``ConnectionPool``, connections are opened lazily and never shared
+    across ``fork()``. Commands can be pipelined: all are sent before any
+    reply is read, costing a single round trip.
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", timeout: float = 5.0):
+        parts = urlsplit(url)
+        if parts.scheme != "redis":
+            raise ValueError(f"Unsupported Redis URL scheme: {parts.scheme!r}")
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 6379
+        self.username = unquote(parts.username) if parts.username else None
+        self.password = unquote(parts.password) if parts.password else None
+        self.db = int(parts.path.strip("/") or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sockets: List[socket.socket] = []
+        self._pid = os.getpid()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = (sock, sock.makefile("rb"))
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.username, self.password) if self.username
+                         else ("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            self._send(conn, setup)
+        return conn
+
+    def _get(self):
+        if self._pid != os.getpid():
+            # Sockets inherited from the parent belong to its session
+            self._pid = os.getpid()
+            self._local = threading.local()
+            self._lock = threading.Lock()
+            self._sockets = []
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._lock:
+                self._sockets.append(conn[0])
+        return conn
+
+    def execute(self, *args):
+        """Run one command and return its reply."""
+        return self.pipeline([args])[0]
+
+    def pipeline(self, commands: Sequence[Sequence]) -> list:
+        """
+        Run commands in one round trip and return their replies.
+
+        Raises:
+            RedisError: If any command failed; the other replies are read
+                first so the connection stays usable
+            OSError: If the connection broke; it is reopened on the next call
+        """
+        conn = self._get()
+        try:
+            return self._send(conn, commands)
+        except OSError:
+            self._local.conn = None
+            conn[0].close()
+            raise
+
+    def _send(self, conn, commands: Sequence[Sequence]) -> list:
+        out = bytearray()
+        for command in commands:
+            out += b"*%d\r\n" % len(command)
+            for arg in command:
+                if not isinstance(arg, bytes):
+                    arg = str(arg).encode()
+                out += b"$%d\r\n%s\r\n" % (len(arg), arg)
+        conn[0].sendall(out)
+        replies = [_read_reply(conn[1]) for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+            if isinstance(reply, list):
+                for item in reply:
+                    if isinstance(item, RedisError):
+                        raise item
+        return replies
+
+    def close(self) -> None:
+        """Close every connection opened by this client in this process."""
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            sockets, self._sockets = self._sockets, []
+        for sock in sockets:
+            sock.close()
+        self._local = threading.local()
+
+
+def _read_reply(reader):
+    line = reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("Connection closed by the Redis server")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        return RedisError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        size = int(rest)
+        if size < 0:
+            return None
+        data = reader.read(size + 2)
+        if len(data) != size + 2:
+            raise ConnectionError("Connection closed by the Redis server")
+        return data[:-2]
+    if kind == b"*":
+        size = int(rest)
+        if size < 0:
+            return None
+        return [_read_reply(reader) for _ in range(size)]
+    raise RedisError(f"Unexpected reply type {kind!r}")
+
+
+def _int(value: Optional[bytes]) -> Optional[int]:
+    return int(value) if value is not None else None
+
+
+class RedisStorage(Storage):
+    """
+    Link storage on a Redis-protocol server shared by several nodes.
+
+    Links, click counts and click rollups are supported. Redirect snapshots
+    are not: the server already is the shared copy every node reads from.
+    Bloom filters of codes are not used either: without a cheap change
+    token each miss would cost a round trip, as a lookup does. Servers
+    written by older versions keep a ``codes`` list that nothing reads any
+    more and can be removed with ``DEL <prefix>codes``.
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", prefix: str = "pytiny:",
+                 timeout: float = 5.0):
+        self.db_path = url
+        self.prefix = prefix
+        self._client = RedisClient(url, timeout)
+
+    def _key(self, short_code: str) -> str:
+        return f"{self.prefix}link:{short_code}"
+
+    def _transaction(self, keys: Sequence[str], reads: Sequence[Sequence],
+                     build: Callable[[list], Tuple[List[Sequence], object]]):
+        """
+        Run reads with keys watched, then the writes build() derives from them.
+
+        build() receives the read replies and returns the commands to run in
+        MULTI/EXEC and the result to return. Everything is retried if another
+        client changed a watched key in between.
+        """
+        client = self._client
+        while True:
+            replies = client.pipeline([("WATCH", *keys), *reads])[1:]
+            commands, result = build(replies)
+            if not commands:
+                client.execute("UNWATCH")
+                return result
+            if client.pipeline([("MULTI",), *commands, ("EXEC",)])[-1] is not None:
+                return result
+
+    def _link_writes(self, short_code: str, row: FullRow, row_id: int) -> List[Sequence]:
+        """Commands storing a new link, see copy_rows() for the row layout."""
+        (_, long_url, created_at, expires_at, clicks, last_clicked, url_hash,
+         redirect_status, cache_ttl) = row
+        fields = [_URL, long_url, _CREATED, created_at, _CLICKS, clicks, _ROW, row_id]
+        for field, value in ((_EXPIRES, expires_at), (_LAST_CLICKED, last_clicked),
+                             (_HASH, url_hash), (_STATUS, redirect_status),
+                             (_TTL, cache_ttl)):
+            if value is not None:
+                fields += [field, value]
+        commands = [("HSET", self._key(short_code), *fields),
+                    ("INCR", f"{self.prefix}count")]
+        if clicks:
+            commands.append(("INCRBY", f"{self.prefix}clicks", clicks))
+        if expires_at is not None:
+            commands.append(("ZADD", f"{self.prefix}expiry", expires_at, short_code))
+        if url_hash is not None:
+            commands.append(("SADD", f"{self.prefix}hash:{url_hash}", short_code))
+        return commands
+
+    def _unlink_writes(self, short_code: str, url_hash: Optional[bytes],
+                       clicks: Optional[bytes]) -> List[Sequence]:
+        """Commands removing an existing link, leaving its rollups."""
+        commands = [("DEL", self._key(short_code)),
+                    ("ZREM", f"{self.prefix}expiry", short_code),
+                    ("DECR", f"{self.prefix}count")]
+        if url_hash is not None:
+            commands.append(("SREM", f"{self.prefix}hash:{url_hash.decode()}", short_code))
+        if clicks and int(clicks):
+            commands.append(("DECRBY", f"{self.prefix}clicks", int(clicks)))
+        return commands
+
+    def reserve_ids(self, count: int) -> int:
+        """Reserve count consecutive code IDs. Returns the first one."""
+        return self._client.execute("INCRBY", f"{self.prefix}seq", count) - count
+
+    def sequence_value(self) -> int:
+        """Return the next unreserved code ID."""
+        return _int(self._client.execute("GET", f"{self.prefix}seq")) or 0
+
+    def advance_sequence(self, value: int) -> None:
+        """Make sure IDs below value are never reserved again."""
+        key = f"{self.prefix}seq"
+
+        def build(replies):
+            if (_int(replies[0]) or 0) >= value:
+                return [], None
+            return [("SET", key, value)], None
+
+        self._transaction([key], [("GET", key)], build)
+
+    def insert(self, row: NewRow, url_hash: Optional[int] = None,
+               redirect_status: Optional[int] = None,
+               cache_ttl: Optional[int] = None) -> bool:
+        """Insert a new link. Returns False if its short code is taken."""
+        short_code, long_url, created_at, expires_at = row
+        full = (short_code, long_url, created_at, expires_at, 0, None, url_hash,
+                redirect_status, cache_ttl)
+
+        def build(replies):
+            exists, row_id = replies
+            if exists:
+                return [], False
+            return self._link_writes(short_code, full, row_id), True
+
+        return self._transaction([self._key(short_code)],
+                                 [("EXISTS", self._key(short_code)),
+                                  ("INCR", f"{self.prefix}rows")], build)
+
+    def insert_many(self, rows: Sequence[NewRow],
+                    url_hashes: Optional[Sequence[Optional[int]]] = None) -> List[int]:
+        """Insert new links in one transaction, skipping taken or repeated codes."""
+        if not rows:
+            return []
+        hashes = url_hashes or [None] * len(rows)
+        keys = [self._key(row[0]) for row in rows]
+
+        def build(replies):
+            first_id = replies[-1] - len(rows) + 1
+            commands = []
+            clashes = []
+            seen = set()
+            for i, (row, exists) in enumerate(zip(rows, replies)):
+                short_code, long_url, created_at, expires_at = row
+                if exists or short_code in seen:
+                    clashes.append(i)
+                else:
+                    commands += self._link_writes(
+                        short_code, (short_code, long_url, created_at, expires_at, 0,
+                                     None, hashes[i], None, None), first_id + i)
+                seen.add(short_code)
+            return commands, clashes
+
+        return self._transaction(keys, [("EXISTS", key) for key in keys]
+                                 + [("INCRBY", f"{self.prefix}rows", len(rows))], build)
+
+    def get(self, short_code: str) -> Optional[Link]:
+        """Return (long_url, expires_at, created_at, redirect_status, cache_ttl) for a short code."""
+        long_url, expires_at, created_at, status, ttl = self._client.execute(
+            "HMGET", self._key(short_code), _URL, _EXPIRES, _CREATED, _STATUS, _TTL)
+        if long_url is None:
+            return None
+        return (long_url.decode(), _int(expires_at), int(created_at),
+                _int(status), _int(ttl))
+
+    def find_by_hashes(self, url_hashes: Sequence[int]) -> List[HashMatch]:
+        """Return every link whose dedup hash is one of url_hashes, newest first."""
+        url_hashes = list(set(url_hashes))
+        if not url_hashes:
+            return []
+        members = self._client.pipeline([("SMEMBERS", f"{self.prefix}hash:{url_hash}")
+                                         for url_hash in url_hashes])
+        codes = [(url_hash, code.decode())
+                 for url_hash, found in zip(url_hashes, members) for code in found]
+        if not codes:
+            return []
+        replies = self._client.pipeline([
+            ("HMGET", self._key(code), _ROW, _URL, _CREATED, _EXPIRES)
+            for _, code in codes
+        ])
+        matches = []
+        for (url_hash, code), (row_id, long_url, created_at, expires_at) in zip(codes, replies):
+            if long_url is not None:
+                matches.append((int(row_id), url_hash, code, long_url.decode(),
+                                int(created_at), _int(expires_at)))
+        matches.sort(reverse=True)
+        return [match[1:] for match in matches]
+
+    def get_stats(self, short_code: str) -> Optional[StatsRow]:
+        """
+        Return (created_at, expires_at, clicks, last_clicked, redirect_status,
+        cache_ttl) for a short code.
+        """
+        created_at, expires_at, clicks, last_clicked, status, ttl = self._client.execute(
+            "HMGET", self._key(short_code),
+            _CREATED, _EXPIRES, _CLICKS, _LAST_CLICKED, _STATUS, _TTL)
+        if created_at is None:
+            return None
+        return (int(created_at), _int(expires_at), int(clicks or 0),
+                _int(last_clicked), _int(status), _int(ttl))
+
+    def incr_clicks(self, batch: ClickBatch) -> None:
+        """Apply click increments in one transaction, skipping deleted links."""
+        if not batch:
+            return
+        codes = list(batch)
+        keys = [self._key(code) for code in codes]
+
+        def build(replies):
+            commands = []
+            total = 0
+            for code, key, (long_url, last_clicked) in zip(codes, keys, replies):
+                if long_url is None:
+                    continue
+                count, last = batch[code]
+                total += count
+                commands.append(("HINCRBY", key, _CLICKS, count))
+                if last > (_int(last_clicked) or 0):
+                    commands.append(("HSET", key, _LAST_CLICKED, last))
+            if total:
+                commands.append(("INCRBY", f"{self.prefix}clicks", total))
+            return commands, None
+
+        self._transaction(keys, [("HMGET", key, _URL, _LAST_CLICKED) for key in keys], build)
+
+    def delete(self, short_code: str) -> bool:
+        """Delete a link and its click history. Returns True if it existed."""
+        key = self._key(short_code)
+        index = f"{self.prefix}rollups:{short_code}"
+
+        def build(replies):
+            (long_url, url_hash, clicks), buckets = replies
+            if long_url is None:
+                return [], False
+            commands = self._unlink_writes(short_code, url_hash, clicks)
+            commands += self._rollup_deletes(short_code, [b.decode() for b in buckets])
+            return commands, True
+
+        return self._transaction([key, index],
+                                 [("HMGET", key, _URL, _HASH, _CLICKS),
+                                  ("ZRANGE", index, 0, -1)], build)
+
+    def _rollup_deletes(self, short_code: str, buckets: List[str]) -> List[Sequence]:
+        """Commands deleting the rollups of short_code at "resolution:bucket" members."""
+        commands = []
+        for member in buckets:
+            resolution, bucket = member.split(":")
+            commands += [("DEL", f"{self.prefix}rollup:{short_code}:{member}"),
+                         ("ZREM", f"{self.prefix}rollups:{resolution}",
+                          f"{bucket} {short_code}")]
+        if buckets:
+            commands.append(("DEL", f"{self.prefix}rollups:{short_code}"))
+        return commands
+
+    def add_rollups(self, rows: Sequence[RollupRow]) -> None:
+        """
+        Add click counts to the time-bucketed rollups in one pipeline.
+
+        Each (code, resolution, bucket) is a hash of counts keyed by
+        referrer and agent, indexed per code for range reads and per
+        resolution for pruning.
+        """
+        commands = []
+        for short_code, resolution, bucket, referrer, agent, clicks in rows:
+            member = f"{resolution}:{bucket}"
+            commands += [
+                ("HINCRBY", f"{self.prefix}rollup:{short_code}:{member}",
+                 json.dumps([referrer, agent]), clicks),
+                ("ZADD", f"{self.prefix}rollups:{short_code}", bucket, member),
+                ("ZADD", f"{self.prefix}rollups:{resolution}", bucket,
+                 f"{bucket} {short_code}"),
+            ]
+        if commands:
+            self._client.pipeline(commands)
+
+    def get_rollups(self, short_code: str, resolution: int,
+                    start: int, end: int) -> List[Tuple[int, str, str, int]]:
+        """Return (bucket, referrer, agent, clicks) rows in [start, end)."""
+        members = [member.decode() for member in self._client.execute(
+            "ZRANGEBYSCORE", f"{self.prefix}rollups:{short_code}", start, f"({end}")]
+        members = [member for member in members
+                   if member.split(":")[0] == str(resolution)]
+        if not members:
+            return []
+        replies = self._client.pipeline([
+            ("HGETALL", f"{self.prefix}rollup:{short_code}:{member}") for member in members
+        ])
+        rows = []
+        for member, fields in zip(members, replies):
+            bucket = int(member.split(":")[1])
+            for i in range(0, len(fields), 2):
+                referrer, agent = json.loads(fields[i])
+                rows.append((bucket, referrer, agent, int(fields[i + 1])))
+        rows.sort()
+        return rows
+
+    def prune_rollups(self, resolution: int, before: int, limit: int) -> int:
+        """Delete the rollups of up to limit (code, bucket) pairs older than before."""
+        members = [member.decode() for member in self._client.execute(
+            "ZRANGEBYSCORE", f"{self.prefix}rollups:{resolution}", "-inf", f"({before}",
+            "LIMIT", 0, limit)]
+        if not members:
+            return 0
+        commands = []
+        for member in members:
+            bucket, short_code = member.split(" ", 1)
+            commands += [
+                ("DEL", f"{self.prefix}rollup:{short_code}:{resolution}:{bucket}"),
+                ("ZREM", f"{self.prefix}rollups:{short_code}", f"{resolution}:{bucket}"),
+                ("ZREM", f"{self.prefix}rollups:{resolution}", member),
+            ]
+        self._client.pipeline(commands)
+        return len(members)
+
+    def update_expiry(self, short_code: str, expires_at: Optional[int]) -> bool:
+        """Set a link's expiry. Returns True if it exists."""
+        key = self._key(short_code)
+
+        def build(replies):
+            if not replies[0]:
+                return [], False
+            if expires_at is None:
+                return [("HDEL", key, _EXPIRES),
+                        ("ZREM", f"{self.prefix}expiry", short_code)], True
+            return [("HSET", key, _EXPIRES, expires_at),
+                    ("ZADD", f"{self.prefix}expiry", expires_at, short_code)], True
+
+        return self._transaction([key], [("EXISTS", key)], build)
+
+    def set_redirect_policy(self, short_code: str, redirect_status: Optional[int],
+                            cache_ttl: Optional[int]) -> bool:
+        """Set a link's redirect status and cache lifetime. Returns True if it exists."""
+        key = self._key(short_code)
+
+        def build(replies):
+            if not replies[0]:
+                return [], False
+            commands = []
+            for field, value in ((_STATUS, redirect_status), (_TTL, cache_ttl)):
+                commands.append(("HDEL", key, field) if value is None
+                                else ("HSET", key, field, value))
+            return commands, True
+
+        return self._transaction([key], [("EXISTS", key)], build)
+
+    def delete_expired(self, now: int, limit: int) -> int:
+        """Delete up to limit links expired at now, oldest first."""
+        codes = [code.decode() for code in self._client.execute(
+            "ZRANGEBYSCORE", f"{self.prefix}expiry", "-inf", now, "LIMIT", 0, limit)]
+        if not codes:
+            return 0
+        keys = [self._key(code) for code in codes]
+        indexes = [f"{self.prefix}rollups:{code}" for code in codes]
+
+        def build(replies):
+            commands = []
+            deleted = 0
+            links, buckets = replies[:len(codes)], replies[len(codes):]
+            for code, (expires_at, url_hash, clicks), members in zip(codes, links, buckets):
+                if expires_at is None or int(expires_at) > now:
+                    # Deleted or given a new expiry since the range read
+                    continue
+                commands += self._unlink_writes(code, url_hash, clicks)
+                commands += self._rollup_deletes(code, [b.decode() for b in members])
+                deleted += 1
+            return commands, deleted
+
+        return self._transaction(keys + indexes,
+                                 [("HMGET", key, _EXPIRES, _HASH, _CLICKS) for key in keys] +
+                                 [("ZRANGE", index, 0, -1) for index in indexes], build)
+
+    def oldest_expired(self, now: int) -> Optional[int]:
+        """Return the earliest expires_at among links expired at now."""
+        reply = self._client.execute("ZRANGEBYSCORE", f"{self.prefix}expiry", "-inf", now,
+                                     "WITHSCORES", "LIMIT", 0, 1)
+        return int(float(reply[1])) if reply else None
+
+    def iter_expiring(self, after: int, until: int,
+                      batch_size: int = 1000) -> Iterator[Tuple[str, int]]:
+        """Yield (short_code, expires_at) for links expiring in (after, until]."""
+        offset = 0
+        while True:
+            reply = self._client.execute("ZRANGEBYSCORE", f"{self.prefix}expiry",
+                                         f"({after}", until, "WITHSCORES",
+                                         "LIMIT", offset, batch_size)
+            for i in range(0, len(reply), 2):
+                yield reply[i].decode(), int(float(reply[i + 1]))
+            if len(reply) < 2 * batch_size:
+                return
+            offset += batch_size
+
+    def iter_rows(self, batch_size: int = 1000) -> Iterator[FullRow]:
+        """Yield every stored link, scanning batch_size keys per round trip."""
+        return self.export_rows(batch_size)
+
+    def list_rows(self, after: Optional[int] = None, limit: int = 1000, now: int = 0,
+                  state: str = "all") -> Tuple[List[FullRow], Optional[int]]:
+        """
+        Return a page of links, cursors being SCAN cursors.
+
+        limit is a hint passed on as SCAN's COUNT, so pages may be somewhat
+        larger or smaller, and a link may show up twice if the keyspace is
+        rehashed during the listing.
+        """
+        prefix = self._key("")
+        cursor = after or 0
+        rows: List[FullRow] = []
+        while not rows:
+            cursor, keys = self._client.execute("SCAN", cursor, "MATCH", prefix + "*",
+                                                "COUNT", limit)
+            cursor = int(cursor)
+            if keys:
+                replies = self._client.pipeline([
+                    ("HMGET", key, _URL, _CREATED, _EXPIRES, _CLICKS, _LAST_CLICKED,
+                     _HASH, _STATUS, _TTL) for key in keys
+                ])
+                for key, values in zip(keys, replies):
+                    long_url, created_at, expires_at, clicks = values[:4]
+                    if long_url is None or not self._in_state(_int(expires_at), now, state):
+                        continue
+                    rows.append((key.decode()[len(prefix):], long_url.decode(),
+                                 int(created_at), _int(expires_at), int(clicks or 0),
+                                 *(_int(value) for value in values[4:])))
+            if cursor == 0:
+                return rows, None
+        return rows, cursor
+
+    def copy_rows(self, rows: Sequence[FullRow]) -> None:
+        """Insert or overwrite complete rows, e.g. while resharding."""
+        if not rows:
+            return
+        keys = [self._key(row[0]) for row in rows]
+
+        def build(replies):
+            first_id = replies[-1] - len(rows) + 1
+            commands = []
+            for i, (row, (row_id, url_hash, clicks)) in enumerate(zip(rows, replies)):
+                short_code = row[0]
+                if row_id is not None:
+                    commands += self._unlink_writes(short_code, url_hash, clicks)
+                    commands += [command for command in
+                                 self._link_writes(short_code, row, int(row_id))
+                                 if command[0] != "RPUSH"]
+                else:
+                    commands += self._link_writes(short_code, row, first_id + i)
+            return commands, None
+
+        self._transaction(keys, [("HMGET", key, _ROW, _HASH, _CLICKS) for key in keys]
+                          + [("INCRBY", f"{self.prefix}rows", len(rows))], build)
+
+    def summary(self, now: int) -> dict:
+        """Return link, expired-link and click totals from running counters."""
+        urls, expired, clicks = self._client.pipeline([
+            ("GET", f"{self.prefix}count"),
+            ("ZCOUNT", f"{self.prefix}expiry", "-inf", now),
+            ("GET", f"{self.prefix}clicks"),
+        ])
+        return {"urls": _int(urls) or 0, "expired": expired, "clicks": _int(clicks) or 0}
+
+    def ping(self) -> bool:
+        """Return True if the server answers."""
+        return self._client.execute("PING") == "PONG"
+
+    def close(self) -> None:
+        """Close this process's connections to the server."""
+        self._client.close()
@@ -0,0 +1,281 @@
+"""
+Read-only, memory-mapped snapshots of the code -> URL mapping.
+
+A snapshot file holds every live link sorted by short code::
+
+    header | JSON metadata | fanout | index | blob
+
+The fanout table has one cumulative entry count per two-byte code prefix,
+narrowing each lookup to a small slice of the index. Index entries are
+fixed width (code padded to ``CODE_WIDTH`` bytes, blob offset, URL length,
+expiry, creation time and redirect policy), so that slice is binary searched directly in the map. URLs live in
+the blob. The file is opened with ``mmap`` and every gunicorn worker shares
+the same pages through the OS page cache.
+
+Links deleted or updated after the snapshot was built are recorded by
+the storage in a change log. :class:`SnapshotView` skips snapshot entries
+for those codes, so lookups for them (and for codes newer than the
+snapshot) fall back to the database.
+"""
+import json
+import mmap
+import os
+import struct
+import time
+from typing import Optional, Tuple
+
+from .storage import Link
+
+MAGIC = b"PYTS"
+VERSION = 2
+# Longest code accepted by utils.is_valid_code
+CODE_WIDTH = 12
+
+# magic, version, code width, metadata length, entry count
+_HEADER = struct.Struct("<4sIIIQ")
+# blob offset, URL length, expires_at (0 = never), created_at,
+# redirect_status (0 = default), cache_ttl (-1 = default)
+_ENTRY_TAIL = struct.Struct("<QIqqHi")
+_ENTRY_SIZE = CODE_WIDTH + _ENTRY_TAIL.size
+_FANOUT = struct.Struct("<65536I")
+
+
+def _prefix(key: bytes) -> int:
+    return key[0] << 8 | key[1]
+
+
+def build_snapshot(storage, path: str, batch_size: int = 10000) -> dict:
+    """
+    Compile every live link in storage into a snapshot file at path.
+
+    The file is written next to path and moved into place with
+    ``os.replace``, so readers see either the old or the new snapshot,
+    never a partial one. Change log entries already folded into the
+    snapshot being replaced are pruned afterwards; workers still holding
+    an older map reopen the file on their next sync.
+
+    Args:
+        storage: Storage backend providing iter_sorted(), track_changes(),
+            last_change() and prune_changes()
+        path: Snapshot file to create or replace
+        batch_size: Rows read per query
+
+    Returns:
+        dict: Entry count, file size, pruned change log entries and the
+        metadata stored in the file
+    """
+    previous = None
+    if os.path.exists(path):
+        try:
+            old = Snapshot(path)
+            previous = old.metadata["changes"]
+            old.close()
+        except ValueError:
+            pass
+
+    now = int(time.time())
+    storage.track_changes()
+    # Taken before reading: later deletes and updates show up in the log
+    metadata = {"built_at": now, "changes": storage.last_change()}
+    meta = json.dumps(metadata).encode()
+    index_start = _HEADER.size + len(meta)
+    index_start += -index_start % 8 + _FANOUT.size
+
+    import tempfile
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".snapshot-", dir=directory)
+    counts = [0] * 65536
+    count = 0
+    try:
+        with os.fdopen(fd, "w+b") as out, tempfile.TemporaryFile(dir=directory) as blob:
+            out.seek(index_start)
+            offset = 0
+            for code, long_url, expires_at, created_at, status, cache_ttl \
+                    in storage.iter_sorted(batch_size):
+                key = code.encode()
+                if len(key) > CODE_WIDTH or len(key) < 2:
+                    continue
+                if expires_at is not None and expires_at <= now:
+                    continue
+                url = long_url.encode()
+                out.write(key.ljust(CODE_WIDTH, b"\0") + _ENTRY_TAIL.pack(
+                    offset, len(url), expires_at or 0, created_at, status or 0,
+                    -1 if cache_ttl is None else cache_ttl))
+                blob.write(url)
+                offset += len(url)
+                counts[_prefix(key)] += 1
+                count += 1
+
+            blob.seek(0)
+            while True:
+                chunk = blob.read(1 << 20)
+                if not chunk:
+                    break
+                out.write(chunk)
+
+            fanout = []
+            total = 0
+            for prefix_count in counts:
+                total += prefix_count
+                fanout.append(total)
+            out.seek(0)
+            out.write(_HEADER.pack(MAGIC, VERSION, CODE_WIDTH, len(meta), count))
+            out.write(meta)
+            out.seek(index_start - _FANOUT.size)
+            out.write(_FANOUT.pack(*fanout))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    pruned = storage.prune_changes(previous) if previous is not None else 0
+    return {"entries": count, "bytes": os.path.getsize(path), "pruned": pruned,
+            **metadata}
+
+
+class Snapshot:
+    """A snapshot file opened for lookups."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as fh:
+            self.inode = os.fstat(fh.fileno()).st_ino
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, width, meta_length, count = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION or width != CODE_WIDTH:
+            self._mm.close()
+            raise ValueError(f"{path} is not a PyTiny snapshot")
+
+        self.count = count
+        self.metadata = json.loads(self._mm[_HEADER.size:_HEADER.size + meta_length])
+        fanout_start = _HEADER.size + meta_length
+        fanout_start += -fanout_start % 8
+        self._fanout = _FANOUT.unpack_from(self._mm, fanout_start)
+        self._index = fanout_start + _FANOUT.size
+        self._blob = self._index + count * _ENTRY_SIZE
+
+    def get(self, short_code: str) -> Optional[Link]:
+        """Return the stored Link for a code in the snapshot."""
+        key = short_code.encode()
+        if len(key) > CODE_WIDTH or len(key) < 2:
+            return None
+        prefix = _prefix(key)
+        lo = self._fanout[prefix - 1] if prefix else 0
+        hi = self._fanout[prefix]
+        key = key.ljust(CODE_WIDTH, b"\0")
+
+        mm = self._mm
+        index = self._index
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            position = index + mid * _ENTRY_SIZE
+            probe = mm[position:position + CODE_WIDTH]
+            if probe < key:
+                lo = mid + 1
+            elif probe > key:
+                hi = mid
+            else:
+                offset, length, expires_at, created_at, status, cache_ttl = \
+                    _ENTRY_TAIL.unpack_from(mm, position + CODE_WIDTH)
+                start = self._blob + offset
+                return (mm[start:start + length].decode(), expires_at or None, created_at,
+                        status or None, None if cache_ttl < 0 else cache_ttl)
+        return None
+
+    def close(self) -> None:
+        self._mm.close()
+
+
+class SnapshotView:
+    """
+    Snapshot lookups kept consistent with later changes in storage.
+
+    On every lookup ``storage.change_token()`` tells whether anything was
+    committed since the last check; if so, codes deleted or updated
+    since the snapshot was built are read from the change log, and a
+    snapshot file replaced by a rebuild is reopened.
+
+    Args:
+        storage: Storage backend providing change_token(), track_changes()
+            and changes_since()
+        path: Snapshot file, which may not exist yet
+    """
+
+    # Lookups between checks for a rebuilt snapshot file while nothing is
+    # being committed
+    RELOAD_EVERY = 4096
+
+    def __init__(self, storage, path: str):
+        self.storage = storage
+        self.path = path
+        # (snapshot, codes changed since it was built), swapped as one
+        self._state: Tuple[Optional[Snapshot], set] = (None, set())
+        self._watermark = None
+        self._token = None
+        self._calls = 0
+        # Also logs the changes made after a snapshot built by older code
+        storage.track_changes()
+        self._reload()
+
+    def _reload(self) -> None:
+        try:
+            inode = os.stat(self.path).st_ino
+        except OSError:
+            return
+        current = self._state[0]
+        if current is not None and current.inode == inode:
+            return
+
+        try:
+            snapshot = Snapshot(self.path)
+        except (OSError, ValueError) as e:
+            print(f"Snapshot error: {str(e)}")
+            return
+        changed = set()
+        watermark = snapshot.metadata["changes"]
+        while True:
+            codes, watermark = self.storage.changes_since(watermark)
+            if not codes:
+                break
+            changed.update(codes)
+        # Old maps are left to the garbage collector; a concurrent lookup
+        # may still be reading from one.
+        self._state = (snapshot, changed)
+        self._watermark = watermark
+
+    def _sync(self) -> None:
+        self._reload()
+        while True:
+            codes, self._watermark = self.storage.changes_since(self._watermark)
+            if not codes:
+                return
+            self._state[1].update(codes)
+
+    def get(self, short_code: str) -> Optional[Link]:
+        """
+        Return the Link if the snapshot can answer for code, None if the
+        database has to be asked.
+        """
+        token = self.storage.change_token()
+        self._calls += 1
+        if token is None or token != self._token or self._calls % self.RELOAD_EVERY == 0:
+            self._token = token
+            self._sync()
+
+        snapshot, changed = self._state
+        if snapshot is None or short_code in changed:
+            return None
+        return snapshot.get(short_code)
+
+    def stats(self) -> Optional[dict]:
+        """Return entry count and build metadata, or None without a snapshot."""
+        snapshot, changed = self._state
+        if snapshot is None:
+            return None
+        return {"path": self.path, "entries": snapshot.count,
+                "changed": len(changed), **snapshot.metadata}
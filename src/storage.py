@@ -0,0 +1,1252 @@
+import functools
+import heapq
+import inspect
+import mmap
+import os
+import sqlite3
+import time
+import zlib
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .analytics import RollupRow
+from .clicks import ClickBatch
+from .pool import ConnectionPool
+
+# Size of the WAL index header that SQLite rewrites on every commit
+WAL_INDEX_HEADER = 48
+# Seconds before mapping a WAL index that could not be mapped is tried again
+WAL_INDEX_RETRY = 5.0
+
+# (short_code, long_url, created_at, expires_at)
+NewRow = Tuple[str, str, int, Optional[int]]
+# (short_code, long_url, created_at, expires_at, clicks, last_clicked, url_hash,
+#  redirect_status, cache_ttl)
+FullRow = Tuple[str, str, int, Optional[int], int, Optional[int], Optional[int],
+                Optional[int], Optional[int]]
+# (long_url, expires_at, created_at, redirect_status, cache_ttl)
+Link = Tuple[str, Optional[int], int, Optional[int], Optional[int]]
+# (url_hash, short_code, long_url, created_at, expires_at)
+HashMatch = Tuple[int, str, str, int, Optional[int]]
+# (created_at, expires_at, clicks, last_clicked, redirect_status, cache_ttl)
+StatsRow = Tuple[int, Optional[int], int, Optional[int], Optional[int], Optional[int]]
+
+
+class Storage:
+    """
+    Interface of the link storage backends behind ``PyTiny``.
+
+    Backends implement the link operations (create, lookup, delete, expiry
+    and click updates, scans for expired links) and may leave out the
+    optional features: click rollups for analytics and the change log read
+    by redirect snapshots raise NotImplementedError by default, and
+    change_token() returns None when a backend can't tell cheaply whether
+    anything changed.
+    """
+
+    db_path: str
+
+    def schema_version(self) -> int:
+        """Return the number of schema migrations applied."""
+        return 0
+
+    def migrate(self) -> int:
+        """Apply pending schema migrations. Returns the number applied."""
+        return 0
+
+    def reserve_ids(self, count: int) -> int:
+        """Reserve count consecutive code IDs. Returns the first one."""
+        raise NotImplementedError
+
+    def sequence_value(self) -> int:
+        """Return the next unreserved code ID."""
+        raise NotImplementedError
+
+    def advance_sequence(self, value: int) -> None:
+        """Make sure IDs below value are never reserved again."""
+        raise NotImplementedError
+
+    def insert(self, row: NewRow, url_hash: Optional[int] = None,
+               redirect_status: Optional[int] = None,
+               cache_ttl: Optional[int] = None) -> bool:
+        """Insert a new link. Returns False if its short code is taken."""
+        raise NotImplementedError
+
+    def insert_many(self, rows: Sequence[NewRow],
+                    url_hashes: Optional[Sequence[Optional[int]]] = None) -> List[int]:
+        """Insert new links, skipping taken codes. Returns indexes of skipped rows."""
+        raise NotImplementedError
+
+    def get(self, short_code: str) -> Optional[Link]:
+        """Return (long_url, expires_at, created_at, redirect_status, cache_ttl) for a short code."""
+        raise NotImplementedError
+
+    def find_by_hashes(self, url_hashes: Sequence[int]) -> List[HashMatch]:
+        """Return every link whose dedup hash is one of url_hashes, newest first."""
+        raise NotImplementedError
+
+    def get_stats(self, short_code: str) -> Optional[StatsRow]:
+        """Return the StatsRow of a short code."""
+        raise NotImplementedError
+
+    def incr_clicks(self, batch: ClickBatch) -> None:
+        """Apply click increments."""
+        raise NotImplementedError
+
+    def delete(self, short_code: str) -> bool:
+        """Delete a link and its click history. Returns True if it existed."""
+        raise NotImplementedError
+
+    def update_expiry(self, short_code: str, expires_at: Optional[int]) -> bool:
+        """Set a link's expiry. Returns True if it exists."""
+        raise NotImplementedError
+
+    def set_redirect_policy(self, short_code: str, redirect_status: Optional[int],
+                            cache_ttl: Optional[int]) -> bool:
+        """Set a link's redirect status and cache lifetime. Returns True if it exists."""
+        raise NotImplementedError
+
+    def delete_expired(self, now: int, limit: int) -> int:
+        """Delete up to limit links expired at now, oldest first."""
+        raise NotImplementedError
+
+    def oldest_expired(self, now: int) -> Optional[int]:
+        """Return the earliest expires_at among links expired at now."""
+        raise NotImplementedError
+
+    def iter_expiring(self, after: int, until: int,
+                      batch_size: int = 1000) -> Iterator[Tuple[str, int]]:
+        """Yield (short_code, expires_at) for links expiring in (after, until]."""
+        raise NotImplementedError
+
+    def iter_rows(self, batch_size: int = 1000) -> Iterator[FullRow]:
+        """Yield every stored link."""
+        raise NotImplementedError
+
+    def list_rows(self, after=None, limit: int = 1000, now: int = 0,
+                  state: str = "all") -> Tuple[List[FullRow], object]:
+        """
+        Return a page of up to limit links after cursor after.
+
+        state is "all", "active" or "expired" (at now). Returns the rows and
+        the cursor of the next page, None after the last one.
+        """
+        raise NotImplementedError
+
+    def export_rows(self, batch_size: int = 1000, now: int = 0,
+                    state: str = "all") -> Iterator[FullRow]:
+        """
+        Yield every link in state, reading batch_size rows at a time.
+
+        Backends that can read from a consistent snapshot override this;
+        here pages are read one after another.
+        """
+        cursor = None
+        while True:
+            rows, cursor = self.list_rows(cursor, batch_size, now, state)
+            yield from rows
+            if cursor is None:
+                return
+
+    def check_cursor(self, after) -> object:
+        """
+        Return after, decoded from JSON, as a list_rows() cursor of this backend.
+
+        Raises:
+            ValueError: If after is not one
+        """
+        # Row IDs and SCAN cursors alike are unsigned 64-bit integers
+        if type(after) is not int or not 0 <= after < 2 ** 63:
+            raise ValueError("Invalid cursor")
+        return after
+
+    @staticmethod
+    def _in_state(expires_at: Optional[int], now: int, state: str) -> bool:
+        if state == "active":
+            return expires_at is None or expires_at > now
+        if state == "expired":
+            return expires_at is not None and expires_at <= now
+        return True
+
+    def codes_since(self, watermark=None, limit: int = 10000) -> Tuple[List[str], object]:
+        """Return up to limit codes added after watermark, and the next watermark."""
+        raise NotImplementedError
+
+    def copy_rows(self, rows: Sequence[FullRow]) -> None:
+        """Insert or overwrite complete rows, e.g. while resharding."""
+        raise NotImplementedError
+
+    def summary(self, now: int) -> dict:
+        """Return link, expired-link and click totals."""
+        raise NotImplementedError
+
+    def change_token(self):
+        """Return a value that changes on every write, or None if unknown."""
+        return None
+
+    def add_rollups(self, rows: Sequence[RollupRow]) -> None:
+        """Add click counts to the time-bucketed rollups."""
+        raise NotImplementedError(f"{type(self).__name__} does not store click analytics")
+
+    def get_rollups(self, short_code: str, resolution: int,
+                    start: int, end: int) -> List[Tuple[int, str, str, int]]:
+        """Return (bucket, referrer, agent, clicks) rows in [start, end)."""
+        raise NotImplementedError(f"{type(self).__name__} does not store click analytics")
+
+    def prune_rollups(self, resolution: int, before: int, limit: int) -> int:
+        """Delete up to limit rollup rows of a resolution older than before."""
+        raise NotImplementedError(f"{type(self).__name__} does not store click analytics")
+
+    def iter_sorted(self, batch_size: int = 1000) -> Iterator[Tuple]:
+        """Yield (short_code,) + Link for every link, ordered by code."""
+        raise NotImplementedError(f"{type(self).__name__} does not support snapshots")
+
+    def track_changes(self) -> None:
+        """Start keeping the change log; until then changes are not logged."""
+        raise NotImplementedError(f"{type(self).__name__} does not support snapshots")
+
+    def last_change(self):
+        """Return the newest entry in the change log, a watermark for changes_since()."""
+        raise NotImplementedError(f"{type(self).__name__} does not support snapshots")
+
+    def changes_since(self, watermark=None, limit: int = 10000) -> Tuple[List[str], object]:
+        """Return up to limit codes deleted or updated after watermark."""
+        raise NotImplementedError(f"{type(self).__name__} does not support snapshots")
+
+    def prune_changes(self, watermark) -> int:
+        """Forget change log entries up to and including watermark."""
+        raise NotImplementedError(f"{type(self).__name__} does not support snapshots")
+
+    def close(self) -> None:
+        """Release connections and other resources."""
+
+
+def _schema_v1(conn: sqlite3.Connection, layout: str) -> None:
+    """Create the base schema, upgrading databases from before versioning."""
+    if layout == "default":
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS urls (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                short_code TEXT UNIQUE NOT NULL,
+                long_url TEXT NOT NULL,
+                created_at INTEGER NOT NULL,
+                expires_at INTEGER,
+                clicks INTEGER DEFAULT 0,
+                last_clicked INTEGER,
+                url_hash INTEGER,
+                redirect_status INTEGER,
+                cache_ttl INTEGER
+            )
+        """)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(urls)")}
+        # Databases created before deduplication and redirect policies
+        for column in ("url_hash", "redirect_status", "cache_ttl"):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE urls ADD COLUMN {column} INTEGER")
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_url_hash ON urls(url_hash)
+            WHERE url_hash IS NOT NULL
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_expires_at ON urls(expires_at)
+            WHERE expires_at IS NOT NULL
+        """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS click_rollups (
+            short_code TEXT NOT NULL,
+            resolution INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            referrer TEXT NOT NULL,
+            agent TEXT NOT NULL,
+            clicks INTEGER NOT NULL,
+            PRIMARY KEY (short_code, resolution, bucket, referrer, agent)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_click_rollups_bucket
+        ON click_rollups(resolution, bucket)
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS url_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            short_code TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sequences (
+            name TEXT PRIMARY KEY,
+            next_id INTEGER NOT NULL
+        )
+    """)
+
+
+def _schema_v2(conn: sqlite3.Connection, layout: str) -> None:
+    """Drop idx_short_code, a duplicate of the index behind the UNIQUE constraint."""
+    if layout == "default":
+        conn.execute("DROP INDEX IF EXISTS idx_short_code")
+
+
+
+def _schema_v3(conn: sqlite3.Connection, layout: str) -> None:
+    """Add change_tracking, which keeps url_changes off until a snapshot reads it."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS change_tracking (
+            started_at INTEGER NOT NULL
+        )
+    """)
+    # Only snapshot rebuilds prune the log, so these databases have snapshots
+    # in use, and their workers may still run code that reads it unasked
+    pruned = conn.execute("""
+        SELECT 1 FROM sqlite_sequence
+        WHERE name = 'url_changes'
+        AND seq > (SELECT COUNT(*) FROM url_changes)
+    """).fetchone()
+    if pruned:
+        conn.execute("INSERT INTO change_tracking (started_at) VALUES (?)",
+                     (int(time.time()),))
+
+# Schema changes in the order they were made; PRAGMA user_version holds the
+# number applied. Append new ones, never edit or reorder existing ones. Each
+# gets the file's layout from sqlite_layout() and only touches urls in
+# "default" ones: compact databases (see compact_storage) keep links instead.
+MIGRATIONS = (
+    _schema_v1,
+    _schema_v2,
+    _schema_v3,
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def _compacted(error: sqlite3.OperationalError) -> bool:
+    return "no such table" in str(error) and "urls" in str(error)
+
+
+def _follows_compaction(method):
+    """
+    Retry a SQLiteStorage method as CompactStorage once the database it
+    reads was converted by ``pytiny compact`` while this process had it open.
+    """
+    if inspect.isgeneratorfunction(method):
+        @functools.wraps(method)
+        def generator(self, *args, **kwargs):
+            # The class the iterator was created as; it may start after
+            # another call already switched this object over
+            return _follow(self, type(self), method(self, *args, **kwargs),
+                           method.__name__, args, kwargs)
+        return generator
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        layout = type(self)
+        try:
+            return method(self, *args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if not _compacted(e) or not self._follow_layout(layout):
+                raise
+        return getattr(self, method.__name__)(*args, **kwargs)
+    return wrapper
+
+
+def _follow(storage, layout, rows, name, args, kwargs):
+    try:
+        first = next(rows)
+    except StopIteration:
+        return
+    except sqlite3.OperationalError as e:
+        if not _compacted(e) or not storage._follow_layout(layout):
+            raise
+        rows = getattr(storage, name)(*args, **kwargs)
+    else:
+        yield first
+    yield from rows
+
+
+class SQLiteStorage(Storage):
+    """
+    Link storage backed by a single SQLite database file.
+
+    All SQL used by ``PyTiny`` lives here; connections come from a
+    thread-local ``ConnectionPool``.
+    """
+
+    # Bound parameters per query when checking codes in bulk
+    MAX_QUERY_PARAMS = 500
+
+    def __init__(self, db_path: str = "pytiny.db", migrate: bool = True):
+        self.db_path = db_path
+        self._pool = ConnectionPool(db_path)
+        self._shm = None
+        self._shm_pid = None
+        self._shm_retry_at = 0.0
+        if migrate:
+            self.migrate()
+
+    def schema_version(self) -> int:
+        """Return the number of schema migrations applied to the database."""
+        (version,) = self._pool.get().execute("PRAGMA user_version").fetchone()
+        return version
+
+    def migrate(self) -> int:
+        """
+        Apply pending schema migrations.
+
+        ``PRAGMA user_version`` records how many have been applied, so on an
+        up-to-date database this is a single pragma read instead of a round
+        of DDL. Migrations run under the write lock, so concurrently starting
+        workers apply each one once.
+
+        Returns:
+            int: Number of migrations applied
+        """
+        if self.schema_version() >= SCHEMA_VERSION:
+            return 0
+        conn = self._pool.get()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            (version,) = conn.execute("PRAGMA user_version").fetchone()
+            layout = sqlite_layout(conn)
+            for migration in MIGRATIONS[version:]:
+                migration(conn, layout)
+            conn.execute(f"PRAGMA user_version = {max(version, SCHEMA_VERSION)}")
+            conn.commit()
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+        return max(0, SCHEMA_VERSION - version)
+
+    def reserve_ids(self, count: int) -> int:
+        """Reserve count consecutive code IDs. Returns the first one."""
+        with self._pool.get() as conn:
+            conn.execute("""
+                INSERT INTO sequences (name, next_id) VALUES ('urls', ?)
+                ON CONFLICT(name) DO UPDATE SET next_id = next_id + excluded.next_id
+            """, (count,))
+            (end,) = conn.execute(
+                "SELECT next_id FROM sequences WHERE name = 'urls'"
+            ).fetchone()
+        return end - count
+
+    def sequence_value(self) -> int:
+        """Return the next unreserved code ID."""
+        row = self._pool.get().execute(
+            "SELECT next_id FROM sequences WHERE name = 'urls'"
+        ).fetchone()
+        return row[0] if row else 0
+
+    def advance_sequence(self, value: int) -> None:
+        """Make sure IDs below value are never reserved again."""
+        with self._pool.get() as conn:
+            conn.execute("""
+                INSERT INTO sequences (name, next_id) VALUES ('urls', ?)
+                ON CONFLICT(name) DO UPDATE SET next_id = MAX(next_id, excluded.next_id)
+            """, (value,))
+
+    @_follows_compaction
+    def insert(self, row: NewRow, url_hash: Optional[int] = None,
+               redirect_status: Optional[int] = None,
+               cache_ttl: Optional[int] = None) -> bool:
+        """Insert a new link. Returns False if its short code is taken."""
+        try:
+            with self._pool.get() as conn:
+                conn.execute("""
+                    INSERT INTO urls (short_code, long_url, created_at, expires_at,
+                                      url_hash, redirect_status, cache_ttl)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, row + (url_hash, redirect_status, cache_ttl))
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    @_follows_compaction
+    def insert_many(self, rows: Sequence[NewRow],
+                    url_hashes: Optional[Sequence[Optional[int]]] = None) -> List[int]:
+        """
+        Insert new links in one transaction.
+
+        Rows whose short code is already taken (or repeated within rows) are
+        skipped; everything else is inserted.
+
+        Args:
+            rows: Links to insert
+            url_hashes: Optional dedup hash for each row
+
+        Returns:
+            List[int]: Indexes of the rows that were not inserted
+        """
+        conn = self._pool.get()
+        # Holding the write lock while checking means no other worker can
+        # take one of our codes before the insert lands.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            clashes = self._clashing_codes(conn, [row[0] for row in rows])
+            skip = set(clashes)
+            hashes = url_hashes or [None] * len(rows)
+            conn.executemany("""
+                INSERT INTO urls (short_code, long_url, created_at, expires_at,
+                                  url_hash)
+                VALUES (?, ?, ?, ?, ?)
+            """, [row + (hashes[i],) for i, row in enumerate(rows) if i not in skip])
+            conn.commit()
+            return clashes
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+
+    def _clashing_codes(self, conn, codes: List[str]) -> List[int]:
+        """Return indexes of codes that are already taken or repeated."""
+        taken = set()
+        for start in range(0, len(codes), self.MAX_QUERY_PARAMS):
+            chunk = codes[start:start + self.MAX_QUERY_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            taken.update(row[0] for row in conn.execute(
+                f"SELECT short_code FROM urls WHERE short_code IN ({placeholders})",
+                chunk,
+            ))
+
+        clashes = []
+        seen = set()
+        for i, code in enumerate(codes):
+            if code in taken or code in seen:
+                clashes.append(i)
+            seen.add(code)
+        return clashes
+
+    @_follows_compaction
+    def get(self, short_code: str) -> Optional[Link]:
+        """Return (long_url, expires_at, created_at, redirect_status, cache_ttl) for a short code."""
+        return self._pool.get().execute("""
+            SELECT long_url, expires_at, created_at, redirect_status, cache_ttl
+            FROM urls
+            WHERE short_code = ?
+        """, (short_code,)).fetchone()
+
+    @_follows_compaction
+    def find_by_hashes(self, url_hashes: Sequence[int]) -> List[HashMatch]:
+        """Return every link whose dedup hash is one of url_hashes, newest first."""
+        conn = self._pool.get()
+        url_hashes = list(url_hashes)
+        matches = []
+        for start in range(0, len(url_hashes), self.MAX_QUERY_PARAMS):
+            chunk = url_hashes[start:start + self.MAX_QUERY_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            matches.extend(conn.execute(f"""
+                SELECT url_hash, short_code, long_url, created_at, expires_at
+                FROM urls
+                WHERE url_hash IN ({placeholders})
+                ORDER BY id DESC
+            """, chunk))
+        return matches
+
+    @_follows_compaction
+    def get_stats(self, short_code: str) -> Optional[StatsRow]:
+        """
+        Return (created_at, expires_at, clicks, last_clicked, redirect_status,
+        cache_ttl) for a short code.
+        """
+        return self._pool.get().execute("""
+            SELECT created_at, expires_at, clicks, last_clicked,
+                   redirect_status, cache_ttl
+            FROM urls
+            WHERE short_code = ?
+        """, (short_code,)).fetchone()
+
+    @_follows_compaction
+    def incr_clicks(self, batch: ClickBatch) -> None:
+        """Apply click increments in a single transaction."""
+        with self._pool.get() as conn:
+            conn.executemany("""
+                UPDATE urls
+                SET clicks = clicks + ?,
+                    last_clicked = MAX(COALESCE(last_clicked, 0), ?)
+                WHERE short_code = ?
+            """, [(count, last, code)
+                  for code, (count, last) in batch.items()])
+
+    @_follows_compaction
+    def delete(self, short_code: str) -> bool:
+        """Delete a link and its click history. Returns True if it existed."""
+        with self._pool.get() as conn:
+            cursor = conn.execute("""
+                DELETE FROM urls
+                WHERE short_code = ?
+            """, (short_code,))
+            conn.execute("DELETE FROM click_rollups WHERE short_code = ?", (short_code,))
+            if cursor.rowcount:
+                self._log_change(conn, short_code)
+        return cursor.rowcount > 0
+
+    def add_rollups(self, rows: Sequence[RollupRow]) -> None:
+        """Add click counts to the time-bucketed rollups in one transaction."""
+        with self._pool.get() as conn:
+            conn.executemany("""
+                INSERT INTO click_rollups
+                    (short_code, resolution, bucket, referrer, agent, clicks)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(short_code, resolution, bucket, referrer, agent)
+                DO UPDATE SET clicks = clicks + excluded.clicks
+            """, rows)
+
+    def get_rollups(self, short_code: str, resolution: int,
+                    start: int, end: int) -> List[Tuple[int, str, str, int]]:
+        """Return (bucket, referrer, agent, clicks) rows in [start, end)."""
+        return self._pool.get().execute("""
+            SELECT bucket, referrer, agent, clicks
+            FROM click_rollups
+            WHERE short_code = ? AND resolution = ?
+            AND bucket >= ? AND bucket < ?
+            ORDER BY bucket
+        """, (short_code, resolution, start, end)).fetchall()
+
+    def prune_rollups(self, resolution: int, before: int, limit: int) -> int:
+        """Delete up to limit rollup rows of a resolution older than before."""
+        with self._pool.get() as conn:
+            cursor = conn.execute("""
+                DELETE FROM click_rollups
+                WHERE (short_code, resolution, bucket, referrer, agent) IN (
+                    SELECT short_code, resolution, bucket, referrer, agent
+                    FROM click_rollups
+                    WHERE resolution = ? AND bucket < ?
+                    LIMIT ?
+                )
+            """, (resolution, before, limit))
+        return cursor.rowcount
+
+    @_follows_compaction
+    def update_expiry(self, short_code: str, expires_at: Optional[int]) -> bool:
+        """Set a link's expiry. Returns True if it exists."""
+        with self._pool.get() as conn:
+            cursor = conn.execute("""
+                UPDATE urls
+                SET expires_at = ?
+                WHERE short_code = ?
+            """, (expires_at, short_code))
+            if cursor.rowcount:
+                self._log_change(conn, short_code)
+        return cursor.rowcount > 0
+
+    def _log_change(self, conn, short_code: str) -> None:
+        # Read by snapshots built before the change, see changes_since();
+        # without any, nothing would ever prune the log
+        conn.execute("""
+            INSERT INTO url_changes (short_code)
+            SELECT ? WHERE EXISTS (SELECT 1 FROM change_tracking)
+        """, (short_code,))
+
+    @_follows_compaction
+    def set_redirect_policy(self, short_code: str, redirect_status: Optional[int],
+                            cache_ttl: Optional[int]) -> bool:
+        """Set a link's redirect status and cache lifetime. Returns True if it exists."""
+        with self._pool.get() as conn:
+            cursor = conn.execute("""
+                UPDATE urls
+                SET redirect_status = ?, cache_ttl = ?
+                WHERE short_code = ?
+            """, (redirect_status, cache_ttl, short_code))
+            if cursor.rowcount:
+                self._log_change(conn, short_code)
+        return cursor.rowcount > 0
+
+    @_follows_compaction
+    def delete_expired(self, now: int, limit: int) -> int:
+        """Delete up to limit links expired at now, oldest first, with their click history."""
+        conn = self._pool.get()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute("""
+                SELECT id, short_code FROM urls
+                WHERE expires_at IS NOT NULL
+                AND expires_at <= ?
+                ORDER BY expires_at
+                LIMIT ?
+            """, (now, limit)).fetchall()
+            conn.executemany("DELETE FROM urls WHERE id = ?", [(row[0],) for row in rows])
+            conn.executemany("DELETE FROM click_rollups WHERE short_code = ?",
+                             [(row[1],) for row in rows])
+            conn.commit()
+            return len(rows)
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+
+    @_follows_compaction
+    def oldest_expired(self, now: int) -> Optional[int]:
+        """Return the earliest expires_at among links expired at now."""
+        (oldest,) = self._pool.get().execute("""
+            SELECT MIN(expires_at) FROM urls
+            WHERE expires_at IS NOT NULL
+            AND expires_at <= ?
+        """, (now,)).fetchone()
+        return oldest
+
+    @_follows_compaction
+    def iter_expiring(self, after: int, until: int,
+                      batch_size: int = 1000) -> Iterator[Tuple[str, int]]:
+        """
+        Yield (short_code, expires_at) for links expiring in (after, until].
+
+        Pages through the ``expires_at`` index, which also orders by row ID,
+        so each batch is a range read rather than a table scan.
+        """
+        last = (after, 2 ** 63 - 1)
+        while True:
+            rows = self._pool.get().execute("""
+                SELECT expires_at, id, short_code FROM urls
+                WHERE expires_at <= ? AND (expires_at, id) > (?, ?)
+                ORDER BY expires_at, id
+                LIMIT ?
+            """, (until,) + last + (batch_size,)).fetchall()
+            if not rows:
+                return
+            for expires_at, _, short_code in rows:
+                yield short_code, expires_at
+            last = rows[-1][:2]
+
+    @_follows_compaction
+    def iter_rows(self, batch_size: int = 1000) -> Iterator[FullRow]:
+        """Yield every stored link, reading batch_size rows per query."""
+        last_id = 0
+        while True:
+            rows = self._pool.get().execute("""
+                SELECT id, short_code, long_url, created_at, expires_at,
+                       clicks, last_clicked, url_hash, redirect_status, cache_ttl
+                FROM urls
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            """, (last_id, batch_size)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row[1:]
+            last_id = rows[-1][0]
+
+    # WHERE clauses of the link states accepted by list_rows()
+    STATE_FILTERS = {
+        "all": "",
+        "active": "AND (expires_at IS NULL OR expires_at > :now)",
+        "expired": "AND expires_at <= :now",
+    }
+
+    def _page(self, conn, after: Optional[int], limit: int, now: int,
+              state: str) -> Tuple[List[FullRow], Optional[int]]:
+        rows = conn.execute(f"""
+            SELECT id, short_code, long_url, created_at, expires_at,
+                   clicks, last_clicked, url_hash, redirect_status, cache_ttl
+            FROM urls
+            WHERE id > :after {self.STATE_FILTERS[state]}
+            ORDER BY id
+            LIMIT :limit
+        """, {"after": after or 0, "now": now, "limit": limit}).fetchall()
+        cursor = rows[-1][0] if len(rows) == limit else None
+        return [row[1:] for row in rows], cursor
+
+    @_follows_compaction
+    def list_rows(self, after: Optional[int] = None, limit: int = 1000, now: int = 0,
+                  state: str = "all") -> Tuple[List[FullRow], Optional[int]]:
+        """
+        Return a page of up to limit links with a row ID above after.
+
+        Keyset pagination on the primary key: every page is an index range
+        read, however deep into the table it starts.
+        """
+        return self._page(self._pool.get(), after, limit, now, state)
+
+    @_follows_compaction
+    def export_rows(self, batch_size: int = 1000, now: int = 0,
+                    state: str = "all") -> Iterator[FullRow]:
+        """
+        Yield every link in state from one consistent read snapshot.
+
+        All pages are read in a single read transaction on a connection of
+        its own. In WAL mode that holds no lock writers wait for, so
+        redirects and creates carry on; the WAL just can't be checkpointed
+        past the snapshot until the export finishes.
+        """
+        conn = self._pool.connect()
+        try:
+            conn.execute("BEGIN")
+            cursor = None
+            while True:
+                rows, cursor = self._page(conn, cursor, batch_size, now, state)
+                yield from rows
+                if cursor is None:
+                    return
+        finally:
+            conn.rollback()
+            conn.close()
+
+    @_follows_compaction
+    def codes_since(self, watermark: Optional[int] = None,
+                    limit: int = 10000) -> Tuple[List[str], Optional[int]]:
+        """
+        Return up to limit short codes added after watermark.
+
+        Row IDs are assigned under SQLite's single writer lock, so they
+        become visible in increasing order and a watermark never skips a
+        committed row.
+
+        Returns:
+            Tuple[List[str], Optional[int]]: The codes and the watermark to
+            pass on the next call
+        """
+        rows = self._pool.get().execute("""
+            SELECT id, short_code FROM urls
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+        """, (watermark or 0, limit)).fetchall()
+        if not rows:
+            return [], watermark
+        return [row[1] for row in rows], rows[-1][0]
+
+    @_follows_compaction
+    def iter_sorted(self, batch_size: int = 1000) -> Iterator[Tuple]:
+        """Yield (short_code,) + Link for every link, ordered by code."""
+        last_code = ""
+        while True:
+            rows = self._pool.get().execute("""
+                SELECT short_code, long_url, expires_at, created_at,
+                       redirect_status, cache_ttl
+                FROM urls
+                WHERE short_code > ?
+                ORDER BY short_code
+                LIMIT ?
+            """, (last_code, batch_size)).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_code = rows[-1][0]
+
+    def track_changes(self) -> None:
+        """Start keeping the change log, for every process writing to the file."""
+        with self._pool.get() as conn:
+            conn.execute("""
+                INSERT INTO change_tracking (started_at)
+                SELECT ? WHERE NOT EXISTS (SELECT 1 FROM change_tracking)
+            """, (int(time.time()),))
+
+    def last_change(self) -> int:
+        """Return the newest entry in the change log, a watermark for changes_since()."""
+        (last,) = self._pool.get().execute(
+            "SELECT COALESCE(MAX(id), 0) FROM url_changes"
+        ).fetchone()
+        return last
+
+    def changes_since(self, watermark: Optional[int] = None,
+                      limit: int = 10000) -> Tuple[List[str], Optional[int]]:
+        """
+        Return up to limit codes deleted or updated after watermark.
+
+        Returns:
+            Tuple[List[str], Optional[int]]: The codes and the watermark to
+            pass on the next call
+        """
+        rows = self._pool.get().execute("""
+            SELECT id, short_code FROM url_changes
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+        """, (watermark or 0, limit)).fetchall()
+        if not rows:
+            return [], watermark
+        return [row[1] for row in rows], rows[-1][0]
+
+    def prune_changes(self, watermark: Optional[int]) -> int:
+        """Forget change log entries up to and including watermark."""
+        with self._pool.get() as conn:
+            cursor = conn.execute("DELETE FROM url_changes WHERE id <= ?",
+                                  (watermark or 0,))
+        return cursor.rowcount
+
+    def change_token(self) -> Optional[bytes]:
+        """
+        Return a value that changes whenever any connection commits.
+
+        This is the header of SQLite's WAL index (the ``-shm`` file), which
+        every commit rewrites, read through a shared memory map so that
+        checking it costs no query at all. Returns None if the database is
+        not in WAL mode or the index could not be mapped; that is tried
+        again every WAL_INDEX_RETRY seconds.
+        """
+        if self._shm is None or self._shm_pid != os.getpid() or \
+                (self._shm is False and time.monotonic() >= self._shm_retry_at):
+            # The map is only safe while this process holds a connection;
+            # a forked child maps the file again after opening its own
+            self._shm = self._map_wal_index()
+            self._shm_pid = os.getpid()
+            self._shm_retry_at = time.monotonic() + WAL_INDEX_RETRY
+        return self._shm[:WAL_INDEX_HEADER] if self._shm else None
+
+    def _map_wal_index(self):
+        # Make sure this process has the database open in WAL mode
+        self._pool.get().execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+        try:
+            with open(self.db_path + "-shm", "rb") as fh:
+                return mmap.mmap(fh.fileno(), WAL_INDEX_HEADER, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+
+    def _follow_layout(self, layout: type) -> bool:
+        """
+        Turn into a CompactStorage if the file was converted meanwhile.
+
+        Args:
+            layout: Class this storage had when the failed call was made
+
+        Returns:
+            bool: True if the failed call should be retried
+        """
+        from .compact_storage import CompactStorage
+        if issubclass(layout, CompactStorage):
+            return False
+        if not isinstance(self, CompactStorage):
+            if sqlite_layout(self._pool.get()) != "compact":
+                return False
+            CompactStorage.load_layout(self)
+            self.__class__ = CompactStorage
+        return True
+
+    @_follows_compaction
+    def copy_rows(self, rows: Sequence[FullRow]) -> None:
+        """Insert or overwrite complete rows, e.g. while resharding."""
+        with self._pool.get() as conn:
+            conn.executemany("""
+                INSERT INTO urls (short_code, long_url, created_at, expires_at,
+                                  clicks, last_clicked, url_hash,
+                                  redirect_status, cache_ttl)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(short_code) DO UPDATE SET
+                    long_url = excluded.long_url,
+                    created_at = excluded.created_at,
+                    expires_at = excluded.expires_at,
+                    clicks = excluded.clicks,
+                    last_clicked = excluded.last_clicked,
+                    url_hash = excluded.url_hash,
+                    redirect_status = excluded.redirect_status,
+                    cache_ttl = excluded.cache_ttl
+            """, rows)
+
+    @_follows_compaction
+    def summary(self, now: int) -> dict:
+        """Return link, expired-link and click totals."""
+        urls, expired, clicks = self._pool.get().execute("""
+            SELECT COUNT(*),
+                   COUNT(CASE WHEN expires_at <= ? THEN 1 END),
+                   COALESCE(SUM(clicks), 0)
+            FROM urls
+        """, (now,)).fetchone()
+        return {"urls": urls, "expired": expired, "clicks": clicks}
+
+    def close(self) -> None:
+        """Close all pooled database connections."""
+        if self._shm:
+            self._shm.close()
+        self._shm = None
+        self._pool.close()
+
+
+class ShardedStorage(Storage):
+    """
+    Links hash-partitioned across several SQLite files.
+
+    The shard for a short code is derived from a CRC32 of the code, so a
+    lookup only ever touches one file and every process routes the same
+    code to the same shard. Each shard has its own writer lock, spreading
+    write contention across files (and, if they live there, disks). Code ID
+    reservations for the counter strategy go to the first shard.
+    """
+
+    def __init__(self, paths: Sequence[str], migrate: bool = True):
+        if not paths:
+            raise ValueError("ShardedStorage needs at least one shard path")
+        self.shards = [open_sqlite(path, migrate) for path in paths]
+        self.db_path = self.shards[0].db_path
+
+    def shard_index(self, short_code: str) -> int:
+        """Return the index of the shard that owns short_code."""
+        return zlib.crc32(short_code.encode()) % len(self.shards)
+
+    def shard_for(self, short_code: str) -> SQLiteStorage:
+        """Return the shard that owns short_code."""
+        return self.shards[self.shard_index(short_code)]
+
+    def schema_version(self) -> int:
+        return min(shard.schema_version() for shard in self.shards)
+
+    def migrate(self) -> int:
+        return sum(shard.migrate() for shard in self.shards)
+
+    def reserve_ids(self, count: int) -> int:
+        return self.shards[0].reserve_ids(count)
+
+    def sequence_value(self) -> int:
+        return self.shards[0].sequence_value()
+
+    def advance_sequence(self, value: int) -> None:
+        self.shards[0].advance_sequence(value)
+
+    def insert(self, row: NewRow, url_hash: Optional[int] = None,
+               redirect_status: Optional[int] = None,
+               cache_ttl: Optional[int] = None) -> bool:
+        return self.shard_for(row[0]).insert(row, url_hash, redirect_status, cache_ttl)
+
+    def insert_many(self, rows: Sequence[NewRow],
+                    url_hashes: Optional[Sequence[Optional[int]]] = None) -> List[int]:
+        groups: Dict[int, List[int]] = {}
+        for i, row in enumerate(rows):
+            groups.setdefault(self.shard_index(row[0]), []).append(i)
+
+        clashes = []
+        for shard_index, indexes in groups.items():
+            skipped = self.shards[shard_index].insert_many(
+                [rows[i] for i in indexes],
+                [url_hashes[i] for i in indexes] if url_hashes else None,
+            )
+            clashes.extend(indexes[j] for j in skipped)
+        return sorted(clashes)
+
+    def get(self, short_code: str):
+        return self.shard_for(short_code).get(short_code)
+
+    def find_by_hashes(self, url_hashes: Sequence[int]) -> List[HashMatch]:
+        # Links are partitioned by code, so any shard may hold a match
+        url_hashes = list(url_hashes)
+        matches = []
+        for shard in self.shards:
+            matches.extend(shard.find_by_hashes(url_hashes))
+        return matches
+
+    def get_stats(self, short_code: str):
+        return self.shard_for(short_code).get_stats(short_code)
+
+    def incr_clicks(self, batch: ClickBatch) -> None:
+        groups: Dict[int, ClickBatch] = {}
+        for code, entry in batch.items():
+            groups.setdefault(self.shard_index(code), {})[code] = entry
+        for shard_index, group in groups.items():
+            self.shards[shard_index].incr_clicks(group)
+
+    def delete(self, short_code: str) -> bool:
+        return self.shard_for(short_code).delete(short_code)
+
+    def add_rollups(self, rows: Sequence[RollupRow]) -> None:
+        groups: Dict[int, List[RollupRow]] = {}
+        for row in rows:
+            groups.setdefault(self.shard_index(row[0]), []).append(row)
+        for shard_index, group in groups.items():
+            self.shards[shard_index].add_rollups(group)
+
+    def get_rollups(self, short_code: str, resolution: int, start: int, end: int):
+        return self.shard_for(short_code).get_rollups(short_code, resolution, start, end)
+
+    def prune_rollups(self, resolution: int, before: int, limit: int) -> int:
+        deleted = 0
+        for shard in self.shards:
+            if deleted >= limit:
+                break
+            deleted += shard.prune_rollups(resolution, before, limit - deleted)
+        return deleted
+
+    def update_expiry(self, short_code: str, expires_at: Optional[int]) -> bool:
+        return self.shard_for(short_code).update_expiry(short_code, expires_at)
+
+    def set_redirect_policy(self, short_code: str, redirect_status: Optional[int],
+                            cache_ttl: Optional[int]) -> bool:
+        return self.shard_for(short_code).set_redirect_policy(short_code, redirect_status,
+                                                              cache_ttl)
+
+    def delete_expired(self, now: int, limit: int) -> int:
+        deleted = 0
+        for shard in self.shards:
+            if deleted >= limit:
+                break
+            deleted += shard.delete_expired(now, limit - deleted)
+        return deleted
+
+    def oldest_expired(self, now: int) -> Optional[int]:
+        oldest = [shard.oldest_expired(now) for shard in self.shards]
+        oldest = [value for value in oldest if value is not None]
+        return min(oldest) if oldest else None
+
+    def iter_expiring(self, after: int, until: int,
+                      batch_size: int = 1000) -> Iterator[Tuple[str, int]]:
+        for shard in self.shards:
+            yield from shard.iter_expiring(after, until, batch_size)
+
+    def iter_rows(self, batch_size: int = 1000) -> Iterator[FullRow]:
+        for shard in self.shards:
+            yield from shard.iter_rows(batch_size)
+
+    def check_cursor(self, after) -> Tuple:
+        if not (isinstance(after, list) and len(after) == 2 and type(after[0]) is int
+                and 0 <= after[0] < len(self.shards)):
+            raise ValueError("Invalid cursor")
+        index, last = after
+        return index, None if last is None else self.shards[index].check_cursor(last)
+
+    def list_rows(self, after: Optional[Tuple] = None, limit: int = 1000, now: int = 0,
+                  state: str = "all") -> Tuple[List[FullRow], Optional[Tuple]]:
+        """Return a page of links, shard by shard; cursors are (shard, row ID)."""
+        index, last = after or (0, None)
+        while index < len(self.shards):
+            rows, last = self.shards[index].list_rows(last, limit, now, state)
+            if last is not None:
+                return rows, (index, last)
+            index += 1
+            if rows:
+                return rows, ((index, None) if index < len(self.shards) else None)
+        return [], None
+
+    def export_rows(self, batch_size: int = 1000, now: int = 0,
+                    state: str = "all") -> Iterator[FullRow]:
+        """Yield every link in state, each shard from its own read snapshot."""
+        for shard in self.shards:
+            yield from shard.export_rows(batch_size, now, state)
+
+    def codes_since(self, watermark: Optional[Tuple] = None,
+                    limit: int = 10000) -> Tuple[List[str], Tuple]:
+        """Return codes added after watermark, a tuple of per-shard watermarks."""
+        watermark = watermark or (None,) * len(self.shards)
+        codes = []
+        marks = []
+        for shard, mark in zip(self.shards, watermark):
+            shard_codes, mark = shard.codes_since(mark, limit)
+            codes.extend(shard_codes)
+            marks.append(mark)
+        return codes, tuple(marks)
+
+    def iter_sorted(self, batch_size: int = 1000) -> Iterator[Tuple]:
+        return heapq.merge(*(shard.iter_sorted(batch_size) for shard in self.shards),
+                           key=lambda row: row[0])
+
+    def track_changes(self) -> None:
+        for shard in self.shards:
+            shard.track_changes()
+
+    def last_change(self) -> Tuple:
+        return tuple(shard.last_change() for shard in self.shards)
+
+    def changes_since(self, watermark: Optional[Tuple] = None,
+                      limit: int = 10000) -> Tuple[List[str], Tuple]:
+        """Return codes changed after watermark, a tuple of per-shard watermarks."""
+        watermark = watermark or (None,) * len(self.shards)
+        codes = []
+        marks = []
+        for shard, mark in zip(self.shards, watermark):
+            shard_codes, mark = shard.changes_since(mark, limit)
+            codes.extend(shard_codes)
+            marks.append(mark)
+        return codes, tuple(marks)
+
+    def prune_changes(self, watermark: Optional[Tuple]) -> int:
+        watermark = watermark or (None,) * len(self.shards)
+        return sum(shard.prune_changes(mark)
+                   for shard, mark in zip(self.shards, watermark))
+
+    def change_token(self) -> Optional[Tuple]:
+        tokens = tuple(shard.change_token() for shard in self.shards)
+        return None if None in tokens else tokens
+
+    def copy_rows(self, rows: Sequence[FullRow]) -> None:
+        groups: Dict[int, List[FullRow]] = {}
+        for row in rows:
+            groups.setdefault(self.shard_index(row[0]), []).append(row)
+        for shard_index, group in groups.items():
+            self.shards[shard_index].copy_rows(group)
+
+    def summary(self, now: int) -> dict:
+        """Return totals across shards plus a per-shard breakdown."""
+        shards = []
+        totals = {"urls": 0, "expired": 0, "clicks": 0}
+        for shard in self.shards:
+            summary = shard.summary(now)
+            for key in totals:
+                totals[key] += summary[key]
+            shards.append(dict(summary, path=shard.db_path))
+        totals["shards"] = shards
+        return totals
+
+    def close(self) -> None:
+        for shard in self.shards:
+            shard.close()
+
+
+def open_storage(db_path: str = "pytiny.db", shards: Optional[str] = None,
+                 migrate: bool = True):
+    """
+    Open the storage backend named by db_path.
+
+    ``:memory:`` keeps links in process memory and a ``redis://`` URL stores
+    them on a Redis-protocol server; anything else is a SQLite file, sharded
+    if shards lists comma-separated paths, in whichever layout it was
+    written. Pending schema migrations are applied unless migrate is False.
+    """
+    # Imported here: both modules import this one
+    if db_path == ":memory:":
+        from .memory_storage import MemoryStorage
+        return MemoryStorage()
+    if db_path.startswith("redis://"):
+        from .redis_storage import RedisStorage
+        return RedisStorage(db_path)
+    if shards:
+        return ShardedStorage([path.strip() for path in shards.split(",")
+                               if path.strip()], migrate)
+    return open_sqlite(db_path, migrate)
+
+
+def sqlite_layout(conn: sqlite3.Connection) -> str:
+    """Return "compact" for a database converted by compact_storage.compact(), else "default"."""
+    tables = {name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('urls', 'links')")}
+    # Both exist while a conversion is under way
+    return "compact" if tables == {"links"} else "default"
+
+
+def open_sqlite(db_path: str, migrate: bool = True) -> SQLiteStorage:
+    """Open a SQLite file as SQLiteStorage, or CompactStorage if it was converted."""
+    if os.path.exists(db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            layout = sqlite_layout(conn)
+        finally:
+            conn.close()
+        if layout == "compact":
+            from .compact_storage import CompactStorage
+            return CompactStorage(db_path, migrate)
+    return SQLiteStorage(db_path, migrate)
+
+
+def reshard(source, target, batch_size: int = 5000, progress=None) -> int:
+    """
+    Copy every link from source to target storage.
+
+    Rows are streamed in batches and upserted, so the copy can be re-run to
+    pick up links changed while it was running. The target's ID sequence is
+    advanced past the source's so counter codes stay unique.
+
+    Args:
+        source: Storage to read from
+        target: Storage to write to, typically a ShardedStorage
+        batch_size: Rows copied per transaction
+        progress: Optional callable receiving the running row count
+
+    Returns:
+        int: Number of rows copied
+    """
+    copied = 0
+    batch: List[FullRow] = []
+    for row in source.iter_rows(batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            target.copy_rows(batch)
+            copied += len(batch)
+            batch = []
+            if progress:
+                progress(copied)
+    if batch:
+        target.copy_rows(batch)
+        copied += len(batch)
+        if progress:
+            progress(copied)
+
+    target.advance_sequence(source.sequence_value())
+    return copied
@@ -0,0 +1,163 @@
+"""
+Per-request span timings and a bounded log of slow requests.
+
+While a request is traced, ``span()`` blocks inside it (database calls,
+QR rendering, serialization) add their name, start offset and duration
+to the request's ``Trace``. Requests slower than the ``SlowLog``
+threshold are kept with their spans.
+
+Tracing is off unless a web app creates a ``SlowLog``. Without an active
+trace ``span()`` returns a shared no-op, so the instrumented code only
+pays for a context variable lookup.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("pytiny_trace", default=None)
+
+
+class Trace:
+    """Span timings of one request."""
+
+    __slots__ = ("started", "duration", "spans", "_token")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        # (name, seconds since the request started, seconds spent)
+        self.spans: List[Tuple[str, float, float]] = []
+        self._token = None
+
+
+class _Span:
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        self.trace.spans.append((self.name, self.start - self.trace.started,
+                                 end - self.start))
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name: str):
+    """Time a block as part of the current request's trace, if any."""
+    trace = _current.get()
+    if trace is None:
+        return _NO_SPAN
+    return _Span(trace, name)
+
+
+def start() -> Trace:
+    """Start tracing the current request."""
+    trace = Trace()
+    trace._token = _current.set(trace)
+    return trace
+
+
+def finish(trace: Trace) -> Trace:
+    """Stop tracing the request trace was started for."""
+    trace.duration = time.perf_counter() - trace.started
+    if trace._token is not None:
+        _current.reset(trace._token)
+        trace._token = None
+    return trace
+
+
+class SlowLog:
+    """
+    The most recent requests that took at least threshold seconds.
+
+    Args:
+        threshold: Seconds from which a request is logged
+        size: Slow requests kept in memory
+        path: JSON-lines file to also append slow requests to, shared by
+            all workers; once it reaches max_bytes it is moved to
+            ``path + ".1"`` and started over
+        max_bytes: Size at which path is rotated
+    """
+
+    def __init__(self,
+                 threshold: float,
+                 size: int = 1000,
+                 path: Optional[str] = None,
+                 max_bytes: int = 16 * 1024 * 1024):
+        self.threshold = threshold
+        self.path = path
+        self.max_bytes = max_bytes
+        self._entries: deque = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config) -> Optional["SlowLog"]:
+        """Build a SlowLog from a Config, None if slow requests are not traced."""
+        if not config.SLOW_REQUEST_SECONDS:
+            return None
+        return cls(config.SLOW_REQUEST_SECONDS, config.SLOW_LOG_SIZE,
+                   config.SLOW_LOG_PATH)
+
+    def record(self, trace: Trace, method: str, path: str, status: int) -> bool:
+        """Log a finished request if it was slow. Returns True if it was."""
+        if trace.duration < self.threshold:
+            return False
+        entry = {
+            "time": round(time.time(), 3),
+            "method": method,
+            "path": path,
+            "status": status,
+            "ms": round(trace.duration * 1000, 3),
+            "spans": [{"name": name, "at_ms": round(at * 1000, 3),
+                       "ms": round(spent * 1000, 3)}
+                      for name, at, spent in trace.spans],
+        }
+        with self._lock:
+            self._entries.append(entry)
+        if self.path:
+            try:
+                self._append(entry)
+            except OSError as e:
+                print(f"Slow log error: {str(e)}")
+        return True
+
+    def _append(self, entry: dict) -> None:
+        line = (json.dumps(entry) + "\n").encode()
+        # One write to an O_APPEND file, so lines of workers do not interleave
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+            rotate = os.fstat(fd).st_size >= self.max_bytes
+        finally:
+            os.close(fd)
+        if rotate:
+            os.replace(self.path, self.path + ".1")
+
+    def recent(self, limit: int = 100) -> List[dict]:
+        """Return up to limit slow requests, most recent first."""
+        with self._lock:
+            entries = list(self._entries)
+        return entries[::-1][:limit]
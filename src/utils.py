@@ -1,7 +1,10 @@
+import hashlib
 import re
 from typing import Optional
 from urllib.parse import urlparse
 
+_CODE_PATTERN = re.compile(r'^[a-zA-Z0-9]{4,12}$')
+
 def validate_url(url: str) -> bool:
     """
     Validate if the given string is a proper URL.
@@ -36,6 +39,21 @@ def sanitize_url(url: str) -> Optional[str]:
         return url
     return None
 
+def url_fingerprint(url: str, expire_hours: Optional[int] = None) -> int:
+    """
+    Hash a normalized URL and its expiry policy into a signed 64-bit integer.
+
+    Args:
+        url: URL as returned by sanitize_url
+        expire_hours: Expiration policy the link is created with
+
+    Returns:
+        int: Value that fits an SQLite INTEGER column
+    """
+    digest = hashlib.blake2b(f"{expire_hours or ''}\n{url}".encode(),
+                             digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
 def is_valid_code(code: str) -> bool:
     """
     Validate if the given string is a valid short code.
@@ -46,4 +64,4 @@ def is_valid_code(code: str) -> bool:
     Returns:
         bool: True if valid code, False otherwise
     """
-    return bool(re.match(r'^[a-zA-Z0-9]{4,12}$', code))
+    return bool(_CODE_PATTERN.match(code))
@@ -1,40 +1,29 @@
-from flask import Flask, redirect, request, jsonify, abort
+"""
+Flask front end: the shortening form, JSON/NDJSON APIs, QR images and
+redirects.
+
+Nothing is built at import time; ``create_app`` wires an application to a
+``PyTiny`` instance from configuration, so gunicorn can boot workers with
+``wsgi:app`` or ``"pytiny.web:create_app()"``.
+"""
+from flask import Flask, Response, g, redirect, request, jsonify, abort, stream_with_context
+from typing import Optional
 from urllib.parse import urlparse
+from .analytics import parse_range
 from .core import PyTiny
-import qrcode
-import io
+from .config import Config
+from . import metrics, profiler, tracing
+from .qr import FORMATS, QRCache
+from .ratelimit import RateLimiter, retry_after_header
+from .reaper import Reaper
+from .redirects import cache_headers, not_modified
 import base64
+import hmac
+import json
+import math
+import time
 
-app = Flask(__name__)
-app.secret_key = 'your-secret-key-here'
-shortener = PyTiny()
-
-def is_valid_url(url):
-    """Validate URL format and accessibility."""
-    try:
-        result = urlparse(url)
-        return all([result.scheme, result.netloc])
-    except:
-        return False
-
-def generate_qr_code(url):
-    """Generate QR code for a URL."""
-    try:
-        img_buffer = io.BytesIO()
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(url)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
-        img.save(img_buffer, format='PNG')
-        img_str = base64.b64encode(img_buffer.getvalue()).decode()
-        return f"data:image/png;base64,{img_str}"
-    except Exception as e:
-        print(f"QR Code generation error: {str(e)}")
-        return None
-
-@app.route('/')
-def home():
-    return '''
+INDEX_HTML = '''
     <!DOCTYPE html>
     <html>
     <head>
@@ -69,6 +58,7 @@ def home():
                     <div class="flex items-center">
                         <input type="checkbox" id="generate_qr" name="generate_qr" class="mr-2">
                         <label for="generate_qr">Generate QR Code</label>
+                        <input type="hidden" name="qr_inline" value="false">
                     </div>
 
                     <button type="submit" 
@@ -127,7 +117,7 @@ def home():
                     // Handle QR code if present
                     if (data.qr_code) {
                         document.getElementById('qrCode').classList.remove('hidden');
-                        document.getElementById('qrCodeImage').src = data.qr_code;
+                        document.getElementById('qrCodeImage').src = data.qr_url || data.qr_code;
                     } else {
                         document.getElementById('qrCode').classList.add('hidden');
                     }
@@ -149,57 +139,457 @@ def home():
         </script>
     </body>
     </html>
-    '''
+'''
 
-@app.route('/shorten', methods=['POST'])
-def shorten():
-    """Handle URL shortening requests."""
+def is_valid_url(url):
+    """Validate URL format and accessibility."""
     try:
-        url = request.form.get('url', '').strip()
-        
-        if not url:
-            return jsonify({'error': 'URL is required'}), 400
-            
+        result = urlparse(url)
+        return all([result.scheme, result.netloc])
+    except:
+        return False
+
+def _bulk_items(records, default_hours, errors):
+    """Yield (url, expire_hours) for valid bulk records, collecting errors."""
+    for index, record in enumerate(records):
+        if isinstance(record, bytes):
+            # Raw NDJSON line
+            try:
+                record = json.loads(record)
+            except ValueError:
+                errors.append({'index': index, 'error': 'Invalid JSON'})
+                continue
+
+        if isinstance(record, dict):
+            url = str(record.get('url', '')).strip()
+            expire_hours = record.get('expire_hours', default_hours)
+        else:
+            url, expire_hours = str(record).strip(), default_hours
+
         if not is_valid_url(url):
-            return jsonify({'error': 'Invalid URL format'}), 400
+            errors.append({'index': index, 'url': url, 'error': 'Invalid URL format'})
+            continue
+        if expire_hours is not None and not isinstance(expire_hours, int):
+            errors.append({'index': index, 'url': url, 'error': 'Invalid expiration hours'})
+            continue
 
-        expire_hours = request.form.get('expire_hours')
+        yield url, expire_hours
+
+def is_admin(authorization: Optional[str], token: Optional[str]) -> bool:
+    """Check an Authorization header against the admin token, if one is set."""
+    if not token or not authorization:
+        return False
+    scheme, _, credentials = authorization.partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(credentials.encode(),
+                                                              token.encode())
+
+def _too_many_requests(wait):
+    """429 response asking the client to come back after wait seconds."""
+    retry_after = retry_after_header(wait)
+    return (jsonify({'error': 'Too many requests', 'retry_after': int(retry_after)}), 429,
+            {'Retry-After': retry_after})
+
+def _metered(items, limiter, client, errors):
+    """Yield bulk items while the client's create budget lasts, the first one prepaid."""
+    for index, item in enumerate(items):
+        wait = limiter.admit("create", client) if index else 0
+        if wait:
+            errors.append({'url': item[0], 'error': 'Too many requests',
+                           'retry_after': int(retry_after_header(wait))})
+            return
+        yield item
+
+def _timed_writes(results, limiter):
+    """
+    Yield bulk results, then fold the average time spent creating one into
+    the limiter's write latency, also when the request fails or is cut off.
+    """
+    created, spent = 0, 0.0
+    results = iter(results)
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                result = next(results, None)
+            finally:
+                spent += time.perf_counter() - started
+            if result is None:
+                return
+            created += 1
+            yield result
+    finally:
+        limiter.record_write(spent / max(created, 1))
+
+def _ndjson_lines(stream):
+    """Yield the non-empty lines of an NDJSON stream."""
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield line
+
+def create_app(config: Optional[Config] = None) -> Flask:
+    """Build the Flask application from configuration."""
+    config = config or Config.load()
+    if config.METRICS_DIR:
+        metrics.REGISTRY.set_directory(config.METRICS_DIR)
+    app = Flask(__name__)
+    app.secret_key = config.SECRET_KEY
+    if config.TRUSTED_PROXIES:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=config.TRUSTED_PROXIES)
+    shortener = PyTiny.from_config(config)
+    qr_cache = QRCache(config.QR_CACHE_BYTES, processes=config.QR_PROCESSES)
+    limiter = RateLimiter.from_config(config)
+    slow_log = tracing.SlowLog.from_config(config)
+    reaper = Reaper(shortener, config.REAPER_BATCH_SIZE, interval=config.REAPER_INTERVAL,
+                    horizon=config.REAPER_HORIZON)
+    if config.REAPER_INTERVAL:
+        reaper.start()
+    app.extensions["pytiny"] = shortener
+    shortener.prewarm()
+
+    if slow_log is not None:
+        @app.before_request
+        def start_trace():
+            g.trace = tracing.start()
+
+        @app.after_request
+        def note_status(response):
+            g.status = response.status_code
+            return response
+
+        @app.teardown_request
+        def finish_trace(error):
+            trace = g.pop('trace', None)
+            if trace is not None:
+                slow_log.record(tracing.finish(trace), request.method, request.path,
+                                g.get('status', 500))
+
+    def qr_data_uri(url):
+        """Return the QR code image of url as an inline data URI, None if it fails."""
         try:
-            expire_hours = int(expire_hours) if expire_hours else 24
+            image, _ = qr_cache.get(url)
+        except Exception as e:
+            metrics.ERRORS.inc()
+            print(f"QR Code generation error: {str(e)}")
+            return None
+        return f"data:image/png;base64,{base64.b64encode(image).decode()}"
+
+    @app.route('/')
+    def home():
+        return INDEX_HTML
+
+    @app.route('/shorten', methods=['POST'])
+    def shorten():
+        """
+        Handle URL shortening requests.
+
+        With ``generate_qr=on`` the response has ``qr_url``, the cached
+        image at ``/<code>/qr.png``, and ``qr_code``, the same image as a
+        base64 data URI. Send ``qr_inline=false`` to leave out the latter.
+        """
+        if limiter:
+            wait = limiter.admit("create", request.remote_addr)
+            if wait:
+                return _too_many_requests(wait)
+        try:
+            url = request.form.get('url', '').strip()
+
+            if not url:
+                return jsonify({'error': 'URL is required'}), 400
+
+            if not is_valid_url(url):
+                return jsonify({'error': 'Invalid URL format'}), 400
+
+            expire_hours = request.form.get('expire_hours')
+            try:
+                expire_hours = int(expire_hours) if expire_hours else 24
+            except ValueError:
+                return jsonify({'error': 'Invalid expiration hours'}), 400
+
+            redirect_status = request.form.get('redirect_status')
+            cache_ttl = request.form.get('cache_ttl')
+            try:
+                redirect_status = int(redirect_status) if redirect_status else None
+                cache_ttl = int(cache_ttl) if cache_ttl else None
+            except ValueError:
+                return jsonify({'error': 'Invalid redirect policy'}), 400
+
+            generate_qr = request.form.get('generate_qr') == 'on'
+            qr_inline = request.form.get('qr_inline', 'true') != 'false'
+
+            # Create short URL
+            started = time.perf_counter()
+            try:
+                code = shortener.create_short_url(url, expire_hours=expire_hours,
+                                                  redirect_status=redirect_status,
+                                                  cache_ttl=cache_ttl)
+            finally:
+                # Failed writes are slow writes too
+                if limiter:
+                    limiter.record_write(time.perf_counter() - started)
+            short_url = f"{request.host_url}{code}"
+
+            response_data = {
+                'short_url': short_url,
+                'stats': shortener.get_stats(code)
+            }
+
+            if generate_qr:
+                response_data['qr_url'] = f"{short_url}/qr.png"
+                qr_code = qr_data_uri(short_url) if qr_inline else None
+                if qr_code:
+                    response_data['qr_code'] = qr_code
+
+            with tracing.span("serialize"):
+                return jsonify(response_data)
+
+        except Exception as e:
+            return jsonify({'error': str(e)}), 400
+
+
+    @app.route('/shorten/bulk', methods=['POST'])
+    def shorten_bulk():
+        """
+        Shorten many URLs in one request.
+
+        Accepts either a JSON document ``{"urls": [...], "expire_hours": 24}``
+        or an ``application/x-ndjson`` body with one URL string or
+        ``{"url": ..., "expire_hours": ...}`` object per line. NDJSON input is
+        answered with a streamed NDJSON response, one line per URL.
+        Under a create rate limit every URL takes a token, and the URLs
+        after the budget runs out are dropped with a single error.
+        """
+        if limiter:
+            wait = limiter.admit("create", request.remote_addr)
+            if wait:
+                return _too_many_requests(wait)
+        try:
+            default_hours = request.args.get('expire_hours', type=int, default=24)
+            errors = []
+
+            def metered(items):
+                if limiter:
+                    return _metered(items, limiter, request.remote_addr, errors)
+                return items
+
+            def create(items):
+                results = shortener.create_short_urls_bulk(items)
+                if limiter:
+                    return _timed_writes(results, limiter)
+                return results
+
+            if request.mimetype == 'application/x-ndjson':
+                items = metered(_bulk_items(_ndjson_lines(request.stream),
+                                            default_hours, errors))
+
+                def generate():
+                    for long_url, code in create(items):
+                        yield json.dumps({'url': long_url,
+                                          'short_url': f"{request.host_url}{code}"}) + '\n'
+                        while errors:
+                            yield json.dumps(errors.pop(0)) + '\n'
+                    for error in errors:
+                        yield json.dumps(error) + '\n'
+
+                return Response(stream_with_context(generate()),
+                                mimetype='application/x-ndjson')
+
+            payload = request.get_json(silent=True)
+            if not isinstance(payload, dict) or not isinstance(payload.get('urls'), list):
+                return jsonify({'error': 'Expected a JSON object with a "urls" list'}), 400
+
+            default_hours = payload.get('expire_hours', default_hours)
+            items = metered(_bulk_items(payload['urls'], default_hours, errors))
+            results = [
+                {'url': long_url, 'short_url': f"{request.host_url}{code}"}
+                for long_url, code in create(items)
+            ]
+            return jsonify({'results': results, 'errors': errors})
+
+        except Exception as e:
+            return jsonify({'error': str(e)}), 400
+
+    @app.route('/<short_code>/qr.<fmt>')
+    def qr_image(short_code, fmt):
+        """Serve a cached QR code image for a short URL."""
+        if fmt not in FORMATS:
+            abort(404)
+        if not shortener.is_active(short_code):
+            return "URL not found or expired", 404
+
+        try:
+            image, etag = qr_cache.get(f"{request.host_url}{short_code}",
+                                       request.args.get('size', 10, type=int), fmt)
+        except Exception as e:
+            metrics.ERRORS.inc()
+            print(f"QR Code generation error: {str(e)}")
+            return "QR code generation failed", 500
+
+        response = Response(image, mimetype=FORMATS[fmt])
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = config.QR_MAX_AGE
+        return response.make_conditional(request)
+
+    @app.route('/<short_code>/stats')
+    def click_stats(short_code):
+        """
+        Return clicks over time for a short URL.
+
+        Query parameters: ``range`` such as ``90m``, ``24h`` or ``30d``
+        (default ``24h``) and an optional ``resolution`` of ``minute``,
+        ``hour`` or ``day``. Ranges needing more than 10,000 buckets or
+        reaching past the resolution's retention get 400.
+        """
+        try:
+            range_seconds = parse_range(request.args.get('range', '24h'))
+            series = shortener.get_click_series(short_code, range_seconds,
+                                                request.args.get('resolution'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if series is None:
+            return jsonify({'error': 'URL not found'}), 404
+        return jsonify(series)
+
+    @app.route('/api/urls')
+    def list_urls():
+        """
+        List links page by page, oldest first.
+
+        Query parameters: ``cursor`` (the previous page's ``next_cursor``),
+        ``limit`` (default 100, at most 1000) and ``filter`` (``all``,
+        ``active`` or ``expired``). Needs ``Authorization: Bearer`` with
+        PYTINY_ADMIN_TOKEN.
+        """
+        if not is_admin(request.headers.get('Authorization'), config.ADMIN_TOKEN):
+            return jsonify({'error': 'Admin token required'}), 403
+        try:
+            limit = min(int(request.args.get('limit', 100)), 1000)
         except ValueError:
-            return jsonify({'error': 'Invalid expiration hours'}), 400
+            return jsonify({'error': 'Invalid limit'}), 400
+        try:
+            urls, cursor = shortener.list_urls(request.args.get('cursor'), limit,
+                                               request.args.get('filter', 'all'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        with tracing.span("serialize"):
+            return jsonify({'urls': urls, 'next_cursor': cursor})
 
-        generate_qr = request.form.get('generate_qr') == 'on'
+    @app.route('/api/top')
+    def top_codes():
+        """
+        List the most redirected links across all workers.
 
-        # Create short URL
-        code = shortener.create_short_url(url, expire_hours=expire_hours)
-        short_url = f"{request.host_url}{code}"
+        Query parameter ``limit`` (default 20, at most 1000). Needs
+        ``Authorization: Bearer`` with PYTINY_ADMIN_TOKEN, and
+        PYTINY_HOT_CODES to be set.
+        """
+        if not is_admin(request.headers.get('Authorization'), config.ADMIN_TOKEN):
+            return jsonify({'error': 'Admin token required'}), 403
+        try:
+            limit = min(int(request.args.get('limit', 20)), 1000)
+        except ValueError:
+            return jsonify({'error': 'Invalid limit'}), 400
+        return jsonify({'top': shortener.top_codes(limit)})
 
-        response_data = {
-            'short_url': short_url,
-            'stats': shortener.get_stats(code)
-        }
+    @app.route('/api/slow')
+    def slow_requests():
+        """
+        List this worker's recent slow requests with their span timings.
 
-        if generate_qr:
-            qr_code = generate_qr_code(short_url)
-            if qr_code:
-                response_data['qr_code'] = qr_code
+        Query parameter ``limit`` (default 100). Needs ``Authorization:
+        Bearer`` with PYTINY_ADMIN_TOKEN, and PYTINY_SLOW_REQUEST_SECONDS
+        to be set.
+        """
+        if not is_admin(request.headers.get('Authorization'), config.ADMIN_TOKEN):
+            return jsonify({'error': 'Admin token required'}), 403
+        if slow_log is None:
+            return jsonify({'error': 'Slow request log is disabled'}), 404
+        try:
+            limit = int(request.args.get('limit', 100))
+        except ValueError:
+            return jsonify({'error': 'Invalid limit'}), 400
+        return jsonify({'threshold': slow_log.threshold, 'requests': slow_log.recent(limit)})
 
-        return jsonify(response_data)
+    @app.route('/api/profile')
+    def profile():
+        """
+        Sample this worker's threads and return collapsed stacks.
 
-    except Exception as e:
-        return jsonify({'error': str(e)}), 400
+        Query parameters ``seconds`` (default 10, at most 60) and
+        ``interval`` (default 0.005). Needs ``Authorization: Bearer`` with
+        PYTINY_ADMIN_TOKEN and PYTINY_PROFILER=true. The request itself
+        occupies a thread for that long, so run gunicorn with --threads.
+        """
+        if not is_admin(request.headers.get('Authorization'), config.ADMIN_TOKEN):
+            return jsonify({'error': 'Admin token required'}), 403
+        if not config.PROFILER:
+            return jsonify({'error': 'Profiler is disabled'}), 404
+        try:
+            seconds = float(request.args.get('seconds', 10))
+            interval = float(request.args.get('interval', 0.005))
+        except ValueError:
+            return jsonify({'error': 'Invalid seconds or interval'}), 400
+        if not (math.isfinite(seconds) and math.isfinite(interval)):
+            return jsonify({'error': 'Invalid seconds or interval'}), 400
+        stacks = profiler.profile(seconds, interval)
+        if stacks is None:
+            return jsonify({'error': 'A profile is already running'}), 409
+        return Response(stacks, mimetype='text/plain')
 
-@app.route('/<short_code>')
-def redirect_url(short_code):
-    """Handle URL redirection."""
-    try:
-        long_url = shortener.get_long_url(short_code)
-        if long_url:
-            return redirect(long_url)
-        return "URL not found or expired", 404
-    except Exception as e:
-        return f"Error: {str(e)}", 500
+    @app.route('/metrics')
+    def metrics_endpoint():
+        """Expose metrics of all workers in the Prometheus text format."""
+        return Response(metrics.REGISTRY.render(),
+                        mimetype='text/plain; version=0.0.4')
+
+    @app.route('/<short_code>')
+    def redirect_url(short_code):
+        """Handle URL redirection."""
+        start = time.perf_counter()
+        try:
+            if limiter:
+                wait = limiter.admit("redirect", request.remote_addr)
+                if wait:
+                    return "Too many requests", 429, {'Retry-After': retry_after_header(wait)}
+            link = shortener.get_redirect(short_code,
+                                          referrer=request.referrer,
+                                          user_agent=request.headers.get('User-Agent'))
+            if not link:
+                return "URL not found or expired", 404
+
+            if not_modified(link, request.headers.get('If-None-Match'),
+                            request.headers.get('If-Modified-Since')):
+                response = Response(status=304)
+            else:
+                response = redirect(link[1], code=link[0])
+            response.headers.update(cache_headers(link))
+            return response
+        except Exception as e:
+            metrics.ERRORS.inc()
+            return f"Error: {str(e)}", 500
+        finally:
+            metrics.REDIRECT_SECONDS.observe(time.perf_counter() - start)
+
+    return app
+
+_app = None
+
+def __getattr__(name):
+    # ``pytiny.web:app`` keeps working, built on first access only
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def main():
+    """Run the development server."""
+    config = Config.load()
+    create_app(config).run(host=config.HOST, port=config.PORT, debug=config.DEBUG)
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    main()
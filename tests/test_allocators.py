@@ -0,0 +1,48 @@
+import os
+import pytest
+from pytiny import PyTiny
+from pytiny.allocators import CounterAllocator, FeistelPermutation, RandomAllocator
+
+
+def test_feistel_permutation_is_bijective():
+    """Test that the keyed permutation maps range(n) onto itself."""
+    permutation = FeistelPermutation(b"secret")
+    for n in (1, 7, 100, 1000):
+        assert sorted(permutation.permute(i, n) for i in range(n)) == list(range(n))
+
+
+def test_counter_codes_unique_across_lengths():
+    """Test that counter codes stay unique when the length grows."""
+    counter = iter(range(0, 10 ** 6, 10))
+    allocator = CounterAllocator("abc", lambda n: next(counter), min_length=2,
+                                 block_size=10, secret="key")
+    codes = [allocator.next_code() for _ in range(9 + 27 + 5)]
+    assert len(set(codes)) == len(codes)
+    assert {len(code) for code in codes} == {2, 3, 4}
+
+
+def test_random_allocator_grows_on_collisions():
+    """Test that repeated collisions lengthen random codes."""
+    allocator = RandomAllocator("abc", min_length=4)
+    for _ in range(10):
+        allocator.collision(allocator.next_code())
+    assert len(allocator.next_code()) == 5
+
+
+@pytest.fixture
+def counter_shortener():
+    db_path = "test_pytiny_counter.db"
+    shortener = PyTiny(db_path, code_strategy="counter", code_secret="key")
+    yield shortener
+    shortener.close()
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+
+def test_counter_strategy(counter_shortener):
+    """Test creating URLs with the counter strategy."""
+    codes = [counter_shortener.create_short_url(f"https://example.com/{i}")
+             for i in range(50)]
+    assert len(set(codes)) == 50
+    assert all(len(code) == 6 for code in codes)
+    assert counter_shortener.get_long_url(codes[7]) == "https://example.com/7"
@@ -0,0 +1,86 @@
+import time
+import pytest
+from pytiny import PyTiny
+from pytiny.analytics import agent_class, parse_range, parse_retention, referrer_host
+
+
+@pytest.fixture
+def shortener(tmp_path):
+    shortener = PyTiny(str(tmp_path / "analytics.db"),
+                       analytics_flush_interval=60,
+                       analytics_retention="minute=1,hour=30,day=0")
+    yield shortener
+    shortener.close()
+
+
+def test_event_classification():
+    """Test referrer, user-agent, range and retention parsing."""
+    assert agent_class("Mozilla/5.0 (iPhone; CPU iPhone OS 17_0)") == "mobile"
+    assert agent_class("Googlebot/2.1 (+http://www.google.com/bot.html)") == "bot"
+    assert agent_class("Mozilla/5.0 (X11; Linux x86_64)") == "desktop"
+    assert agent_class(None) == "unknown"
+    assert referrer_host("https://news.example.org/item?id=1") == "news.example.org"
+    assert referrer_host("") == ""
+    assert parse_range("90m") == 5400
+    assert parse_range("7d") == 7 * 86400
+    with pytest.raises(ValueError):
+        parse_range("soon")
+    assert parse_retention("hour=30,day=0") == {"hour": 30, "day": 0}
+
+
+def test_click_series(shortener):
+    """Test that redirects are rolled up into time buckets with dimensions."""
+    code = shortener.create_short_url("https://example.com")
+    for _ in range(3):
+        shortener.get_long_url(code, referrer="https://t.co/abc", user_agent="Mozilla/5.0 (Android)")
+    shortener.get_long_url(code)
+
+    series = shortener.get_click_series(code, parse_range("1h"))
+    assert series["resolution"] == "minute"
+    assert series["clicks"] == 4
+    assert len(series["series"]) == 60
+    assert series["series"][-1]["clicks"] == 4
+    assert series["referrers"] == {"t.co": 3, "": 1}
+    assert series["agents"] == {"mobile": 3, "unknown": 1}
+
+    daily = shortener.get_click_series(code, parse_range("30d"))
+    assert daily["resolution"] == "day"
+    assert daily["clicks"] == 4
+    assert shortener.get_click_series("zzzzzzzz") is None
+
+
+def test_prune_analytics(shortener):
+    """Test that rollups are pruned per resolution once past retention."""
+    code = shortener.create_short_url("https://example.com")
+    shortener.get_long_url(code)
+    shortener.flush_clicks()
+
+    now = int(time.time())
+    assert shortener.prune_analytics(now) == 0
+    # Two days later only the minute rollup has aged out
+    assert shortener.prune_analytics(now + 2 * 86400) == 1
+    assert shortener.get_click_series(code, 3600, now=now)["clicks"] == 0
+    assert shortener.get_click_series(code, 86400, "hour", now=now)["clicks"] == 1
+
+
+def test_click_series_bounds(shortener):
+    """Test that ranges past retention or with too many buckets are refused."""
+    code = shortener.create_short_url("https://example.com")
+    with pytest.raises(ValueError):
+        shortener.get_click_series(code, parse_range("1000d"), "minute")
+    with pytest.raises(ValueError):
+        shortener.get_click_series(code, parse_range("2d"), "minute")
+    with pytest.raises(ValueError):
+        shortener.get_click_series(code, parse_range("40d"), "hour")
+    with pytest.raises(ValueError):
+        shortener.get_click_series(code, 10 ** 6 * 86400)
+
+
+def test_default_resolution_covers_range(tmp_path):
+    """Test that the default resolution moves coarser to keep the whole range."""
+    shortener = PyTiny(str(tmp_path / "short.db"), analytics_flush_interval=60,
+                       analytics_retention="hour=1,day=0")
+    code = shortener.create_short_url("https://example.com")
+    assert shortener.get_click_series(code, parse_range("12h"))["resolution"] == "hour"
+    assert shortener.get_click_series(code, parse_range("3d"))["resolution"] == "day"
+    shortener.close()
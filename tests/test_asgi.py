@@ -0,0 +1,123 @@
+import asyncio
+import json
+import os
+import pytest
+from pytiny import PyTiny, metrics
+from pytiny.asgi import ASGIApp
+from pytiny.ratelimit import Limit, RateLimiter
+from pytiny.tracing import SlowLog
+
+
+@pytest.fixture
+def app():
+    db_path = "test_pytiny_asgi.db"
+    app = ASGIApp(PyTiny(db_path), max_workers=2)
+    yield app
+    app.close()
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+
+def call(app, method, path, body=b"", content_type=b"application/x-www-form-urlencoded",
+         headers=()):
+    """Drive the ASGI app with a single request and collect the response."""
+    scope = {"type": "http", "method": method, "path": path, "scheme": "http",
+             "headers": [(b"host", b"testserver"), (b"content-type", content_type),
+                         *headers]}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    headers = dict(messages[0]["headers"])
+    return messages[0]["status"], headers, messages[1]["body"]
+
+
+def test_shorten_and_redirect(app):
+    """Test creating a link over ASGI and following it."""
+    status, _, body = call(app, "POST", "/shorten", b"url=https%3A%2F%2Fexample.com")
+    assert status == 200
+    short_url = json.loads(body)["short_url"]
+    assert short_url.startswith("http://testserver/")
+
+    status, headers, _ = call(app, "GET", "/" + short_url.rsplit("/", 1)[1])
+    assert status == 302
+    assert headers[b"location"] == b"https://example.com"
+
+
+def test_unknown_code(app):
+    """Test that unknown codes and bad input are rejected."""
+    assert call(app, "GET", "/zzzzzz")[0] == 404
+    assert call(app, "POST", "/shorten", b'{"url": "nope"}', b"application/json")[0] == 400
+
+
+def test_redirect_caching_headers(app):
+    """Test per-link redirect status, expiry-capped max-age and revalidation."""
+    status, _, body = call(app, "POST", "/shorten",
+                           b"url=https%3A%2F%2Fexample.com&expire_hours=1"
+                           b"&redirect_status=301&cache_ttl=86400")
+    code = json.loads(body)["short_url"].rsplit("/", 1)[1]
+
+    status, headers, _ = call(app, "GET", "/" + code)
+    assert status == 301
+    max_age = int(headers[b"cache-control"].split(b"max-age=")[1])
+    assert 3590 <= max_age <= 3600
+    etag = headers[b"etag"]
+
+    status, headers, _ = call(app, "GET", "/" + code, headers=[(b"if-none-match", etag)])
+    assert status == 304
+    assert b"location" not in headers
+
+    # Opting out of caching
+    app.shortener.set_redirect_policy(code, 307, 0)
+    status, headers, _ = call(app, "GET", "/" + code, headers=[(b"if-none-match", etag)])
+    assert status == 307
+    assert headers[b"cache-control"] == b"no-store"
+    assert headers[b"etag"] != etag
+
+
+def test_slow_log_spans_pool_threads(tmp_path):
+    """Test that spans from the DB thread pool land in the request's trace."""
+    slow_log = SlowLog(0.0)
+    app = ASGIApp(PyTiny(str(tmp_path / "asgi.db")), max_workers=2, slow_log=slow_log)
+    call(app, "POST", "/shorten", b"url=https%3A%2F%2Fexample.com")
+    entry = slow_log.recent()[0]
+    assert entry["status"] == 200
+    # Each new pool thread opens its own connection first
+    names = [span["name"] for span in entry["spans"]]
+    assert "db.connect" in names
+    assert [name for name in names if name != "db.connect"] == ["db.insert", "db.stats",
+                                                                 "serialize"]
+    app.close()
+
+
+def test_request_body_limit(app):
+    """Test that oversized bodies get 413, with or without a Content-Length."""
+    app.max_body = 64
+    body = b"url=https%3A%2F%2Fexample.com%2F" + b"a" * 64
+    assert call(app, "POST", "/shorten", body)[0] == 413
+    assert call(app, "POST", "/shorten", b"url=https%3A%2F%2Fexample.com",
+                headers=[(b"content-length", b"100000")])[0] == 413
+    assert call(app, "POST", "/shorten", b"url=https%3A%2F%2Fexample.com")[0] == 200
+
+
+def test_every_redirect_is_timed(app, monkeypatch):
+    """Test that throttled and failing redirects are observed too."""
+    observed = []
+    monkeypatch.setattr(metrics.REDIRECT_SECONDS, "observe", observed.append)
+    app.limiter = RateLimiter({"redirect": (None, Limit(1 / 60, 1))})
+    assert call(app, "GET", "/zzzzzz")[0] == 404
+    assert call(app, "GET", "/zzzzzz")[0] == 429
+
+    app.limiter = None
+
+    def fail(*args):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(app.shortener, "get_redirect", fail)
+    assert call(app, "GET", "/zzzzzz")[0] == 500
+    assert len(observed) == 3
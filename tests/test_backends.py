@@ -0,0 +1,297 @@
+import fnmatch
+import socketserver
+import threading
+import time
+import pytest
+from pytiny import PyTiny, MemoryStorage, RedisStorage, SQLiteStorage
+from pytiny.storage import open_storage, reshard
+
+
+class FakeRedis:
+    """Single-lock, in-process stand-in for the Redis commands RedisStorage uses."""
+
+    def __init__(self):
+        self.data = {}
+        self.versions = {}
+        self.lock = threading.Lock()
+
+    def touch(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def run(self, name, args):
+        data = self.data
+        if name in ("PING",):
+            return "PONG"
+        if name in ("SELECT", "AUTH"):
+            return "OK"
+        if name == "EXISTS":
+            return sum(1 for key in args if key in data)
+        if name == "GET":
+            return data.get(args[0])
+        if name == "SET":
+            data[args[0]] = args[1]
+        elif name == "DEL":
+            removed = sum(1 for key in args if data.pop(key, None) is not None)
+            for key in args:
+                self.touch(key)
+            return removed
+        elif name in ("INCR", "INCRBY", "DECR", "DECRBY"):
+            step = int(args[1]) if len(args) > 1 else 1
+            if name.startswith("DECR"):
+                step = -step
+            data[args[0]] = str(int(data.get(args[0], 0)) + step).encode()
+            self.touch(args[0])
+            return int(data[args[0]])
+        elif name == "HSET":
+            fields = data.setdefault(args[0], {})
+            for i in range(1, len(args), 2):
+                fields[args[i]] = args[i + 1]
+        elif name == "HDEL":
+            fields = data.get(args[0], {})
+            for field in args[1:]:
+                fields.pop(field, None)
+        elif name == "HINCRBY":
+            fields = data.setdefault(args[0], {})
+            fields[args[1]] = str(int(fields.get(args[1], 0)) + int(args[2])).encode()
+            self.touch(args[0])
+            return int(fields[args[1]])
+        elif name == "HMGET":
+            fields = data.get(args[0], {})
+            return [fields.get(field) for field in args[1:]]
+        elif name == "HGETALL":
+            return [item for pair in data.get(args[0], {}).items() for item in pair]
+        elif name == "RPUSH":
+            data.setdefault(args[0], []).extend(args[1:])
+        elif name == "LRANGE":
+            start, stop = int(args[1]), int(args[2])
+            return data.get(args[0], [])[start:stop + 1]
+        elif name == "SADD":
+            data.setdefault(args[0], set()).update(args[1:])
+        elif name == "SREM":
+            data.get(args[0], set()).difference_update(args[1:])
+        elif name == "SMEMBERS":
+            return sorted(data.get(args[0], ()))
+        elif name == "ZADD":
+            data.setdefault(args[0], {})[args[2]] = float(args[1])
+        elif name == "ZREM":
+            for member in args[1:]:
+                data.get(args[0], {}).pop(member, None)
+        elif name == "ZRANGE":
+            return [m for m, _ in sorted(data.get(args[0], {}).items(), key=lambda i: i[1])]
+        elif name in ("ZRANGEBYSCORE", "ZCOUNT"):
+            members = self.zrange(data.get(args[0], {}), args[1], args[2])
+            if name == "ZCOUNT":
+                return len(members)
+            options = [arg.upper() for arg in args[3:]]
+            if b"LIMIT" in options:
+                offset, count = (int(n) for n in args[3 + options.index(b"LIMIT") + 1:][:2])
+                members = members[offset:offset + count]
+            if b"WITHSCORES" in options:
+                return [item for m, score in members for item in (m, b"%d" % score)]
+            return [m for m, _ in members]
+        elif name == "SCAN":
+            pattern = args[args.index(b"MATCH") + 1].decode()
+            return [b"0", [key for key in data if fnmatch.fnmatchcase(key.decode(), pattern)]]
+        else:
+            raise ValueError(f"unknown command {name}")
+        if args and name not in ("HMGET", "LRANGE", "SMEMBERS"):
+            self.touch(args[0])
+        return "OK"
+
+    @staticmethod
+    def zrange(members, low, high):
+        def bound(value, default):
+            if value in (b"-inf", b"+inf"):
+                return default, False
+            if value.startswith(b"("):
+                return float(value[1:]), True
+            return float(value), False
+
+        (low, low_open), (high, high_open) = bound(low, -1e300), bound(high, 1e300)
+        return sorted(((m, s) for m, s in members.items()
+                       if (s > low if low_open else s >= low)
+                       and (s < high if high_open else s <= high)), key=lambda i: i[1])
+
+
+class RESPHandler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def write(self, reply):
+        if reply is None:
+            self.wfile.write(b"$-1\r\n")
+        elif isinstance(reply, int):
+            self.wfile.write(b":%d\r\n" % reply)
+        elif isinstance(reply, str):
+            self.wfile.write(b"+%s\r\n" % reply.encode())
+        elif isinstance(reply, Exception):
+            self.wfile.write(b"-ERR %s\r\n" % str(reply).encode())
+        elif isinstance(reply, list):
+            self.wfile.write(b"*%d\r\n" % len(reply))
+            for item in reply:
+                self.write(item)
+        else:
+            self.wfile.write(b"$%d\r\n%s\r\n" % (len(reply), reply))
+
+    def handle(self):
+        server = self.server.fake
+        watched, queue = {}, None
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            name = args[0].decode().upper()
+            with server.lock:
+                if name == "WATCH":
+                    watched.update((key, server.versions.get(key, 0)) for key in args[1:])
+                    reply = "OK"
+                elif name == "UNWATCH":
+                    watched, reply = {}, "OK"
+                elif name == "MULTI":
+                    queue, reply = [], "OK"
+                elif name == "EXEC":
+                    if any(server.versions.get(key, 0) != version
+                           for key, version in watched.items()):
+                        reply = None
+                    else:
+                        reply = [server.run(n, a) for n, a in queue]
+                    watched, queue = {}, None
+                elif queue is not None:
+                    queue.append((name, args[1:]))
+                    reply = "QUEUED"
+                else:
+                    try:
+                        reply = server.run(name, args[1:])
+                    except ValueError as e:
+                        reply = e
+            self.write(reply)
+
+
+@pytest.fixture
+def redis_url():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), RESPHandler)
+    server.daemon_threads = True
+    server.fake = FakeRedis()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"redis://127.0.0.1:{server.server_address[1]}/0"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=["memory", "redis"])
+def storage(request):
+    if request.param == "memory":
+        storage = open_storage(":memory:")
+    else:
+        storage = open_storage(request.getfixturevalue("redis_url"))
+    yield storage
+    storage.close()
+
+
+def test_open_storage_backends(redis_url):
+    """Test that open_storage picks the backend from db_path."""
+    assert isinstance(open_storage(":memory:"), MemoryStorage)
+    storage = open_storage(redis_url)
+    assert isinstance(storage, RedisStorage)
+    assert storage.ping()
+    storage.close()
+
+
+def test_backend_links(storage):
+    """Test creating, resolving, updating and deleting links on each backend."""
+    shortener = PyTiny(storage=storage, cache_size=0, dedup=True, bloom_error_rate=0.01)
+    # Redis has no change token to trust a filter's misses by
+    assert (shortener._filter is None) == isinstance(storage, RedisStorage)
+    code = shortener.create_short_url("https://example.com")
+    assert shortener.create_short_url("https://example.com") == code
+    codes = [code for _, code in shortener.create_short_urls_bulk(
+        ["https://example.org", "https://example.net"])]
+    assert shortener.get_long_url(codes[1]) == "https://example.net"
+    assert shortener.get_long_url("zzzzzz") is None
+
+    assert shortener.get_long_url(code) == "https://example.com"
+    shortener.flush_clicks()
+    assert shortener.get_stats(code)["clicks"] == 1
+
+    shortener.set_redirect_policy(code, 301, 600)
+    assert shortener.get_redirect(code)[0] == 301
+
+    now = int(time.time())
+    assert storage.update_expiry(codes[0], now - 10)
+    assert shortener.get_long_url(codes[0]) is None
+    assert storage.oldest_expired(now) == now - 10
+    assert list(storage.iter_expiring(now - 20, now, 1)) == [(codes[0], now - 10)]
+    assert storage.summary(now) == {"urls": 3, "expired": 1, "clicks": 2}
+    assert shortener.cleanup_expired() == 1
+    assert not shortener.update_expiry(codes[0], None)
+
+    assert shortener.delete_url(code)
+    assert not shortener.delete_url(code)
+    assert storage.summary(now) == {"urls": 1, "expired": 0, "clicks": 1}
+    if isinstance(storage, MemoryStorage):
+        assert sorted(storage.codes_since()[0]) == sorted([code, *codes])
+
+    listed, cursor = [], None
+    while True:
+        urls, cursor = shortener.list_urls(cursor, limit=1)
+        listed += [url["short_code"] for url in urls]
+        if cursor is None:
+            break
+    assert listed == [codes[1]]
+    shortener.close()
+
+
+def test_backend_click_series(storage):
+    """Test that click rollups are stored and removed with their link."""
+    shortener = PyTiny(storage=storage, cache_size=0, analytics_flush_interval=60)
+    code = shortener.create_short_url("https://example.com")
+    for _ in range(3):
+        shortener.get_long_url(code, referrer="https://news.example.com/")
+    shortener.flush_clicks()
+    assert shortener.get_click_series(code, 3600)["clicks"] == 3
+
+    shortener.delete_url(code)
+    assert storage.get_rollups(code, 60, 0, 2 ** 40) == []
+
+    code = shortener.create_short_url("https://example.org", expire_hours=1)
+    shortener.get_long_url(code)
+    shortener.flush_clicks()
+    assert shortener.delete_expired_batch(10, int(time.time()) + 7200) == 1
+    assert storage.get_rollups(code, 60, 0, 2 ** 40) == []
+    shortener.close()
+
+
+def test_memory_expiry_heap():
+    """Test that reaping skips heap entries left behind by expiry updates."""
+    storage = MemoryStorage()
+    storage.insert(("a", "https://a.example", 0, 100))
+    storage.insert(("b", "https://b.example", 0, 200))
+    storage.update_expiry("a", 300)
+    assert storage.oldest_expired(250) == 200
+    assert storage.delete_expired(250, 10) == 1
+    assert storage.get("a") is not None and storage.get("b") is None
+    assert storage.delete_expired(1000, 10) == 1
+    assert storage.summary(1000)["urls"] == 0
+
+
+def test_reshard_into_redis(tmp_path, redis_url):
+    """Test copying SQLite links to Redis, and again over the copies."""
+    source = SQLiteStorage(str(tmp_path / "source.db"))
+    shortener = PyTiny(storage=source)
+    codes = [code for _, code in shortener.create_short_urls_bulk(
+        f"https://example.com/{i}" for i in range(50))]
+    target = RedisStorage(redis_url)
+    assert reshard(source, target, batch_size=20) == 50
+    assert reshard(source, target, batch_size=20) == 50
+    assert target.summary(0)["urls"] == 50
+    assert target.get(codes[7])[0] == "https://example.com/7"
+    assert target.sequence_value() == source.sequence_value()
+    target.close()
+    shortener.close()
@@ -0,0 +1,59 @@
+import pytest
+from pytiny import PyTiny
+from pytiny.bloom import BloomFilter
+
+
+@pytest.fixture
+def workers(tmp_path):
+    db_path = str(tmp_path / "bloom.db")
+    first = PyTiny(db_path, bloom_error_rate=0.01)
+    second = PyTiny(db_path, bloom_error_rate=0.01)
+    yield first, second
+    first.close()
+    second.close()
+
+
+def test_bloom_false_positive_rate():
+    """Test that the filter has no false negatives and roughly its target error rate."""
+    bloom = BloomFilter(10000, error_rate=0.01)
+    bloom.update(f"code{i}" for i in range(10000))
+    assert all(f"code{i}" in bloom for i in range(10000))
+
+    false_positives = sum(f"other{i}" in bloom for i in range(10000))
+    assert false_positives < 200
+
+
+def test_unknown_codes_skip_database(workers):
+    """Test that unknown and malformed codes are rejected without a DB query."""
+    first, _ = workers
+    code = first.create_short_url("https://example.com/known")
+    assert first.get_long_url(code) == "https://example.com/known"
+
+    queries = []
+    get = first.storage.get
+    first.storage.get = lambda short_code: queries.append(short_code) or get(short_code)
+
+    assert first.get_long_url("favicon.ico") is None
+    assert first.get_long_url("zzzzzzzz") is None
+    assert queries == []
+    # Misses are trusted without a query while nothing has been committed
+    assert first.storage.change_token() is not None
+
+
+def test_codes_from_other_workers_are_found(workers):
+    """Test that a filter picks up codes created by another process."""
+    first, second = workers
+    first.create_short_url("https://example.com/warm")
+    assert second.get_long_url("zzzzzzzz") is None
+
+    code = first.create_short_url("https://example.com/fresh")
+    codes = [c for _, c in first.create_short_urls_bulk(
+        f"https://example.com/{i}" for i in range(50))]
+
+    assert second.get_long_url(code) == "https://example.com/fresh"
+    assert all(second.is_active(c) for c in codes)
+
+    # Deleted codes linger until the filter is rebuilt
+    first.delete_url(code)
+    second._filter.rebuild()
+    assert code not in second._filter._bloom
@@ -0,0 +1,36 @@
+from pytiny.cache import LRUCache
+
+
+def test_lru_eviction():
+    """Test that the least recently used entry is evicted first."""
+    cache = LRUCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entry_never_outlives_expiry():
+    """Test that entries are dropped once their deadline passes."""
+    cache = LRUCache(max_size=10, ttl=100)
+    cache.set("a", 1, expires_at=110, now=100)
+    assert cache.get("a", now=109) == 1
+    assert cache.get("a", now=110) is None
+
+    cache.set("b", 2, expires_at=None, now=100)
+    assert cache.get("b", now=199) == 2
+    assert cache.get("b", now=200) is None
+
+
+def test_set_skipped_after_invalidation():
+    """Test that a value read before an invalidation is not cached."""
+    cache = LRUCache(max_size=10)
+    generation = cache.generation
+    cache.invalidate("a")
+    cache.set("a", 1, generation=generation)
+    assert cache.get("a") is None
+    cache.set("a", 2, generation=cache.generation)
+    assert cache.get("a") == 2
@@ -0,0 +1,59 @@
+import csv
+import io
+import json
+import os
+import pytest
+from pytiny import PyTiny
+from pytiny.cli import import_csv
+from pytiny.export import write_csv, write_ndjson, write_parquet
+
+
+@pytest.fixture
+def shortener():
+    db_path = "test_pytiny_cli.db"
+    shortener = PyTiny(db_path)
+    yield shortener
+    shortener.close()
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+
+def test_import_csv(shortener, tmp_path):
+    """Test importing URLs from a CSV file."""
+    path = tmp_path / "urls.csv"
+    path.write_text("url,expire_hours\nexample.com/a,\nhttps://example.com/b,2\nhttps://example.com/c,soon\n")
+    output = io.StringIO()
+
+    imported, skipped = import_csv(shortener, str(path), batch_size=2, output=output)
+
+    assert (imported, skipped) == (2, 1)
+    rows = [line.split(",") for line in output.getvalue().splitlines()]
+    assert rows[0][0] == "https://example.com/a"
+    assert shortener.get_long_url(rows[1][1]) == "https://example.com/b"
+
+
+def test_export_formats(shortener):
+    """Test streaming links out as NDJSON and CSV."""
+    code = shortener.create_short_url("https://example.com/a", 1)
+    shortener.create_short_url("https://example.com/b")
+
+    output = io.StringIO()
+    assert write_ndjson(shortener.iter_urls(), output) == 2
+    first = json.loads(output.getvalue().splitlines()[0])
+    assert first["short_code"] == code and first["expires_at"] > first["created_at"]
+
+    output = io.StringIO()
+    assert write_csv(shortener.iter_urls(filter="active"), output) == 2
+    rows = list(csv.DictReader(io.StringIO(output.getvalue())))
+    assert rows[1]["long_url"] == "https://example.com/b" and rows[1]["expires_at"] == ""
+
+
+def test_export_parquet(shortener, tmp_path):
+    """Test writing links to Parquet in row groups."""
+    pq = pytest.importorskip("pyarrow.parquet")
+    for i in range(5):
+        shortener.create_short_url("https://example.com/%d" % i)
+    path = str(tmp_path / "links.parquet")
+    assert write_parquet(shortener.iter_urls(), path, row_group_size=2) == 5
+    table = pq.read_table(path)
+    assert table.num_rows == 5 and pq.ParquetFile(path).num_row_groups == 3
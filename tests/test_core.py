@@ -2,6 +2,7 @@ import pytest
 import os
 import time
 from pytiny import PyTiny
+from pytiny.clicks import ClickBuffer
 from pytiny.utils import validate_url, sanitize_url
 
 @pytest.fixture
@@ -11,6 +12,7 @@ def shortener():
     shortener = PyTiny(db_path)
     yield shortener
     # Cleanup
+    shortener.close()
     if os.path.exists(db_path):
         os.remove(db_path)
 
@@ -35,3 +37,131 @@ def test_url_validation():
     assert validate_url("https://example.com")
     assert not validate_url("not-a-url")
     assert sanitize_url("example.com") == "https://example.com"
+
+def test_connection_reused_per_thread(shortener):
+    """Test that a thread keeps using the same pooled connection."""
+    code = shortener.create_short_url("https://example.com")
+    conn = shortener.storage._pool.get()
+    shortener.get_long_url(code)
+    assert shortener.storage._pool.get() is conn
+    mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    assert mode == "wal"
+
+def test_lookup_cache_invalidation(shortener):
+    """Test that cached lookups are dropped on delete and expiry updates."""
+    code = shortener.create_short_url("https://example.com")
+    assert shortener.get_long_url(code) == "https://example.com"
+    assert shortener.get_long_url(code) == "https://example.com"
+    assert shortener.cache_stats()["hits"] == 1
+
+    shortener.update_expiry(code, 0)
+    assert shortener.get_long_url(code) is None
+
+    other = shortener.create_short_url("https://example.org")
+    shortener.get_long_url(other)
+    assert shortener.delete_url(other)
+    assert shortener.get_long_url(other) is None
+
+def test_buffered_clicks(shortener):
+    """Test that buffered clicks show up in stats before and after a flush."""
+    code = shortener.create_short_url("https://example.com")
+    for _ in range(3):
+        shortener.get_long_url(code)
+    assert shortener.get_stats(code)["clicks"] == 3
+
+    assert shortener.flush_clicks() == 1
+    stats = shortener.get_stats(code)
+    assert stats["clicks"] == 3
+    assert stats["last_clicked"] is not None
+
+def test_full_click_buffer_never_fails_redirects():
+    """Test that a failing flush keeps the clicks and does not reach the caller."""
+    batches, failing = [], [True]
+
+    def flush_fn(batch):
+        if failing[0]:
+            raise RuntimeError("database is locked")
+        batches.append(dict(batch))
+
+    inline = ClickBuffer(flush_fn, flush_interval=0, max_pending=2)
+    for _ in range(3):
+        inline.record("abc", 100)
+    assert inline.pending("abc") == (3, 100)
+    failing[0] = False
+    assert inline.flush() == 1 and batches == [{"abc": (3, 100)}]
+
+    background = ClickBuffer(flush_fn, flush_interval=60, max_pending=2)
+    background.record("xyz", 100)
+    background.record("xyz", 101)
+    deadline = time.time() + 5
+    while len(batches) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert batches[1] == {"xyz": (2, 101)}
+    background.close()
+
+def test_create_short_urls_bulk(shortener):
+    """Test bulk creation with per-item expiration."""
+    urls = [f"https://example.com/{i}" for i in range(25)]
+    urls.append(("https://example.com/expiring", 1))
+    created = list(shortener.create_short_urls_bulk(iter(urls), batch_size=10))
+
+    assert [long_url for long_url, _ in created][:25] == urls[:25]
+    codes = [code for _, code in created]
+    assert len(set(codes)) == 26
+    assert shortener.get_long_url(codes[3]) == "https://example.com/3"
+    assert shortener.get_stats(codes[-1])["expires_at"] is not None
+
+def test_dedup_reuses_live_links(shortener):
+    """Test that dedup mode returns existing codes for identical URLs and expiry."""
+    shortener.dedup = True
+    code = shortener.create_short_url("https://example.com/dup")
+    assert shortener.create_short_url("example.com/dup ") == code
+    assert shortener.create_short_url("https://example.com/dup", expire_hours=1) != code
+
+    results = dict(shortener.create_short_urls_bulk(
+        ["https://example.com/dup", "https://example.com/new", "https://example.com/new"]))
+    assert results["https://example.com/dup"] == code
+    assert list(shortener.create_short_urls_bulk(["https://example.com/new"]))[0][1] == \
+        results["https://example.com/new"]
+    assert shortener.get_summary()["urls"] == 3
+
+    # Links past half their lifetime are not handed out again
+    expiring = shortener.create_short_url("https://example.com/soon", expire_hours=2)
+    with shortener.storage._pool.get() as conn:
+        conn.execute("UPDATE urls SET created_at = created_at - 5400, "
+                     "expires_at = expires_at - 5400 WHERE short_code = ?", (expiring,))
+    assert shortener.create_short_url("https://example.com/soon", expire_hours=2) != expiring
+
+def test_list_urls_pages(shortener):
+    """Test keyset-paginated listing with filters and cursors."""
+    codes = [code for _, code in shortener.create_short_urls_bulk(
+        "https://example.com/%d" % i for i in range(25))]
+    for code in codes[:3]:
+        shortener.storage.update_expiry(code, 1)
+
+    listed, cursor, pages = [], None, 0
+    while True:
+        urls, cursor = shortener.list_urls(cursor, limit=10)
+        listed += [url["short_code"] for url in urls]
+        pages += 1
+        if cursor is None:
+            break
+    assert listed == codes and pages == 3
+
+    expired, cursor = shortener.list_urls(filter="expired")
+    assert [url["short_code"] for url in expired] == codes[:3] and cursor is None
+    assert len(shortener.list_urls(limit=100, filter="active")[0]) == 22
+    for cursor in ("not-a-cursor", "WyJhIiwiYiJd", "Wzk5LG51bGxd", "LTE", "dHJ1ZQ"):
+        with pytest.raises(ValueError):
+            shortener.list_urls(cursor)
+
+def test_iter_urls_reads_a_snapshot(shortener):
+    """Test that an export does not see links created while it runs."""
+    for i in range(5):
+        shortener.create_short_url("https://example.com/%d" % i)
+    urls = shortener.iter_urls(batch_size=2)
+    first = next(urls)
+    shortener.create_short_url("https://example.com/late")
+    assert first["long_url"] == "https://example.com/0"
+    assert len([first, *urls]) == 5
+    assert len(list(shortener.iter_urls())) == 6
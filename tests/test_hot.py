@@ -0,0 +1,65 @@
+import random
+from collections import Counter
+from pytiny import PyTiny
+from pytiny.hot import HotCodes, SpaceSaving, load_top
+
+
+def test_space_saving_finds_heavy_hitters():
+    """Test that frequent keys are counted within the guaranteed error."""
+    rng = random.Random(1)
+    stream = [f"k{int(rng.paretovariate(1.2))}" for _ in range(20000)]
+    summary = SpaceSaving(50)
+    for key in stream:
+        summary.add(key)
+    assert len(summary) == 50
+
+    exact = Counter(stream)
+    top = summary.top(5)
+    assert [key for key, _, _ in top] == [key for key, _ in exact.most_common(5)]
+    for key, count, error in summary.top(50):
+        assert count - error <= exact[key] <= count
+        assert error <= len(stream) // 50
+
+    summary.decay()
+    key, count, _ = summary.top(1)[0]
+    assert count == top[0][1] // 2 and key == top[0][0]
+    summary.add("new")
+    assert len(summary) <= 50
+
+
+def test_new_worker_prewarms_hot_codes(tmp_path):
+    """Test that saved hot codes are loaded into a fresh worker's cache."""
+    db_path, hot_dir = str(tmp_path / "links.db"), str(tmp_path / "hot")
+    worker = PyTiny(db_path, hot_codes=10, hot_codes_dir=hot_dir, hot_codes_save_interval=60)
+    codes = [code for _, code in worker.create_short_urls_bulk(
+        f"https://example.com/{i}" for i in range(5))]
+    for i, code in enumerate(codes):
+        for _ in range(i + 1):
+            worker.get_long_url(code)
+    worker.delete_url(codes[0])
+
+    top = worker.top_codes(3)
+    assert [link["short_code"] for link in top] == codes[:1:-1]
+    assert top[0] == {"short_code": codes[4], "long_url": "https://example.com/4",
+                      "redirects": 5}
+    worker.close()
+    assert load_top(hot_dir)[codes[4]] == 5
+
+    fresh = PyTiny(db_path, hot_codes=10, hot_codes_dir=hot_dir)
+    assert fresh.prewarm() == 4
+    assert fresh.cache_stats()["size"] == 4
+    assert fresh.prewarm(limit=1) == 1
+    fresh.close()
+
+
+def test_save_halves_counts(tmp_path):
+    """Test that each save decays the counts so old traffic fades out."""
+    hot = HotCodes(10, str(tmp_path), save_interval=60)
+    for _ in range(4):
+        hot.record("abc")
+    assert hot.save() == 1
+    assert hot.top(5) == [("abc", 2)]
+    hot.save()
+    hot.save()
+    assert hot.top(5) == [] and hot.save() == 0
+    hot.close()
@@ -0,0 +1,99 @@
+import socket
+import time
+import pytest
+from pytiny import PyTiny
+from pytiny.cache import LRUCache
+from pytiny.invalidation import (CODES, HEARTBEAT, Invalidator, LoopbackBus,
+                                 UnixBus, open_bus, pack)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_mutations_reach_other_workers(tmp_path):
+    """Test that deletes and updates in one worker drop the link from another's cache."""
+    db_path = str(tmp_path / "links.db")
+    bus = LoopbackBus()
+    writer = PyTiny(db_path, invalidation_bus=bus, invalidation_heartbeat=0.05)
+    reader = PyTiny(db_path, invalidation_bus=bus.peer(), invalidation_heartbeat=0.05)
+    first = writer.create_short_url("https://example.com/1")
+    second = writer.create_short_url("https://example.com/2")
+    assert reader.is_active(first) and reader.is_active(second)
+
+    writer.delete_url(first)
+    writer.set_redirect_policy(second, 301)
+    wait_for(lambda: not reader.is_active(first))
+    wait_for(lambda: reader.get_redirect(second)[0] == 301)
+    assert reader.cache_stats()["size"] == 1
+    writer.close()
+    reader.close()
+
+
+def test_missed_messages_flush_the_cache():
+    """Test that a gap in a sender's sequence numbers clears the whole cache."""
+    cache = LRUCache(100)
+    invalidator = Invalidator(cache, LoopbackBus())
+    for code in ("a", "b", "c"):
+        cache.set(code, code)
+
+    invalidator.apply(pack(CODES, 7, 1, ["a"]))
+    assert cache.get("a") is None and len(cache) == 2
+    invalidator.apply(pack(HEARTBEAT, 7, 1))
+    assert len(cache) == 2
+
+    # Message 2 was lost; the heartbeat after message 3 gives it away
+    invalidator.apply(pack(HEARTBEAT, 7, 3))
+    assert len(cache) == 0
+
+    cache.set("b", "b")
+    invalidator.apply(pack(CODES, 7, 4, ["c"]))
+    assert cache.get("b") == "b"
+    # A sender that published before we heard from it
+    invalidator.apply(pack(CODES, 8, 5, ["c"]))
+    assert cache.get("b") is None
+
+
+def test_lost_loopback_message():
+    """Test that a dropped datagram is caught by the next heartbeat."""
+    bus = LoopbackBus()
+    cache = LRUCache(100)
+    listener = Invalidator(cache, bus.peer(), heartbeat=10)
+    publisher = Invalidator(None, bus, heartbeat=0.05)
+    listener.listen()
+    publisher.listen()
+    wait_for(lambda: publisher.sender in listener._seen)
+    cache.set("kept", 1)
+    with listener.bus._ready:
+        listener.bus._inbox.clear()
+        listener.bus.drop = 1
+    publisher.publish(["other"])
+    wait_for(lambda: len(cache) == 0)
+    listener.close()
+    publisher.close()
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix sockets")
+def test_unix_bus(tmp_path):
+    """Test sending between Unix datagram buses and removing dead sockets."""
+    first = open_bus(f"unix://{tmp_path}")
+    second = UnixBus(str(tmp_path))
+    assert first.receive(0.01) is None and second.receive(0.01) is None
+    stale = tmp_path / "1-dead.sock"
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(str(stale))
+    sock.close()
+
+    first.send(b"hello")
+    assert second.receive(1.0) == b"hello"
+    assert first.receive(1.0) == b"hello"
+    assert not stale.exists()
+    first.close()
+    second.close()
+    assert list(tmp_path.iterdir()) == []
+
+    with pytest.raises(ValueError):
+        open_bus("udp://10.0.0.1:7907")
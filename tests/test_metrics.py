@@ -0,0 +1,47 @@
+import os
+import pytest
+from pytiny.metrics import Registry
+
+
+def test_histogram_rendering():
+    """Test that histograms render cumulative buckets, sum and count."""
+    registry = Registry()
+    latency = registry.histogram("op_seconds", "Op latency", buckets=(0.1, 1.0))
+    hits = registry.counter("hits_total", "Hits", label="kind", label_values=("a", "b"))
+
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(2.0)
+    hits["b"].inc(3)
+
+    text = registry.render()
+    assert 'op_seconds_bucket{le="0.1"} 1' in text
+    assert 'op_seconds_bucket{le="1.0"} 2' in text
+    assert 'op_seconds_bucket{le="+Inf"} 3' in text
+    assert "op_seconds_sum 2.55" in text
+    assert "op_seconds_count 3" in text
+    assert 'hits_total{kind="a"} 0' in text
+    assert 'hits_total{kind="b"} 3' in text
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires fork")
+def test_metrics_aggregate_across_processes(tmp_path):
+    """Test that a shared directory sums the metrics of every process."""
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests")
+    requests.inc()
+    registry.set_directory(str(tmp_path))
+    requests.inc()
+
+    pid = os.fork()
+    if pid == 0:
+        requests.inc(5)
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+    assert len(list(tmp_path.glob("*.metrics"))) == 2
+    assert "requests_total 7" in registry.render()
+
+    # Files written with a different set of metrics are ignored
+    (tmp_path / "1.metrics").write_bytes(b"PYTM\0\0\0\0" + bytes(8))
+    assert "requests_total 7" in registry.render()
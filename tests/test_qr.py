@@ -0,0 +1,24 @@
+from pytiny.qr import QRCache
+
+
+def test_qr_cache_hits_and_etag():
+    """Test that repeated QR requests are served from the cache."""
+    cache = QRCache(processes=0)
+    image, etag = cache.get("https://example.com/abc123")
+    assert image.startswith(b"\x89PNG")
+    assert cache.get("https://example.com/abc123") == (image, etag)
+    assert cache.stats()["hits"] == 1
+
+    svg, svg_etag = cache.get("https://example.com/abc123", fmt="svg")
+    assert b"<svg" in svg
+    assert svg_etag != etag
+
+
+def test_qr_cache_bounded_by_bytes():
+    """Test that the cache evicts old images to stay under its byte budget."""
+    cache = QRCache(max_bytes=1000, processes=0)
+    for i in range(5):
+        cache.get(f"https://example.com/{i}", box_size=2)
+    stats = cache.stats()
+    assert stats["bytes"] <= 1000
+    assert stats["entries"] < 5
@@ -0,0 +1,123 @@
+import multiprocessing
+import pytest
+from pytiny import metrics
+from pytiny.config import Config
+from pytiny.ratelimit import Limit, RateLimiter, parse_limit
+from pytiny.web import create_app
+
+
+def test_parse_limit():
+    """Test reading limits like "30/m"."""
+    assert parse_limit("30/m") == Limit(0.5, 30)
+    assert parse_limit("5/s") == Limit(5, 5)
+    assert parse_limit("") is None
+    with pytest.raises(ValueError):
+        parse_limit("30 per minute")
+
+
+def throttled(limit):
+    line = f'pytiny_throttled_total{{limit="{limit}"}} '
+    return next(float(row[len(line):]) for row in metrics.REGISTRY.render().splitlines()
+                if row.startswith(line))
+
+
+def test_client_and_global_buckets(monkeypatch):
+    """Test that clients have their own buckets and share the global one."""
+    now = [1000.0]
+    monkeypatch.setattr("pytiny.ratelimit.time.time", lambda: now[0])
+    limiter = RateLimiter({"create": (parse_limit("2/s"), parse_limit("3/s"))})
+    refused = throttled("create"), throttled("create_global")
+
+    assert limiter.admit("create", "a") == 0 and limiter.admit("create", "a") == 0
+    assert limiter.admit("create", "a") == pytest.approx(0.5)
+    assert limiter.admit("create", "b") == 0
+    # The global bucket is empty now, and refusing b took nothing from it
+    assert limiter.admit("create", "b") == pytest.approx(1 / 3)
+    assert limiter.admit("redirect", "a") == 0
+
+    now[0] += 0.5
+    assert limiter.admit("create", "a") == 0
+    assert (throttled("create"), throttled("create_global")) == (refused[0] + 1,
+                                                                 refused[1] + 1)
+
+
+def test_buckets_shared_across_processes(tmp_path):
+    """Test that workers forked from one master draw from the same buckets."""
+    path = str(tmp_path / "limits")
+    limiter = RateLimiter({"redirect": (parse_limit("5/m"), None)}, path, slots=64)
+    context = multiprocessing.get_context("fork")
+    worker = context.Process(target=lambda: [limiter.admit("redirect", "10.0.0.1")
+                                             for _ in range(3)])
+    worker.start()
+    worker.join()
+
+    # A worker started on its own opens the same file
+    other = RateLimiter({"redirect": (parse_limit("5/m"), None)}, path, slots=64)
+    assert [other.admit("redirect", "10.0.0.1") == 0 for _ in range(3)] == [True, True, False]
+    other.close()
+    limiter.close()
+
+
+def test_shed_creates_on_slow_writes(monkeypatch):
+    """Test that slow creates shed new ones until the average decays."""
+    now = [1000.0]
+    monkeypatch.setattr("pytiny.ratelimit.time.time", lambda: now[0])
+    limiter = RateLimiter({}, shed_latency=0.05)
+    assert limiter.admit("create", "a") == 0
+    limiter.record_write(1.0)
+    assert limiter.admit("create", "a") > 0
+    assert limiter.admit("redirect", "a") == 0
+    now[0] += 3
+    assert limiter.admit("create", "a") == 0
+
+
+def test_web_rate_limits(tmp_path):
+    """Test that /shorten and redirects answer 429 with Retry-After."""
+    config = Config(DB_PATH=str(tmp_path / "web.db"), BLOOM_ERROR_RATE=0,
+                    ANALYTICS_FLUSH_INTERVAL=0, RATE_LIMIT_CREATE="2/m",
+                    RATE_LIMIT_REDIRECT_GLOBAL="1/m")
+    app = create_app(config)
+    client = app.test_client()
+    response = client.post("/shorten", data={"url": "https://example.com"})
+    code = response.get_json()["short_url"].rsplit("/", 1)[1]
+
+    response = client.post("/shorten/bulk", json={"urls": ["https://example.com/a",
+                                                           "https://example.com/b"]})
+    body = response.get_json()
+    assert len(body["results"]) == 1 and body["errors"][0]["error"] == "Too many requests"
+
+    response = client.post("/shorten", data={"url": "https://example.com"})
+    assert response.status_code == 429 and response.headers["Retry-After"] == "30"
+
+    assert client.get(f"/{code}").status_code == 302
+    response = client.get(f"/{code}")
+    assert response.status_code == 429 and response.headers["Retry-After"] == "60"
+    app.extensions["pytiny"].close()
+
+
+def test_web_records_every_write(tmp_path, monkeypatch):
+    """Test that failed and bulk creates count towards the write latency."""
+    writes = []
+    monkeypatch.setattr(RateLimiter, "record_write",
+                        lambda self, seconds: writes.append(seconds))
+    config = Config(DB_PATH=str(tmp_path / "web.db"), BLOOM_ERROR_RATE=0,
+                    ANALYTICS_FLUSH_INTERVAL=0, SHED_WRITE_LATENCY=10)
+    app = create_app(config)
+    client = app.test_client()
+    shortener = app.extensions["pytiny"]
+
+    response = client.post("/shorten/bulk", json={"urls": ["https://example.com/a",
+                                                           "https://example.com/b"]})
+    assert len(response.get_json()["results"]) == 2 and len(writes) == 1
+    response = client.post("/shorten/bulk", data='"https://example.com/c"\n',
+                           content_type="application/x-ndjson")
+    assert response.status_code == 200 and len(response.data.splitlines()) == 1
+    assert len(writes) == 2
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(shortener, "create_short_url", fail)
+    response = client.post("/shorten", data={"url": "https://example.com"})
+    assert response.status_code == 400 and len(writes) == 3
+    shortener.close()
@@ -0,0 +1,100 @@
+import os
+import time
+import pytest
+from pytiny import MemoryStorage, PyTiny
+from pytiny.compact_storage import compact
+from pytiny.expiry import ExpiryWheel
+from pytiny.reaper import Reaper
+
+
+@pytest.fixture
+def shortener():
+    db_path = "test_pytiny_reaper.db"
+    shortener = PyTiny(db_path)
+    yield shortener
+    shortener.close()
+    for path in (db_path, db_path + ".reaper.lock"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def test_reaper_deletes_in_batches(shortener):
+    """Test that the reaper removes only expired links, batch by batch."""
+    live = shortener.create_short_url("https://example.com/live")
+    codes = [code for _, code in shortener.create_short_urls_bulk(
+        ("https://example.com/%d" % i, 1) for i in range(25))]
+    later = int(time.time()) + 7200
+
+    assert shortener.expired_lag() == 0
+    assert shortener.expired_lag(later) >= 3600
+    assert shortener.delete_expired_batch(10, later) == 10
+
+    for code in codes:
+        shortener.update_expiry(code, 0)
+    report = Reaper(shortener, batch_size=4, pause=0).run_once()
+    assert report["deleted"] == 15
+    assert shortener.is_active(live)
+    assert shortener.expired_lag() == 0
+
+
+@pytest.mark.parametrize("compacted", [False, True])
+def test_reaper_drops_click_history(tmp_path, compacted):
+    """Test that reaped links leave no click rollups behind."""
+    db_path = str(tmp_path / "links.db")
+    if compacted:
+        PyTiny(db_path).close()
+        compact(db_path, PyTiny(storage=MemoryStorage()).chars)
+    shortener = PyTiny(db_path, cache_size=0, analytics_flush_interval=60)
+    expiring = shortener.create_short_url("https://example.com/old")
+    live = shortener.create_short_url("https://example.com/live")
+    for code in (expiring, live):
+        shortener.get_long_url(code)
+    shortener.flush_clicks()
+
+    shortener.update_expiry(expiring, 0)
+    assert Reaper(shortener, pause=0).run_once()["deleted"] == 1
+    assert shortener.storage.get_rollups(expiring, 60, 0, 2 ** 40) == []
+    assert len(shortener.storage.get_rollups(live, 60, 0, 2 ** 40)) == 1
+    shortener.close()
+
+
+def test_expiry_wheel():
+    """Test scheduling, rescheduling and firing links on the expiry wheel."""
+    wheel = ExpiryWheel(horizon=60, now=1000)
+    wheel.loaded_until = 1060
+    assert wheel.schedule("a", 1010)
+    assert wheel.schedule("b", 1010)
+    assert wheel.schedule("c", 1030)
+    assert not wheel.schedule("far", 5000)
+    assert wheel.schedule("b", 1020)
+    wheel.cancel("c")
+    assert len(wheel) == 2 and wheel.next_deadline() == 1010
+
+    assert wheel.advance(1009) == []
+    assert wheel.advance(1015) == ["a"]
+    assert wheel.next_deadline() == 1020
+    # Links already past their expiry fire on the next advance
+    assert wheel.schedule("late", 900)
+    assert sorted(wheel.advance(1100)) == ["b", "late"]
+    assert wheel.next_deadline() is None and len(wheel) == 0
+
+
+def test_reaper_deletes_at_expiry(shortener):
+    """Test that a background reaper deletes links as they expire."""
+    stored = shortener.create_short_url("https://example.com/stored", 1)
+    shortener.create_short_url("https://example.com/later", 24)
+    reaper = Reaper(shortener, batch_size=1, pause=0, horizon=7200)
+    reaper.sleep(0)
+    # Loaded page by page from the expires_at index
+    assert len(reaper.wheel) == 1
+
+    created = shortener.create_short_url("https://example.com/created", 1)
+    assert shortener.get_long_url(created) == "https://example.com/created"
+    assert len(reaper.wheel) == 2
+
+    now = int(time.time())
+    assert reaper.run_due(now) == 0
+    assert reaper.run_due(now + 3601) == 2
+    assert shortener.get_stats(stored) is None and shortener.get_stats(created) is None
+    assert shortener.cache_stats()["size"] == 0
+    assert reaper.wheel.next_deadline() is None
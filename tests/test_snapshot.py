@@ -0,0 +1,109 @@
+import time
+import pytest
+from pytiny import MemoryStorage, PyTiny
+from pytiny.snapshot import Snapshot, build_snapshot
+
+
+@pytest.fixture
+def shortener(tmp_path):
+    shortener = PyTiny(str(tmp_path / "snapshot.db"), cache_size=0)
+    yield shortener
+    shortener.close()
+
+
+def test_build_and_lookup(shortener, tmp_path):
+    """Test that a snapshot resolves every live code and skips expired ones."""
+    codes = {code: url for url, code in shortener.create_short_urls_bulk(
+        f"https://example.com/{i}" for i in range(500))}
+    timed = shortener.create_short_url("https://example.com/timed", expire_hours=1)
+    expired = shortener.create_short_url("https://example.com/expired", expire_hours=1)
+    shortener.storage.update_expiry(expired, int(time.time()) - 1)
+
+    path = str(tmp_path / "links.snap")
+    report = build_snapshot(shortener.storage, path, batch_size=64)
+    assert report["entries"] == 501
+
+    snapshot = Snapshot(path)
+    assert all(snapshot.get(code)[:2] == (url, None) for code, url in codes.items())
+    long_url, expires_at = snapshot.get(timed)[:2]
+    assert long_url == "https://example.com/timed"
+    assert expires_at > time.time()
+    assert snapshot.get(expired) is None
+    assert snapshot.get("zzzzzzzz") is None
+    snapshot.close()
+
+
+def test_lookups_fall_back_for_changed_and_new_codes(tmp_path):
+    """Test that deleted, re-expired and newer codes are answered from the DB."""
+    db_path = str(tmp_path / "snapshot.db")
+    path = str(tmp_path / "links.snap")
+    writer = PyTiny(db_path, cache_size=0)
+    kept = writer.create_short_url("https://example.com/kept")
+    deleted = writer.create_short_url("https://example.com/deleted")
+    extended = writer.create_short_url("https://example.com/extended", expire_hours=1)
+    build_snapshot(writer.storage, path)
+
+    reader = PyTiny(db_path, cache_size=0, snapshot_path=path)
+    queries = []
+    get = reader.storage.get
+    reader.storage.get = lambda short_code: queries.append(short_code) or get(short_code)
+
+    assert reader.get_long_url(kept) == "https://example.com/kept"
+    assert queries == []
+
+    writer.delete_url(deleted)
+    writer.update_expiry(extended, None)
+    fresh = writer.create_short_url("https://example.com/fresh")
+    assert reader.get_long_url(deleted) is None
+    assert reader.get_stats(extended)["expires_at"] is None
+    assert reader.is_active(extended)
+    assert reader.get_long_url(fresh) == "https://example.com/fresh"
+    assert queries == [deleted, extended, fresh]
+
+    writer.close()
+    reader.close()
+
+
+def test_rebuild_swaps_file_and_prunes_change_log(tmp_path):
+    """Test that workers pick up a rebuilt snapshot and old changes are pruned."""
+    db_path = str(tmp_path / "snapshot.db")
+    path = str(tmp_path / "links.snap")
+    shortener = PyTiny(db_path, cache_size=0, snapshot_path=path)
+    first = shortener.create_short_url("https://example.com/first")
+    # Served from the DB until a snapshot exists
+    assert shortener.get_long_url(first) == "https://example.com/first"
+
+    build_snapshot(shortener.storage, path)
+    shortener.delete_url(first)
+    second = shortener.create_short_url("https://example.com/second")
+    assert build_snapshot(shortener.storage, path)["pruned"] == 0
+
+    assert shortener.get_long_url(second) == "https://example.com/second"
+    assert shortener.get_long_url(first) is None
+    assert shortener._snapshot.stats()["entries"] == 1
+
+    # The deletion is part of both snapshots now
+    assert build_snapshot(shortener.storage, path)["pruned"] == 1
+    assert shortener.storage.changes_since(0) == ([], 0)
+    shortener.close()
+
+
+def test_change_log_kept_only_for_snapshots(shortener, tmp_path):
+    """Test that deletes and updates are not logged until a snapshot needs them."""
+    codes = [code for _, code in shortener.create_short_urls_bulk(
+        f"https://example.com/{i}" for i in range(20))]
+    for code in codes[:10]:
+        shortener.update_expiry(code, 0)
+    shortener.delete_url(codes[10])
+    assert shortener.cleanup_expired() == 10
+    assert shortener.storage.changes_since(0) == ([], 0)
+
+    memory = PyTiny(storage=MemoryStorage())
+    code = memory.create_short_url("https://example.com")
+    memory.delete_url(code)
+    assert memory.storage.changes_since(0) == ([], 0)
+    memory.close()
+
+    build_snapshot(shortener.storage, str(tmp_path / "links.snap"))
+    shortener.delete_url(codes[11])
+    assert shortener.storage.changes_since(0)[0] == [codes[11]]
@@ -0,0 +1,259 @@
+import sqlite3
+import pytest
+from pytiny import PyTiny, MemoryStorage, SQLiteStorage, ShardedStorage
+from pytiny.compact_storage import (CodeKeys, CompactStorage, compact, pack_path,
+                                    split_url, unpack_path)
+from pytiny.storage import SCHEMA_VERSION, WAL_INDEX_RETRY, reshard
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    storage = ShardedStorage([str(tmp_path / f"shard{i}.db") for i in range(3)])
+    shortener = PyTiny(storage=storage)
+    yield shortener
+    shortener.close()
+
+
+def test_sharded_routing(sharded):
+    """Test that links are spread across shards and found again."""
+    codes = [code for _, code in sharded.create_short_urls_bulk(
+        f"https://example.com/{i}" for i in range(60))]
+    single = sharded.create_short_url("https://example.com/single")
+
+    for i, code in enumerate(codes):
+        shard = sharded.storage.shard_for(code)
+        assert shard.get(code)[0] == f"https://example.com/{i}"
+    assert sharded.get_long_url(single) == "https://example.com/single"
+
+    summary = sharded.get_summary()
+    assert summary["urls"] == 61
+    assert summary["clicks"] == 1
+    assert all(shard["urls"] > 0 for shard in summary["shards"])
+
+    listed, cursor = [], None
+    while True:
+        urls, cursor = sharded.list_urls(cursor, limit=10)
+        listed += urls
+        if cursor is None:
+            break
+    assert len(listed) == 61
+    # "OQ" is the cursor 9 of an unsharded backend, "WzMsbnVsbF0" [3, null]
+    for cursor in ("OQ", "WzMsbnVsbF0", "WzAsImEiXQ"):
+        with pytest.raises(ValueError):
+            sharded.list_urls(cursor)
+
+
+def test_reshard(sharded, tmp_path):
+    """Test copying links from a sharded layout into a single file."""
+    codes = [sharded.create_short_url(f"https://example.com/{i}") for i in range(20)]
+    sharded.get_long_url(codes[0])
+    sharded.flush_clicks()
+
+    target = SQLiteStorage(str(tmp_path / "merged.db"))
+    assert reshard(sharded.storage, target, batch_size=7) == 20
+    assert target.get(codes[5])[0] == "https://example.com/5"
+    assert target.get_stats(codes[0])[2] == 1
+    target.close()
+
+
+def test_schema_upgrade_adds_url_hash(tmp_path):
+    """Test that databases from before dedup get the url_hash column and index."""
+    db_path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        CREATE TABLE urls (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            short_code TEXT UNIQUE NOT NULL,
+            long_url TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            expires_at INTEGER,
+            clicks INTEGER DEFAULT 0,
+            last_clicked INTEGER
+        )
+    """)
+    conn.execute("INSERT INTO urls (short_code, long_url, created_at) "
+                 "VALUES ('abcdef', 'https://example.com', 0)")
+    conn.commit()
+    conn.close()
+
+    shortener = PyTiny(db_path, dedup=True)
+    assert shortener.get_long_url("abcdef") == "https://example.com"
+    code = shortener.create_short_url("https://example.com")
+    assert shortener.create_short_url("https://example.com") == code
+    shortener.close()
+
+
+def test_migrations_run_once(tmp_path):
+    """Test that migrations are recorded in user_version and skipped afterwards."""
+    db_path = str(tmp_path / "fresh.db")
+    storage = SQLiteStorage(db_path, migrate=False)
+    assert storage.schema_version() == 0
+    assert storage.migrate() == SCHEMA_VERSION
+    assert storage.migrate() == 0
+    storage.close()
+
+    statements = []
+    storage = SQLiteStorage(db_path, migrate=False)
+    storage._pool.get().set_trace_callback(statements.append)
+    storage.migrate()
+    assert statements == ["PRAGMA user_version"]
+    storage.close()
+
+
+
+def test_migrations_keep_compact_layout(tmp_path):
+    """Test that migrations neither add urls to compact databases nor idx_short_code."""
+    db_path = str(tmp_path / "links.db")
+    shortener = PyTiny(db_path)
+    code = shortener.create_short_url("https://example.com/page")
+    shortener.close()
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'idx_short_code'"
+                        ).fetchone() is None
+    conn.close()
+
+    compact(db_path, shortener.chars)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA user_version = 0")
+    conn.close()
+    storage = CompactStorage(db_path)
+    assert storage.schema_version() == SCHEMA_VERSION
+    assert storage.get(code)[0] == "https://example.com/page"
+    assert storage._pool.get().execute(
+        "SELECT name FROM sqlite_master WHERE name = 'urls'").fetchone() is None
+    storage.close()
+
+def test_code_keys():
+    """Test that codes map to distinct integers and back."""
+    shortener_chars = PyTiny(storage=MemoryStorage()).chars
+    keys = CodeKeys(shortener_chars)
+    codes = ["abcd", "abcde", "zzzzzz", "2345", "ZZZZZZZZZZ"]
+    assert len({keys.key(code) for code in codes}) == len(codes)
+    assert all(isinstance(keys.key(code), int) for code in codes)
+    assert [keys.code(keys.key(code)) for code in codes] == codes
+    # Outside the alphabet, or beyond 64 bits: the code's bytes
+    assert keys.key("0l1O") == b"0l1O"
+    assert keys.key("abcdefghijkm") == b"abcdefghijkm"
+    assert keys.code(b"0l1O") == "0l1O"
+
+
+def test_url_packing():
+    """Test splitting off hosts and deflating the rest of long URLs."""
+    assert split_url("https://example.com:8080/a?b") == ("https://example.com:8080", "/a?b")
+    assert split_url("https://example.com?q=1") == ("https://example.com", "?q=1")
+    assert split_url("not a url") == ("", "not a url")
+    path = "/blog/2024/05/guide?utm_source=twitter&utm_medium=social&utm_campaign=x"
+    packed = pack_path(path)
+    assert isinstance(packed, bytes) and len(packed) < len(path)
+    assert unpack_path(packed) == path
+    assert pack_path("/a") == "/a"
+
+
+def test_compact_online(tmp_path):
+    """Test converting a database while links are created, changed and deleted."""
+    db_path = str(tmp_path / "links.db")
+    shortener = PyTiny(db_path, dedup=True)
+    codes = [code for _, code in shortener.create_short_urls_bulk(
+        f"https://example.com/{i}" for i in range(50))]
+    shortener.set_redirect_policy(codes[1], 301, 600)
+    shortener.get_long_url(codes[2])
+    shortener.flush_clicks()
+    shortener.storage.copy_rows([("0lOI", "https://legacy.example/x", 0, None, 0,
+                                  None, None, None, None)])
+
+    writes = []
+
+    def write_during_copy(copied):
+        if not writes:
+            writes.append(shortener.create_short_url("https://example.org/late"))
+            shortener.delete_url(codes[3])
+            shortener.storage.update_expiry(codes[4], 1)
+            shortener.get_long_url(codes[40])
+            shortener.flush_clicks()
+
+    assert compact(db_path, shortener.chars, batch_size=20,
+                   progress=write_during_copy) == 52
+    shortener.close()
+    assert compact(db_path, shortener.chars) == 0
+
+    shortener = PyTiny(db_path, dedup=True)
+    storage = shortener.storage
+    assert isinstance(storage, CompactStorage)
+    assert shortener.get_long_url(writes[0]) == "https://example.org/late"
+    assert shortener.get_long_url(codes[3]) is None
+    assert storage.get(codes[4])[1] == 1
+    assert storage.get(codes[1])[3:] == (301, 600)
+    assert storage.get_stats(codes[40])[2] == 1
+    assert storage.get("0lOI")[0] == "https://legacy.example/x"
+
+    # Writes after the switch keep numbering links after the old row IDs
+    assert shortener.create_short_url("https://example.com/0") == codes[0]
+    code = shortener.create_short_url("https://example.net/new")
+    assert storage.codes_since(51)[0] == [writes[0], code]
+    assert shortener.delete_url(codes[5])
+
+    listed = [url["short_code"] for url in shortener.iter_urls(batch_size=7)]
+    assert listed[0] == codes[0] and listed[-2:] == [writes[0], code]
+    assert len(listed) == 51
+    sorted_codes = [row[0] for row in storage.iter_sorted(batch_size=7)]
+    assert sorted_codes == sorted(listed)
+    assert storage.summary(2)["expired"] == 1
+    assert [c for c, _ in storage.iter_expiring(0, 10)] == [codes[4]]
+    assert shortener.cleanup_expired() == 1
+    shortener.close()
+
+
+def test_running_worker_follows_compaction(tmp_path):
+    """Test that storage opened before a conversion switches layouts on its own."""
+    db_path = str(tmp_path / "links.db")
+    shortener = PyTiny(db_path, cache_size=0)
+    codes = [code for _, code in shortener.create_short_urls_bulk(
+        f"https://example.com/{i}" for i in range(10))]
+    pages = shortener.storage.iter_rows(batch_size=4)
+    assert compact(db_path, shortener.chars) == 10
+
+    assert shortener.get_long_url(codes[0]) == "https://example.com/0"
+    assert isinstance(shortener.storage, CompactStorage)
+    assert len(list(pages)) == 10
+    code = shortener.create_short_url("https://example.org/after")
+    assert shortener.delete_url(codes[1])
+    assert shortener.get_long_url(code) == "https://example.org/after"
+    shortener.close()
+
+
+def test_change_token_retries_wal_index(tmp_path, monkeypatch):
+    """Test that a WAL index that failed to map is mapped again later."""
+    storage = SQLiteStorage(str(tmp_path / "links.db"))
+    now = [1000.0]
+    monkeypatch.setattr("pytiny.storage.time.monotonic", lambda: now[0])
+    map_wal_index = storage._map_wal_index
+    storage._map_wal_index = lambda: False
+    assert storage.change_token() is None
+
+    storage._map_wal_index = map_wal_index
+    assert storage.change_token() is None
+    now[0] += WAL_INDEX_RETRY
+    assert storage.change_token() is not None
+    storage.close()
+
+
+def test_upgrade_keeps_change_log_of_snapshot_users(tmp_path):
+    """Test that databases whose change log was pruned keep logging changes."""
+    db_path = str(tmp_path / "links.db")
+    shortener = PyTiny(db_path)
+    first, second = [code for _, code in shortener.create_short_urls_bulk(
+        ["https://example.com/1", "https://example.com/2"])]
+    shortener.storage.track_changes()
+    shortener.delete_url(first)
+    shortener.storage.prune_changes(shortener.storage.last_change())
+    shortener.close()
+    conn = sqlite3.connect(db_path)
+    conn.execute("DROP TABLE change_tracking")
+    conn.execute("PRAGMA user_version = 2")
+    conn.commit()
+    conn.close()
+
+    shortener = PyTiny(db_path)
+    shortener.delete_url(second)
+    assert shortener.storage.changes_since(0)[0] == [second]
+    shortener.close()
@@ -0,0 +1,77 @@
+import json
+import threading
+import time
+import pytest
+from pytiny import PyTiny
+from pytiny import tracing
+from pytiny.profiler import profile
+
+
+def test_spans_only_inside_a_trace():
+    """Test that spans are recorded while a request is traced, and not otherwise."""
+    shortener = PyTiny(":memory:", cache_size=0, click_flush_interval=None)
+    code = shortener.create_short_url("https://example.com")
+
+    trace = tracing.start()
+    shortener.get_long_url(code)
+    tracing.finish(trace)
+    assert [name for name, _, _ in trace.spans] == ["db.lookup", "db.clicks"]
+    assert all(0 <= at <= trace.duration and spent >= 0 for _, at, spent in trace.spans)
+
+    shortener.get_long_url(code)
+    assert len(trace.spans) == 2
+    assert tracing.span("db.lookup") is tracing.span("db.stats")
+    shortener.close()
+
+
+def test_slow_log_keeps_slow_requests(tmp_path):
+    """Test that only requests over the threshold are logged, and the file rotates."""
+    path = str(tmp_path / "slow.log")
+    slow_log = tracing.SlowLog(0.01, size=2, path=path, max_bytes=400)
+    fast = tracing.finish(tracing.start())
+    assert not slow_log.record(fast, "GET", "/fast", 302)
+
+    for i in range(3):
+        trace = tracing.start()
+        with tracing.span("db.lookup"):
+            time.sleep(0.012)
+        assert slow_log.record(tracing.finish(trace), "GET", f"/slow{i}", 302)
+
+    recent = slow_log.recent()
+    assert [entry["path"] for entry in recent] == ["/slow2", "/slow1"]
+    assert recent[0]["spans"][0]["name"] == "db.lookup" and recent[0]["ms"] >= 12
+    with open(path + ".1") as fh:
+        assert json.loads(fh.readline())["path"] == "/slow0"
+
+
+def test_profile_collapses_stacks():
+    """Test that the profiler attributes samples to the busy thread's frames."""
+    stop = threading.Event()
+
+    def spin_here():
+        while not stop.is_set():
+            sum(range(1000))
+
+    worker = threading.Thread(target=spin_here, name="busy")
+    worker.start()
+    try:
+        stacks = profile(0.2, 0.005)
+    finally:
+        stop.set()
+        worker.join()
+
+    lines = stacks.splitlines()
+    busy = [line for line in lines if line.startswith("busy;")]
+    assert busy and "test_tracing.py:test_profile_collapses_stacks.<locals>.spin_here" in busy[0]
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in busy) >= 10
+
+
+def test_profile_rejects_non_finite():
+    """Test that profile() refuses NaN and infinite durations and clamps the interval."""
+    for seconds, interval in ((float("nan"), 0.005), (1.0, float("nan")),
+                              (float("inf"), 0.005)):
+        with pytest.raises(ValueError):
+            profile(seconds, interval)
+    started = time.perf_counter()
+    assert profile(0.01, 0) is not None
+    assert time.perf_counter() - started < 1
@@ -0,0 +1,138 @@
+import pytest
+from pytiny import profiler
+from pytiny.config import Config
+from pytiny.web import create_app
+
+
+@pytest.fixture
+def client(tmp_path):
+    config = Config(DB_PATH=str(tmp_path / "web.db"), ADMIN_TOKEN="s3cret",
+                    BLOOM_ERROR_RATE=0, ANALYTICS_FLUSH_INTERVAL=0, HOT_CODES=100,
+                    SLOW_REQUEST_SECONDS=1e-9, PROFILER=True, QR_PROCESSES=0)
+    app = create_app(config)
+    yield app.test_client()
+    app.extensions["pytiny"].close()
+
+
+def test_list_urls_endpoint(client):
+    """Test paging through /api/urls with the admin token."""
+    for i in range(3):
+        client.post("/shorten", data={"url": "https://example.com/%d" % i})
+    auth = {"Authorization": "Bearer s3cret"}
+
+    assert client.get("/api/urls").status_code == 403
+    assert client.get("/api/urls", headers={"Authorization": "Bearer nope"}).status_code == 403
+    assert client.get("/api/urls?filter=bogus", headers=auth).status_code == 400
+    for cursor in ("WyJhIiwiYiJd", "Wzk5LG51bGxd"):
+        assert client.get(f"/api/urls?cursor={cursor}", headers=auth).status_code == 400
+    response = client.get("/api/urls?limit=abc", headers=auth)
+    assert response.status_code == 400 and response.get_json() == {"error": "Invalid limit"}
+
+    page = client.get("/api/urls?limit=2", headers=auth).get_json()
+    assert [url["long_url"] for url in page["urls"]] == ["https://example.com/0",
+                                                         "https://example.com/1"]
+    page = client.get(f"/api/urls?limit=2&cursor={page['next_cursor']}", headers=auth).get_json()
+    assert len(page["urls"]) == 1 and page["next_cursor"] is None
+
+
+def test_top_endpoint(client):
+    """Test listing the most redirected links with the admin token."""
+    codes = [client.post("/shorten", data={"url": "https://example.com/%d" % i}).get_json()
+             ["short_url"].rsplit("/", 1)[1] for i in range(2)]
+    for code in (codes[1], codes[1], codes[0]):
+        client.get(f"/{code}")
+
+    assert client.get("/api/top").status_code == 403
+    auth = {"Authorization": "Bearer s3cret"}
+    top = client.get("/api/top?limit=1", headers=auth).get_json()["top"]
+    assert top == [{"short_code": codes[1], "long_url": "https://example.com/1",
+                    "redirects": 2}]
+
+
+def test_slow_requests_and_profile(client):
+    """Test the slow request log and the profiler endpoint."""
+    code = client.post("/shorten", data={"url": "https://example.com"}).get_json()[
+        "short_url"].rsplit("/", 1)[1]
+    client.get(f"/{code}")
+    auth = {"Authorization": "Bearer s3cret"}
+
+    assert client.get("/api/slow").status_code == 403
+    slow = client.get("/api/slow", headers=auth).get_json()["requests"]
+    assert [(entry["path"], entry["status"]) for entry in slow] == [
+        ("/api/slow", 403), (f"/{code}", 302), ("/shorten", 200)]
+    assert "serialize" in [span["name"] for span in slow[2]["spans"]]
+
+    response = client.get("/api/profile?seconds=0.05", headers=auth)
+    assert response.status_code == 200 and response.mimetype == "text/plain"
+    for query in ("seconds=nan", "seconds=inf", "interval=nan", "interval=-inf"):
+        assert client.get(f"/api/profile?{query}", headers=auth).status_code == 400
+    with profiler._running:
+        assert client.get("/api/profile?seconds=0.05", headers=auth).status_code == 409
+
+
+def test_click_stats_range_is_bounded(client):
+    """Test that /stats refuses series with too many buckets."""
+    code = client.post("/shorten", data={"url": "https://example.com"}).get_json()[
+        "short_url"].rsplit("/", 1)[1]
+    assert client.get(f"/{code}/stats?range=1000d&resolution=minute").status_code == 400
+    assert client.get(f"/{code}/stats?range=7d").status_code == 200
+
+
+def test_shorten_with_qr_code(client):
+    """Test that /shorten returns the QR image inline and as a URL."""
+    data = client.post("/shorten", data={"url": "https://example.com",
+                                         "generate_qr": "on"}).get_json()
+    assert data["qr_url"] == data["short_url"] + "/qr.png"
+    assert data["qr_code"].startswith("data:image/png;base64,")
+
+    data = client.post("/shorten", data={"url": "https://example.com", "generate_qr": "on",
+                                         "qr_inline": "false"}).get_json()
+    assert "qr_code" not in data and data["qr_url"].endswith("/qr.png")
+
+
+def test_qr_image(client):
+    """Test the cached QR image route, its caching headers and revalidation."""
+    code = client.post("/shorten", data={"url": "https://example.com"}).get_json()[
+        "short_url"].rsplit("/", 1)[1]
+
+    response = client.get(f"/{code}/qr.png")
+    assert response.status_code == 200 and response.mimetype == "image/png"
+    assert response.data.startswith(b"\x89PNG")
+    assert response.headers["Cache-Control"] == "public, max-age=86400"
+    etag = response.headers["ETag"]
+    response = client.get(f"/{code}/qr.png", headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.data == b""
+
+    response = client.get(f"/{code}/qr.svg")
+    assert response.status_code == 200 and response.mimetype == "image/svg+xml"
+    assert b"<svg" in response.data and response.headers["ETag"] != etag
+
+    assert client.get("/zzzzzzzz/qr.png").status_code == 404
+    assert client.get(f"/{code}/qr.gif").status_code == 404
+
+
+def test_redirect_caching_headers(client):
+    """Test per-link redirect status, expiry-capped max-age and revalidation."""
+    code = client.post("/shorten", data={
+        "url": "https://example.com", "expire_hours": "1", "redirect_status": "301",
+        "cache_ttl": "86400"}).get_json()["short_url"].rsplit("/", 1)[1]
+
+    response = client.get(f"/{code}")
+    assert response.status_code == 301
+    assert response.headers["Location"] == "https://example.com"
+    assert 3590 <= response.cache_control.max_age <= 3600
+    assert response.cache_control.public
+    etag = response.headers["ETag"]
+    last_modified = response.headers["Last-Modified"]
+
+    response = client.get(f"/{code}", headers={"If-None-Match": etag})
+    assert response.status_code == 304 and "Location" not in response.headers
+    response = client.get(f"/{code}", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+
+    # Opting out of caching
+    client.application.extensions["pytiny"].set_redirect_policy(code, 307, 0)
+    response = client.get(f"/{code}", headers={"If-None-Match": etag})
+    assert response.status_code == 307
+    assert response.headers["Cache-Control"] == "no-store"
+    assert response.headers["ETag"] != etag